@@ -1,13 +1,38 @@
 import os
-import json
+
+# Serving mode: 'threading' (one OS thread per connection) or 'gevent'
+# (cooperative greenlets, for thousands of concurrent viewers). gevent has to
+# patch the standard library before anything else imports it.
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+import sys
+import time
+import heapq
+import bisect
+import itertools
 import logging
 import threading
 from datetime import datetime
-from flask import Flask, request, jsonify, Response, stream_with_context
+from flask import Flask, request, jsonify, Response, stream_with_context, send_file
 from flask_cors import CORS
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 import queue
 
+# Modules shared with the instrument backend (streaming, processing, export) live in ../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared')
+sys.path.insert(0, SHARED_DIR)
+
+from spectrum_processing import Deisotoper, PeakFilter, average_spectra
+from scan_streaming import ScanFanout, add_summary, next_event_id, parse_stream_options, parse_event_id, sse_message
+from cluster import create_bus
+from scan_tracking import PipelineGaps, scan_time
+from timeseries import TimeSeriesStore, parse_time
+from mzml_export import MzMLExporter
+from scan_index import ScanColumns, PrecursorIndex, parse_query, row_dict, scan_key
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,53 +48,349 @@ app = Flask(__name__)
 CORS(app)
 
 # Initialize Socket.IO
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='threading')
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE)
+
+# Idle SSE connections wake up once per interval to send a keep-alive comment
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
+
+# Scan fan-out to Socket.IO rooms and per-client Server-Sent Events (SSE) queues;
+# the last SCAN_REPLAY_BUFFER scans (at most ~SCAN_REPLAY_BYTES) are kept for clients resuming with Last-Event-ID
+scan_fanout = ScanFanout(socketio, replay_size=int(os.environ.get('SCAN_REPLAY_BUFFER', 500)),
+                         replay_bytes=int(os.environ.get('SCAN_REPLAY_BYTES', 64 * 1024 * 1024)))
 
-# Queue for Server-Sent Events (SSE)
-scan_data_queue = queue.Queue(maxsize=100)
+# One acquisition session's scans, keyed by (stream_id, scan_number) since the
+# detector streams of an instrument share a session. A numeric time
+# column, kept sorted at insert, serves time-window queries with bisect
+# instead of parsing every ISO timestamp.
+class SessionPartition:
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.metadata = {}
+        self.created_at = datetime.now().isoformat()
+        self.scans = {}    # (stream_id, scan_number) -> scan
+        self.latest_scan_number = None
+        self.latest_key = None
+        self.scans_received = 0
+        self.ms_orders = {}
+        # Monotonic time of the last scan stored, for retention
+        self.last_write = time.monotonic()
+        # Parallel, time-sorted columns; entries before `time_head` are evicted
+        self.times = []
+        self.time_keys = []
+        self.time_head = 0
+        # Metadata columns for filter queries (see scan_index.py)
+        self.columns = ScanColumns()
+        # MS2 scan keys sorted by precursor m/z
+        self.precursors = PrecursorIndex()
+    
+    def add(self, scan_data):
+        """Store a scan; returns True if it was not stored before."""
+        key = scan_key(scan_data)
+        scan_number = key[1]
+        replaced = key in self.scans
+        if replaced:
+            self._unindex(key)
+        self.scans[key] = scan_data
+        self.last_write = time.monotonic()
+        t = self._index(key, scan_time(scan_data))
+        self.columns.add(scan_data, t)
+        self.precursors.add(scan_data)
+        self.scans_received += 1
+        ms_order = scan_data.get('ms_order', 1)
+        self.ms_orders[ms_order] = self.ms_orders.get(ms_order, 0) + 1
+        if self.latest_scan_number is None or scan_number >= self.latest_scan_number:
+            self.latest_scan_number = scan_number
+            self.latest_key = key
+        return not replaced
+    
+    def get(self, scan_number, stream_id=None):
+        """A stored scan; without ``stream_id``, of the stream written last."""
+        if stream_id is None:
+            if self.latest_key is None:
+                return None
+            stream_id = self.latest_key[0]
+        return self.scans.get((stream_id, scan_number))
+    
+    def evict_oldest(self):
+        key = self.time_keys[self.time_head]
+        self.scans.pop(key, None)
+        self.columns.remove(key)
+        self.precursors.remove(key)
+        self.time_head += 1
+        self._compact()
+    
+    def _index(self, key, t):
+        if t is None:
+            t = self.times[-1] if len(self.times) > self.time_head else time.time()
+        if len(self.times) == self.time_head or t >= self.times[-1]:
+            # Arrival order is time order in the common case: O(1) append
+            self.times.append(t)
+            self.time_keys.append(key)
+        else:
+            i = bisect.bisect_right(self.times, t, self.time_head)
+            self.times.insert(i, t)
+            self.time_keys.insert(i, key)
+        return t
+    
+    def _unindex(self, key):
+        i = self.time_keys.index(key, self.time_head)
+        del self.times[i]
+        del self.time_keys[i]
+    
+    def _compact(self):
+        # Drop evicted entries in one slice once they make up half the columns
+        if self.time_head and self.time_head * 2 >= len(self.times):
+            del self.times[:self.time_head]
+            del self.time_keys[:self.time_head]
+            self.time_head = 0
+    
+    def first_time(self):
+        return self.times[self.time_head] if len(self.times) > self.time_head else None
+    
+    def last_time(self):
+        return self.times[-1] if len(self.times) > self.time_head else None
+    
+    def window(self, start_time=None, end_time=None, limit=None):
+        """(time, scan) pairs with start_time <= time <= end_time, oldest first: O(log n + k)."""
+        lo = self.time_head if start_time is None else bisect.bisect_left(self.times, start_time, self.time_head)
+        hi = len(self.times) if end_time is None else bisect.bisect_right(self.times, end_time, lo)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [(self.times[i], self.scans[self.time_keys[i]]) for i in range(lo, hi)]
+    
+    def describe(self):
+        first, last = self.first_time(), self.last_time()
+        described = dict(self.metadata)
+        described.update({
+            "session_id": self.session_id,
+            "created_at": self.created_at,
+            "scans_stored": len(self.scans),
+            "scans_received": self.scans_received,
+            "latest_scan_number": self.latest_scan_number,
+            "stream_ids": list(self.columns.stream_ids),
+            "ms_orders": {str(order): count for order, count in sorted(self.ms_orders.items())},
+            "precursor_scans": len(self.precursors),
+            "first_scan_time": datetime.fromtimestamp(first).isoformat() if first is not None else None,
+            "last_scan_time": datetime.fromtimestamp(last).isoformat() if last is not None else None
+        })
+        return described
 
-# In-memory storage for scan data
+# In-memory storage for scan data, partitioned by acquisition session so that
+# scan numbers restarting with a new acquisition or backend never collide,
+# queries for one session never touch another session's scans, and retention
+# drops whole idle sessions at once
 class DataStorage:
     def __init__(self):
         self.lock = threading.Lock()
-        self.scan_data = {}
+        self.sessions = {}    # session_id -> SessionPartition, oldest first
+        self.scan_count = 0
+        self.latest_session_id = None
         self.latest_scan_number = 0
-        self.max_scans_to_keep = 1000  # Adjust based on memory constraints
+        self.max_scans_to_keep = int(os.environ.get('MAX_SCANS', 1000))  # Adjust based on memory constraints
+        self.max_sessions = int(os.environ.get('MAX_SESSIONS', 50))
+        # Sessions written within this many seconds are live and never dropped whole
+        self.session_idle_seconds = float(os.environ.get('SESSION_IDLE_SECONDS', 60))
+        self.sessions_evicted = 0
+    
+    def _partition(self, session_id):
+        partition = self.sessions.get(session_id)
+        if partition is None:
+            partition = self.sessions[session_id] = SessionPartition(session_id)
+        return partition
     
     def add_scan(self, scan_data):
         with self.lock:
+            session_id = scan_data.get('session_id')
+            partition = self._partition(session_id)
+            if partition.add(scan_data):
+                self.scan_count += 1
             scan_number = scan_data.get('scan_number', 0)
-            self.scan_data[scan_number] = scan_data
-            self.latest_scan_number = max(self.latest_scan_number, scan_number)
-            
-            # Clean up old scans if we exceed the limit
-            if len(self.scan_data) > self.max_scans_to_keep:
-                # Remove oldest scans
-                scan_numbers = sorted(self.scan_data.keys())
-                for old_scan in scan_numbers[:len(scan_numbers) - self.max_scans_to_keep]:
-                    del self.scan_data[old_scan]
+            if session_id != self.latest_session_id or scan_number >= self.latest_scan_number:
+                self.latest_scan_number = scan_number
+                self.latest_session_id = session_id
+            self._enforce_retention()
+    
+    def _enforce_retention(self):
+        # Whole idle sessions go first, least recently written first. Several
+        # instruments or detectors can write sessions at once, so live sessions
+        # are never dropped whole; they only lose their oldest scans.
+        idle_before = time.monotonic() - self.session_idle_seconds
+        while len(self.sessions) > 1 and (self.scan_count > self.max_scans_to_keep or
+                                          len(self.sessions) > self.max_sessions):
+            idle = [partition for partition in self.sessions.values()
+                    if partition.last_write < idle_before and partition.session_id != self.latest_session_id]
+            if not idle:
+                break
+            victim = min(idle, key=lambda partition: partition.last_write)
+            self.scan_count -= len(self.sessions.pop(victim.session_id).scans)
+            self.sessions_evicted += 1
+        while self.scan_count > self.max_scans_to_keep:
+            # Oldest scan across all remaining sessions
+            victim = min((partition for partition in self.sessions.values() if partition.scans),
+                         key=lambda partition: partition.first_time())
+            victim.evict_oldest()
+            self.scan_count -= 1
+    
+    def update_session(self, session_id, metadata):
+        """Merge session metadata (instrument, start/end time, ...) sent by the backend."""
+        with self.lock:
+            self._partition(session_id).metadata.update(metadata)
+            self._enforce_retention()
+    
+    def drop_session(self, session_id):
+        with self.lock:
+            partition = self.sessions.pop(session_id, None)
+            if partition is None:
+                return False
+            self.scan_count -= len(partition.scans)
+            if session_id == self.latest_session_id:
+                self.latest_session_id = next(reversed(self.sessions), None)
+                latest = self.sessions.get(self.latest_session_id)
+                self.latest_scan_number = (latest.latest_scan_number or 0) if latest else 0
+            return True
+    
+    def list_sessions(self):
+        with self.lock:
+            return [partition.describe() for partition in self.sessions.values()]
+    
+    def describe_session(self, session_id):
+        with self.lock:
+            partition = self.sessions.get(session_id)
+            return partition.describe() if partition is not None else None
     
     def get_latest_scan(self):
         with self.lock:
-            if not self.scan_data:
+            partition = self.sessions.get(self.latest_session_id)
+            if partition is None or partition.latest_key is None:
                 return None
-            return self.scan_data.get(self.latest_scan_number)
+            return partition.scans.get(partition.latest_key)
     
-    def get_scan(self, scan_number):
+    # Reads by scan number default to the latest session and, within it, to
+    # the stream written last; pass stream_id for another detector stream
+    def get_scan(self, scan_number, session_id=None, stream_id=None):
         with self.lock:
-            return self.scan_data.get(scan_number)
+            partition = self.sessions.get(session_id or self.latest_session_id)
+            return partition.get(scan_number, stream_id) if partition is not None else None
     
-    def get_scan_range(self, start_scan, end_scan):
+    def get_scan_range(self, start_scan, end_scan, session_id=None, stream_id=None):
         with self.lock:
+            partition = self.sessions.get(session_id or self.latest_session_id)
             result = {}
+            if partition is None:
+                return result
             for scan_num in range(start_scan, end_scan + 1):
-                if scan_num in self.scan_data:
-                    result[scan_num] = self.scan_data[scan_num]
+                scan = partition.get(scan_num, stream_id)
+                if scan is not None:
+                    result[scan_num] = scan
             return result
+    
+    def oldest_time(self):
+        with self.lock:
+            times = [t for t in (p.first_time() for p in self.sessions.values()) if t is not None]
+            return min(times) if times else None
+    
+    def query_time(self, start_time=None, end_time=None, session_id=None, limit=None):
+        """Scans with start_time <= time <= end_time (epoch seconds), oldest first.
+        
+        Each session partition is bisected on its own, so the cost is
+        O(log n + k) per session; with a session_id only that partition is read.
+        """
+        with self.lock:
+            if session_id is not None:
+                partitions = [self.sessions[session_id]] if session_id in self.sessions else []
+            else:
+                partitions = list(self.sessions.values())
+            windows = [partition.window(start_time, end_time, limit) for partition in partitions]
+        merged = heapq.merge(*windows, key=lambda item: item[0])
+        return [scan for _, scan in itertools.islice(merged, limit)]
+    
+    def query(self, criteria, session_id=None, limit=None, include_scans=False):
+        """Rows (and optionally scans) matching filter criteria, oldest first, plus the total match count.
+        
+        Filters are evaluated as vectorized masks over each partition's
+        metadata columns; with a session_id only that partition is read.
+        """
+        with self.lock:
+            if session_id is not None:
+                partitions = [self.sessions[session_id]] if session_id in self.sessions else []
+            else:
+                partitions = list(self.sessions.values())
+            matches = [(partition, partition.columns.select(criteria)) for partition in partitions]
+            total = sum(rows.size for _, rows in matches)
+            merged = heapq.merge(*(((float(row["time"]), i, row) for row in rows)
+                                   for i, (_, rows) in enumerate(matches)), key=lambda item: item[:2])
+            results = []
+            for _, i, row in itertools.islice(merged, limit):
+                partition = matches[i][0]
+                stream_id = partition.columns.stream_ids[row["stream"]]
+                result = row_dict(row, partition.session_id, stream_id)
+                if include_scans:
+                    result["scan"] = partition.scans.get((stream_id, result["scan_number"]))
+                results.append(result)
+            return results, total
+    
+    def precursor_scans(self, mz, ppm, session_id=None, limit=None):
+        """MS2 scans whose precursor m/z is within ppm of mz, closest precursor first."""
+        with self.lock:
+            if session_id is not None:
+                partitions = [self.sessions[session_id]] if session_id in self.sessions else []
+            else:
+                partitions = list(self.sessions.values())
+            matches = [(abs(precursor - mz), precursor, partition.scans[key])
+                       for partition in partitions
+                       for precursor, key in partition.precursors.lookup(mz, ppm)]
+        matches.sort(key=lambda match: match[0])
+        return [(precursor, scan) for _, precursor, scan in matches[:limit]]
 
 # Initialize data storage
 data_storage = DataStorage()
 
+# Scan sequence continuity as seen by this relay, per session and stream
+pipeline_gaps = PipelineGaps(("relay",))
+
+# Optional processing applied at ingest to scans the backend did not process
+deisotoper = Deisotoper.from_env()
+peak_filter = PeakFilter.from_env()
+
+# Incremental mzML export per acquisition session (MZML_EXPORT_DIR, off when unset)
+mzml_exporter = MzMLExporter.from_env()
+
+def apply_scan(scan_data, replay=False):
+    """Apply a scan from the bus to this worker's storage and subscribers.
+    
+    Replayed scans (backlog sent to a newly connected worker) are only stored.
+    """
+    data_storage.add_scan(scan_data)
+    if not replay:
+        pipeline_gaps.observe("relay", scan_data)
+        mzml_exporter.submit(scan_data)
+        # Emit via Socket.IO and SSE (non-blocking, slow SSE readers drop oldest)
+        scan_fanout.publish(scan_data)
+
+# Instrument readbacks pushed by the backend, as ring-buffered time series
+instrument_values_store = TimeSeriesStore(capacity=int(os.environ.get('INSTRUMENT_VALUES_CAPACITY', 86400)))
+
+def apply_message(message, replay=False):
+    """Route a bus message: instrument value batches, session updates and drops, or scans"""
+    batch = message.get('instrument_values')
+    if batch is not None:
+        instrument_values_store.add_batch(batch)
+        return
+    session = message.get('session')
+    if session is not None:
+        data_storage.update_session(session['session_id'], session)
+        if session.get('ended_at') and not replay:
+            # The acquisition is over: finish its mzML file without waiting for the idle timeout
+            mzml_exporter.finish(session['session_id'])
+        return
+    if 'drop_session' in message:
+        data_storage.drop_session(message['drop_session'])
+        return
+    apply_scan(message, replay)
+
+# Scan bus shared by worker processes (RELAY_BUS=local|unix:/path, see cluster.py)
+scan_bus = create_bus(os.environ.get('RELAY_BUS')).start(apply_message)
+
 # API key validation middleware
 def validate_api_key():
     # Get API key from config
@@ -119,22 +440,28 @@ def receive_data():
         if 'timestamp' not in scan_data:
             scan_data['timestamp'] = datetime.now().isoformat()
         
-        # Store the data
-        data_storage.add_scan(scan_data)
+        # Drop near-noise centroids unless the backend already filtered them
+        processed = False
+        if peak_filter.enabled and 'peak_filter' not in scan_data:
+            peak_filter.apply(scan_data)
+            processed = True
         
-        # Emit via Socket.IO
-        socketio.emit('scan_data', scan_data)
+        # Deisotope here unless the backend already did
+        if deisotoper.enabled and 'deisotoped' not in scan_data:
+            deisotoper.apply(scan_data)
+            processed = True
         
-        # Add to SSE queue (non-blocking, drop if queue is full)
-        try:
-            scan_data_queue.put_nowait(scan_data)
-        except queue.Full:
-            # If queue is full, remove oldest item and add new one
-            try:
-                scan_data_queue.get_nowait()
-                scan_data_queue.put_nowait(scan_data)
-            except Exception:
-                pass
+        # Summary block (TIC, base peak, m/z range, top-N peaks) unless already
+        # present; a backend summary no longer matches scans processed here
+        if processed:
+            scan_data.pop('summary', None)
+        add_summary(scan_data)
+        
+        # One event ID for every worker, so clients can resume on any of them
+        scan_data['event_id'] = next_event_id()
+        
+        # Store and fan out on every worker (directly when running single-process)
+        scan_bus.publish(scan_data)
         
         logging.info(f"Received scan #{scan_data.get('scan_number')} with {len(scan_data.get('masses', []))} data points")
         
@@ -152,6 +479,382 @@ def receive_data():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/api/instrument_values', methods=['POST'])
+def receive_instrument_values():
+    # Validate API key if configured
+    if not validate_api_key():
+        return jsonify({
+            "success": False,
+            "error": "Unauthorized",
+            "timestamp": datetime.now().isoformat()
+        }), 401
+    
+    try:
+        body = request.get_json(silent=True) or {}
+        batch = body.get('instrument_values')
+        if not isinstance(batch, dict) or not all(
+                isinstance(s, dict) and len(s.get('t', ())) == len(s.get('v', ())) for s in batch.values()):
+            return jsonify({
+                "success": False,
+                "error": "Expected {\"instrument_values\": {name: {\"t\": [...], \"v\": [...]}}}",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        # Store on every worker
+        scan_bus.publish({"instrument_values": batch})
+        
+        return jsonify({
+            "success": True,
+            "message": "Values received",
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error processing instrument values: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/instrument_values', methods=['GET'])
+def get_instrument_values():
+    # ?names=a,b&from=&to=&max_points=1000&method=minmax|mean
+    try:
+        names = [n.strip() for n in request.args.get('names', '').split(',') if n.strip()]
+        try:
+            t_from = parse_time(request.args.get('from'))
+            t_to = parse_time(request.args.get('to'))
+            max_points = request.args.get('max_points', default=1000, type=int)
+            values = instrument_values_store.query(names, t_from, t_to, max_points,
+                                                   request.args.get('method', 'minmax'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        return jsonify({
+            "success": True,
+            "series": instrument_values_store.describe(),
+            "values": values,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error getting instrument values: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/data', methods=['GET'])
+def query_scans_by_time():
+    # ?from=&to=&session_id=&limit=100&source=all|memory|archive
+    try:
+        try:
+            start_time = parse_time(request.args.get('from'))
+            end_time = parse_time(request.args.get('to'))
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "from/to must be ISO-8601 timestamps or finite epoch seconds",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        session_id = request.args.get('session_id')
+        limit = request.args.get('limit', default=100, type=int)
+        source = request.args.get('source', 'all')
+        if source not in ('all', 'memory', 'archive') or limit is None or limit < 1:
+            return jsonify({
+                "success": False,
+                "error": "source must be all, memory or archive and limit a positive integer",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        scans = []
+        archived = 0
+        oldest = data_storage.oldest_time()
+        # The archive only serves the part of the window older than what is still in memory
+        if source == 'archive' or (source == 'all' and mzml_exporter.enabled and
+                                   (oldest is None or start_time is None or start_time < oldest)):
+            archive_end = end_time if source == 'archive' or oldest is None else min(
+                end_time if end_time is not None else oldest, oldest)
+            scans = mzml_exporter.query_time(start_time, archive_end, session_id, limit)
+            archived = len(scans)
+        if source != 'archive' and len(scans) < limit:
+            seen = {(scan.get('session_id'), scan.get('scan_number')) for scan in scans}
+            for scan in data_storage.query_time(start_time, end_time, session_id, limit):
+                if (scan.get('session_id'), scan.get('scan_number')) not in seen:
+                    scans.append(scan)
+            scans = scans[:limit]
+        
+        return jsonify({
+            "success": True,
+            "scans": scans,
+            "count": len(scans),
+            "from_archive": min(archived, len(scans)),
+            "truncated": len(scans) >= limit,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error querying scans by time: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/query', methods=['GET', 'POST'])
+def query_scans():
+    # Filters as query arguments or a JSON body: ms_order=2&polarity=positive&min_precursor_mz=500
+    # &max_precursor_mz=510&min_tic=1e6&last=600 (also from/to, *_base_peak_*), session_id, limit, include_scans
+    try:
+        args = (request.get_json(silent=True) or {}) if request.method == 'POST' else request.args.to_dict()
+        try:
+            if not isinstance(args, dict):
+                raise TypeError("body must be a JSON object")
+            if args.get('from') not in (None, ""):
+                args['from'] = parse_time(args['from'])
+            if args.get('to') not in (None, ""):
+                args['to'] = parse_time(args['to'])
+            criteria = parse_query(args, time.time())
+            limit = int(args.get('limit', 100))
+            if limit < 1:
+                raise ValueError("limit must be a positive integer")
+        except (TypeError, ValueError) as e:
+            return jsonify({
+                "success": False,
+                "error": f"Invalid query: {e}",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        include_scans = str(args.get('include_scans', '')).lower() in ('1', 'true', 'yes')
+        started = time.perf_counter()
+        results, total = data_storage.query(criteria, args.get('session_id'), limit, include_scans)
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "count": len(results),
+            "matched": total,
+            "criteria": criteria,
+            "query_ms": round((time.perf_counter() - started) * 1000.0, 3),
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error querying scans: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/precursors', methods=['GET'])
+def get_precursor_scans():
+    # ?mz=652.34&ppm=10&session_id=&limit=&consensus=1&merge_ppm=10&min_fraction=0.5
+    try:
+        mz = request.args.get('mz', type=float)
+        ppm = request.args.get('ppm', default=10.0, type=float)
+        limit = request.args.get('limit', type=int)
+        merge_ppm = request.args.get('merge_ppm', default=10.0, type=float)
+        min_fraction = request.args.get('min_fraction', default=0.5, type=float)
+        if mz is None or mz <= 0 or ppm is None or ppm <= 0 or merge_ppm is None or merge_ppm <= 0:
+            return jsonify({
+                "success": False,
+                "error": "mz, ppm and merge_ppm must be positive numbers",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        started = time.perf_counter()
+        matches = data_storage.precursor_scans(mz, ppm, request.args.get('session_id'), limit)
+        lookup_ms = (time.perf_counter() - started) * 1000.0
+        response = {
+            "success": True,
+            "mz": mz,
+            "ppm": ppm,
+            "count": len(matches),
+            "lookup_ms": round(lookup_ms, 3),
+            "timestamp": datetime.now().isoformat()
+        }
+        
+        if request.args.get('consensus', '').lower() in ('1', 'true', 'yes'):
+            # Peaks found in at least min_fraction of the spectra, intensities averaged over all of them
+            masses, intensities, counts = average_spectra(
+                ((scan.get('masses', []), scan.get('intensities', [])) for _, scan in matches),
+                ppm_tolerance=merge_ppm
+            )
+            keep = counts >= min_fraction * len(matches)
+            response["consensus"] = {
+                "masses": masses[keep].tolist(),
+                "intensities": intensities[keep].tolist(),
+                "peak_counts": counts[keep].tolist(),
+                "scan_count": len(matches),
+                "merge_ppm": merge_ppm,
+                "min_fraction": min_fraction
+            }
+            response["scans"] = [{"session_id": scan.get('session_id'), "scan_number": scan.get('scan_number'),
+                                  "precursor_mz": precursor} for precursor, scan in matches]
+        else:
+            response["scans"] = [scan for _, scan in matches]
+        
+        return jsonify(response)
+    
+    except Exception as e:
+        logging.error(f"Error looking up precursor scans: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/sessions', methods=['POST'])
+def receive_session():
+    # Validate API key if configured
+    if not validate_api_key():
+        return jsonify({
+            "success": False,
+            "error": "Unauthorized",
+            "timestamp": datetime.now().isoformat()
+        }), 401
+    
+    try:
+        body = request.get_json(silent=True) or {}
+        session = body.get('session')
+        if not isinstance(session, dict) or not session.get('session_id'):
+            return jsonify({
+                "success": False,
+                "error": "Expected {\"session\": {\"session_id\": ..., ...}}",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        # Record on every worker
+        scan_bus.publish({"session": session})
+        
+        return jsonify({
+            "success": True,
+            "message": "Session recorded",
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error recording session: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/sessions', methods=['GET'])
+def list_sessions():
+    try:
+        return jsonify({
+            "success": True,
+            "sessions": data_storage.list_sessions(),
+            "latest_session_id": data_storage.latest_session_id,
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error listing sessions: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/sessions/<session_id>', methods=['GET'])
+def get_session(session_id):
+    session = data_storage.describe_session(session_id)
+    if session is None:
+        return jsonify({
+            "success": False,
+            "error": f"Session {session_id} not found",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    
+    return jsonify({
+        "success": True,
+        "session": session,
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/api/sessions/<session_id>/scans', methods=['GET'])
+def get_session_scans(session_id):
+    # ?start=&end= (scan numbers) or ?from=&to= (time window), &limit=100
+    try:
+        if data_storage.describe_session(session_id) is None:
+            return jsonify({
+                "success": False,
+                "error": f"Session {session_id} not found",
+                "timestamp": datetime.now().isoformat()
+            }), 404
+        
+        limit = request.args.get('limit', default=100, type=int)
+        start_scan = request.args.get('start', type=int)
+        end_scan = request.args.get('end', type=int)
+        try:
+            start_time = parse_time(request.args.get('from'))
+            end_time = parse_time(request.args.get('to'))
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "from/to must be ISO-8601 timestamps or finite epoch seconds",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        if start_scan is not None and end_scan is not None:
+            scans = list(data_storage.get_scan_range(start_scan, end_scan, session_id,
+                                                     request.args.get('stream_id')).values())[:limit]
+        else:
+            scans = data_storage.query_time(start_time, end_time, session_id, limit)
+        
+        return jsonify({
+            "success": True,
+            "session_id": session_id,
+            "scans": scans,
+            "count": len(scans),
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error querying session scans: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/sessions/<session_id>', methods=['DELETE'])
+def drop_session(session_id):
+    # Validate API key if configured
+    if not validate_api_key():
+        return jsonify({
+            "success": False,
+            "error": "Unauthorized",
+            "timestamp": datetime.now().isoformat()
+        }), 401
+    
+    if data_storage.describe_session(session_id) is None:
+        return jsonify({
+            "success": False,
+            "error": f"Session {session_id} not found",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    
+    # Drop on every worker
+    scan_bus.publish({"drop_session": session_id})
+    
+    return jsonify({
+        "success": True,
+        "message": f"Session {session_id} dropped",
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/api/data/latest', methods=['GET'])
 def get_latest_data():
     try:
@@ -181,7 +884,7 @@ def get_latest_data():
 @app.route('/api/data/<int:scan_number>', methods=['GET'])
 def get_scan_data(scan_number):
     try:
-        scan_data = data_storage.get_scan(scan_number)
+        scan_data = data_storage.get_scan(scan_number, request.args.get('session_id'), request.args.get('stream_id'))
         
         if not scan_data:
             return jsonify({
@@ -224,7 +927,8 @@ def get_scan_range():
                 "timestamp": datetime.now().isoformat()
             }), 400
         
-        scan_data = data_storage.get_scan_range(start_scan, end_scan)
+        scan_data = data_storage.get_scan_range(start_scan, end_scan, request.args.get('session_id'),
+                                                request.args.get('stream_id'))
         
         if not scan_data:
             return jsonify({
@@ -247,20 +951,197 @@ def get_scan_range():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+def average_response(scans):
+    """Average the given scans' centroids (optionally one MS order) into one spectrum.
+    
+    Scans may come from several sessions, so they are passed as a list rather
+    than keyed by scan number.
+    """
+    ppm = request.args.get('ppm', default=5.0, type=float)
+    ms_order = request.args.get('ms_order', type=int)
+    if ppm is None or ppm <= 0:
+        return jsonify({
+            "success": False,
+            "error": "ppm must be a positive number",
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    
+    if ms_order is not None:
+        scans = [scan for scan in scans if scan.get('ms_order', 1) == ms_order]
+    
+    if not scans:
+        return jsonify({
+            "success": False,
+            "error": "No scans found in specified range",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    
+    masses, intensities, counts = average_spectra(
+        ((scan.get('masses', []), scan.get('intensities', [])) for scan in scans),
+        ppm_tolerance=ppm
+    )
+    scan_numbers = sorted(scan.get('scan_number', 0) for scan in scans)
+    
+    return jsonify({
+        "success": True,
+        "average": {
+            "masses": masses.tolist(),
+            "intensities": intensities.tolist(),
+            "peak_counts": counts.tolist(),
+            "scan_count": len(scans),
+            "first_scan": scan_numbers[0],
+            "last_scan": scan_numbers[-1],
+            "session_ids": sorted({scan.get('session_id') for scan in scans}, key=str),
+            "ppm": ppm,
+            "ms_order": ms_order
+        },
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.route('/api/data/average', methods=['GET'])
+def get_average_spectrum():
+    try:
+        start_scan = request.args.get('start', type=int)
+        end_scan = request.args.get('end', type=int)
+        
+        if start_scan is None or end_scan is None:
+            return jsonify({
+                "success": False,
+                "error": "Missing start or end parameters",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        if start_scan > end_scan:
+            return jsonify({
+                "success": False,
+                "error": "Start scan must be less than or equal to end scan",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        scans = data_storage.get_scan_range(start_scan, end_scan, request.args.get('session_id'),
+                                            request.args.get('stream_id'))
+        return average_response(list(scans.values()))
+    
+    except Exception as e:
+        logging.error(f"Error averaging scans: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/data/average/time', methods=['GET'])
+def get_average_spectrum_by_time():
+    try:
+        try:
+            start_time = parse_time(request.args.get('from'))
+            end_time = parse_time(request.args.get('to'))
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "from/to must be ISO-8601 timestamps or finite epoch seconds",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        if start_time is None or end_time is None:
+            return jsonify({
+                "success": False,
+                "error": "Missing from or to parameters",
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        
+        # Every session's scans in the window, or only those of ?session_id=
+        return average_response(data_storage.query_time(start_time, end_time, request.args.get('session_id')))
+    
+    except Exception as e:
+        logging.error(f"Error averaging scans: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/exports', methods=['GET'])
+def list_exports():
+    try:
+        return jsonify({
+            "success": True,
+            "enabled": mzml_exporter.enabled,
+            "exports": mzml_exporter.list_exports(),
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error listing exports: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/api/exports/<file_name>', methods=['GET'])
+def download_export(file_name):
+    path = mzml_exporter.finished_path(file_name)
+    if path is None:
+        return jsonify({
+            "success": False,
+            "error": f"No finished export named {file_name}",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return send_file(path, mimetype='application/xml', as_attachment=True, download_name=file_name)
+
+@app.route('/api/exports/<session_id>/close', methods=['POST'])
+def close_export(session_id):
+    # Validate API key if configured
+    if not validate_api_key():
+        return jsonify({
+            "success": False,
+            "error": "Unauthorized",
+            "timestamp": datetime.now().isoformat()
+        }), 401
+    
+    try:
+        path = mzml_exporter.close_session(session_id)
+        if path is None:
+            return jsonify({
+                "success": False,
+                "error": f"Session {session_id} is not being exported by this worker",
+                "timestamp": datetime.now().isoformat()
+            }), 404
+        
+        return jsonify({
+            "success": True,
+            "file": os.path.basename(path),
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except Exception as e:
+        logging.error(f"Error finishing export: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
 @app.route('/api/events')
 def events():
+    # ?summary_only=1 omits the per-point arrays; Last-Event-ID replays missed scans
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    subscriber, missed = scan_fanout.subscribe_sse(parse_stream_options(request.args), last_event_id)
+    
     def event_stream():
-        while True:
-            try:
-                # Get data from queue with a timeout to allow for clean shutdown
-                data = scan_data_queue.get(timeout=1)
-                yield f"data: {json.dumps(data)}\n\n"
-            except queue.Empty:
-                # Send a keep-alive comment to prevent connection timeout
-                yield ": keep-alive\n\n"
-            except Exception as e:
-                logging.error(f"Error in event stream: {e}")
-                break
+        try:
+            yield from missed
+            while True:
+                try:
+                    # Block until a scan arrives; time out only to send keep-alives
+                    event_id, data = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    yield sse_message(event_id, data)
+                except queue.Empty:
+                    # Send a keep-alive comment to prevent connection timeout
+                    yield ": keep-alive\n\n"
+        finally:
+            scan_fanout.unsubscribe_sse(subscriber)
     
     return Response(stream_with_context(event_stream()),
                   mimetype="text/event-stream",
@@ -268,11 +1149,40 @@ def events():
                            "Connection": "keep-alive",
                            "Access-Control-Allow-Origin": "*"})
 
+@socketio.on('connect')
+def handle_connect(auth=None):
+    # Every client gets full scans until it asks for something else
+    options = parse_stream_options(None)
+    room, _ = scan_fanout.subscribe_socket(request.sid, options)
+    join_room(room)
+    # A reconnecting client passes {"last_event_id": ...} as its auth payload
+    last_event_id = parse_event_id((auth or {}).get('last_event_id'))
+    if last_event_id is not None:
+        scan_fanout.replay_socket(request.sid, options, last_event_id)
+
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    # Change this client's scan stream, e.g. {"summary_only": true, "last_event_id": 1712345678901}
+    options = parse_stream_options(data)
+    room, previous = scan_fanout.subscribe_socket(request.sid, options)
+    if previous and previous != room:
+        leave_room(previous)
+    join_room(room)
+    result = {"success": True, "room": room}
+    last_event_id = parse_event_id((data or {}).get('last_event_id'))
+    if last_event_id is not None:
+        result["replayed"], result["complete"] = scan_fanout.replay_socket(request.sid, options, last_event_id)
+    return result
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    scan_fanout.unsubscribe_socket(request.sid)
+
 @app.route('/api/status', methods=['GET'])
 def get_status():
     try:
         latest_scan = data_storage.get_latest_scan()
-        scan_count = len(data_storage.scan_data)
+        scan_count = data_storage.scan_count
         
         return jsonify({
             "success": True,
@@ -280,7 +1190,17 @@ def get_status():
                 "server_running": True,
                 "scan_count": scan_count,
                 "latest_scan_number": data_storage.latest_scan_number,
+                "latest_session_id": data_storage.latest_session_id,
+                "sessions": len(data_storage.sessions),
+                "sessions_evicted": data_storage.sessions_evicted,
+                "gaps": pipeline_gaps.get_stats(),
+                "instrument_values": instrument_values_store.get_stats(),
+                "mzml_export": mzml_exporter.get_stats(),
                 "latest_scan_timestamp": latest_scan.get('timestamp') if latest_scan else None,
+                "processing": {"deisotoping": deisotoper.get_stats(), "peak_filter": peak_filter.get_stats()},
+                "scan_stream": scan_fanout.get_stats(),
+                "bus": scan_bus.get_stats(),
+                "async_mode": socketio.async_mode,
                 "timestamp": datetime.now().isoformat()
             }
         })
@@ -293,6 +1213,37 @@ def get_status():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/api/processing', methods=['GET', 'POST'])
+def processing_settings():
+    # Validate API key if configured
+    if request.method == 'POST' and not validate_api_key():
+        return jsonify({
+            "success": False,
+            "error": "Unauthorized",
+            "timestamp": datetime.now().isoformat()
+        }), 401
+    
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True) or {}
+            if 'deisotoping' in body:
+                deisotoper.configure(**body['deisotoping'])
+            if 'peak_filter' in body:
+                peak_filter.configure(**body['peak_filter'])
+        
+        return jsonify({
+            "success": True,
+            "processing": {"deisotoping": deisotoper.get_stats(), "peak_filter": peak_filter.get_stats()},
+            "timestamp": datetime.now().isoformat()
+        })
+    
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+
 # Serve static files
 # Update the route to serve the index.html file
 @app.route('/', defaults={'path': ''})
@@ -307,12 +1258,24 @@ def serve(path):
             "status": "running",
             "message": "ThermoAPI Remote Server is running. Use the API endpoints to interact with the server.",
             "endpoints": {
-                "/api/data": "POST - Send data to the server",
+                "/api/data": "POST - Send data to the server; GET - Scans in a time window (?from=&to=&session_id=&limit=&source=all|memory|archive)",
                 "/api/data/latest": "GET - Get the latest scan data",
-                "/api/data/<scan_number>": "GET - Get a specific scan by number",
-                "/api/data/range": "GET - Get a range of scans",
-                "/api/events": "GET - SSE endpoint for real-time data",
-                "/api/status": "GET - Get server status"
+                "/api/data/<scan_number>": "GET - Get a specific scan by number (?session_id=, default latest session)",
+                "/api/data/range": "GET - Get a range of scans (?start=&end=&session_id=)",
+                "/api/data/average": "GET - Averaged spectrum over a scan range (?start=&end=&ppm=)",
+                "/api/data/average/time": "GET - Averaged spectrum over a time range (?from=&to=&ppm=)",
+                "/api/events": "GET - SSE endpoint for real-time data (?summary_only=1 for summaries, ?columns= for extended centroid columns)",
+                "/api/instrument_values": "POST - Send instrument value batches; GET - Downsampled time series (?names=&from=&to=&max_points=&method=)",
+                "/api/query": "GET/POST - Filter stored scans (?ms_order=&polarity=&min_/max_precursor_mz=&min_tic=&last=&from=&to=&limit=&include_scans=)",
+                "/api/precursors": "GET - MS2 scans by precursor m/z (?mz=&ppm=&session_id=&limit=&consensus=1&merge_ppm=&min_fraction=)",
+                "/api/sessions": "GET - List acquisition sessions; POST - Record session metadata",
+                "/api/sessions/<session_id>": "GET - Session metadata; DELETE - Drop the session's scans",
+                "/api/sessions/<session_id>/scans": "GET - Scans of one session (?start=&end= or ?from=&to=, &limit=)",
+                "/api/exports": "GET - List mzML exports (finished and in progress)",
+                "/api/exports/<file>": "GET - Download a finished mzML export",
+                "/api/exports/<session_id>/close": "POST - Finish a session's mzML export now",
+                "/api/status": "GET - Get server status",
+                "/api/processing": "GET/POST - Inspect or configure ingest processing stages"
             },
             "timestamp": datetime.now().isoformat()
         })
@@ -332,6 +1295,8 @@ if __name__ == '__main__':
     # Log startup information
     logging.info(f"Starting remote server on port {port}")
     logging.info(f"API Key authentication: {'Enabled' if os.environ.get('API_KEY') else 'Disabled'}")
+    logging.info(f"Async mode: {socketio.async_mode}")
     
     # Run the server
-    socketio.run(app, host='0.0.0.0', port=port, debug=False)
\ No newline at end of file
+    # Threading mode runs on the Werkzeug server, gevent mode on gevent's WSGI server
+    socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
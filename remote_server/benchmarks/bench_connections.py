@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Benchmark the relay with thousands of concurrent SSE viewers.
+
+Starts app.py in a subprocess (threading or gevent mode), holds --clients
+idle /api/events connections open from one non-blocking client thread, then
+posts scans and waits until every viewer has received all of them. Reports
+server memory and thread count per idle connection and the delivery time.
+Linux only (reads /proc). Run from the remote_server directory:
+
+    python benchmarks/bench_connections.py --mode gevent --clients 5000
+    python benchmarks/bench_connections.py --mode threading --clients 1000
+"""
+
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import selectors
+import tempfile
+import subprocess
+import urllib.request
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'app.py')
+MARKER = b"data: "
+
+
+def proc_status(pid):
+    """VmRSS in kB and thread count of a process."""
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "Threads"):
+                values[key] = int(value.split()[0])
+    return values["VmRSS"], values["Threads"]
+
+
+def wait_for_server(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/api/status", timeout=1).read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def post_scan(port, scan_number):
+    body = json.dumps({"scan_number": scan_number, "masses": [100.0, 200.0, 300.0],
+                       "intensities": [1.0, 5.0, 2.0]}).encode()
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/api/data", data=body,
+                                     headers={"Content-Type": "application/json"})
+    urllib.request.urlopen(request, timeout=30).read()
+
+
+class Viewers:
+    """Many SSE connections multiplexed on one selector."""
+
+    def __init__(self, port):
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        self.counts = {}
+        self.tails = {}
+
+    def open(self, count):
+        request = (f"GET /api/events?summary_only=1 HTTP/1.1\r\nHost: 127.0.0.1:{self.port}\r\n"
+                   "Accept: text/event-stream\r\n\r\n").encode()
+        for _ in range(count):
+            sock = socket.create_connection(("127.0.0.1", self.port))
+            sock.sendall(request)
+            sock.setblocking(False)
+            self.selector.register(sock, selectors.EVENT_READ)
+            self.counts[sock] = 0
+            self.tails[sock] = b""
+            # Keep the accept backlog of the server from overflowing
+            self.poll(0)
+
+    def poll(self, timeout):
+        for key, _ in self.selector.select(timeout):
+            sock = key.fileobj
+            try:
+                chunk = sock.recv(65536)
+            except BlockingIOError:
+                continue
+            if not chunk:
+                self.selector.unregister(sock)
+                continue
+            data = self.tails[sock] + chunk
+            self.counts[sock] += data.count(MARKER)
+            self.tails[sock] = data[-(len(MARKER) - 1):]
+
+    def received_all(self, expected):
+        return all(count >= expected for count in self.counts.values())
+
+    def close(self):
+        for sock in list(self.counts):
+            sock.close()
+        self.selector.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['threading', 'gevent'], default='gevent', help='relay ASYNC_MODE')
+    parser.add_argument('--clients', type=int, default=2000, help='concurrent SSE viewers')
+    parser.add_argument('--scans', type=int, default=10, help='scans posted once all viewers are connected')
+    parser.add_argument('--port', type=int, default=5931)
+    parser.add_argument('--timeout', type=float, default=120.0, help='delivery timeout in seconds')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PORT=str(args.port), ASYNC_MODE=args.mode, API_KEY="")
+    workdir = tempfile.mkdtemp(prefix="relay-bench-")
+    server = subprocess.Popen([sys.executable, os.path.abspath(APP_PATH)], cwd=workdir, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    viewers = None
+    try:
+        if not wait_for_server(args.port):
+            print("Relay did not start")
+            return 1
+        base_rss, base_threads = proc_status(server.pid)
+
+        print(f"=== Relay Connection Benchmark ({args.mode}) ===")
+        viewers = Viewers(args.port)
+        t0 = time.perf_counter()
+        viewers.open(args.clients)
+        connect_seconds = time.perf_counter() - t0
+        # Let the server settle every connection into its idle wait
+        settle_until = time.time() + 2.0
+        while time.time() < settle_until:
+            viewers.poll(0.1)
+        rss, threads = proc_status(server.pid)
+
+        print(f"Viewers connected: {args.clients} in {connect_seconds:.1f} s")
+        print(f"Server RSS: {base_rss / 1024:.1f} MB idle -> {rss / 1024:.1f} MB "
+              f"({(rss - base_rss) / max(args.clients, 1):.1f} kB per connection)")
+        print(f"Server threads: {base_threads} -> {threads}")
+
+        t0 = time.perf_counter()
+        for scan_number in range(1, args.scans + 1):
+            post_scan(args.port, scan_number)
+            viewers.poll(0)
+        deadline = time.time() + args.timeout
+        while not viewers.received_all(args.scans) and time.time() < deadline:
+            viewers.poll(0.1)
+        delivery_seconds = time.perf_counter() - t0
+        complete = sum(1 for count in viewers.counts.values() if count >= args.scans)
+
+        print(f"Delivered {args.scans} scans to {complete}/{args.clients} viewers in {delivery_seconds:.2f} s")
+        return 0 if complete == args.clients else 1
+    finally:
+        if viewers is not None:
+            viewers.close()
+        server.terminate()
+        server.wait(timeout=10)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,319 @@
+"""
+Scan bus shared by relay worker processes.
+
+Every ingested scan is published on a bus and every worker applies it to its
+own ``DataStorage`` replica and fans it out to its own Socket.IO / SSE
+subscribers, so any number of workers serve the same data regardless of
+which one received the POST.
+
+Bus URLs (``RELAY_BUS``)::
+
+    local (default)      in-process, single worker; publish delivers directly
+    unix:/path/to.sock   workers connect to a hub listening on a Unix socket
+
+The hub (``BusHub``) forwards frames to all connected workers, including the
+publisher, and keeps the last ``backlog`` scans so a worker that starts (or
+restarts) late is hydrated before it sees live traffic. Each worker has its
+own bounded send queue and writer thread, so a slow worker never holds up
+the others; one that falls ``client_queue`` frames behind is disconnected
+and catches up from the backlog when it reconnects. It runs in the
+gunicorn master (see ``gunicorn.conf.py``) or standalone::
+
+    python cluster.py hub /tmp/relay.sock
+
+Wire format: a 4-byte big-endian length, then one kind byte (``S`` live scan,
+``R`` replayed scan) followed by the JSON-encoded scan.
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import socket
+import struct
+import logging
+import threading
+from collections import deque
+
+FRAME_HEADER = struct.Struct(">I")
+LIVE = b"S"
+REPLAY = b"R"
+DEFAULT_BACKLOG = 1000
+# Live frames a worker may fall behind before the hub disconnects it
+DEFAULT_CLIENT_QUEUE = 1000
+
+
+def send_frame(sock, kind, body):
+    sock.sendall(FRAME_HEADER.pack(len(body) + 1) + kind + body)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("bus connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_frame(sock):
+    """Read one frame; returns ``(kind, body)``."""
+    (size,) = FRAME_HEADER.unpack(_recv_exact(sock, FRAME_HEADER.size))
+    frame = _recv_exact(sock, size)
+    return frame[:1], frame[1:]
+
+
+class LocalBus:
+    """Single-process bus: publishing hands the scan straight to the local consumer."""
+
+    url = "local"
+
+    def __init__(self):
+        self.on_scan = None
+        self.published = 0
+
+    def start(self, on_scan):
+        self.on_scan = on_scan
+        return self
+
+    def publish(self, scan_data):
+        self.published += 1
+        self.on_scan(scan_data, replay=False)
+
+    def get_stats(self):
+        return {"url": self.url, "worker_pid": os.getpid(), "published": self.published}
+
+
+class UnixSocketBus:
+    """Worker side of the Unix socket bus; reconnects to the hub with backoff."""
+
+    def __init__(self, path, reconnect_delay=0.5, max_reconnect_delay=10.0):
+        self.path = path
+        self.url = f"unix:{path}"
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_scan = None
+        self.sock = None
+        self.send_lock = threading.Lock()
+        self.connected = threading.Event()
+        self.thread = None
+        self.stats = {"published": 0, "received": 0, "replayed": 0, "reconnects": 0, "publish_errors": 0}
+
+    def start(self, on_scan):
+        self.on_scan = on_scan
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        # Give the first connection (and backlog replay) a moment before serving
+        self.connected.wait(timeout=5)
+        return self
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.connect(self.path)
+        return sock
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while True:
+            try:
+                sock = self._connect()
+            except OSError as e:
+                logging.warning(f"Scan bus hub not reachable at {self.path}: {e}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            with self.send_lock:
+                self.sock = sock
+            self.connected.set()
+            delay = self.reconnect_delay
+            logging.info(f"Connected to scan bus hub at {self.path}")
+            try:
+                while True:
+                    kind, body = recv_frame(sock)
+                    scan_data = json.loads(body)
+                    if kind == REPLAY:
+                        self.stats["replayed"] += 1
+                    else:
+                        self.stats["received"] += 1
+                    try:
+                        self.on_scan(scan_data, replay=kind == REPLAY)
+                    except Exception as e:
+                        logging.error(f"Error applying scan from bus: {e}")
+            except (OSError, ConnectionError, ValueError) as e:
+                logging.warning(f"Scan bus connection lost: {e}")
+            finally:
+                self.connected.clear()
+                with self.send_lock:
+                    self.sock = None
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+                self.stats["reconnects"] += 1
+
+    def publish(self, scan_data):
+        body = json.dumps(scan_data).encode("utf-8")
+        if not self.connected.wait(timeout=5):
+            self.stats["publish_errors"] += 1
+            raise ConnectionError(f"Scan bus hub not connected at {self.path}")
+        with self.send_lock:
+            try:
+                send_frame(self.sock, LIVE, body)
+            except (OSError, AttributeError) as e:
+                self.stats["publish_errors"] += 1
+                raise ConnectionError(f"Failed to publish scan on bus: {e}")
+        self.stats["published"] += 1
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({"url": self.url, "worker_pid": os.getpid(), "connected": self.connected.is_set()})
+        return stats
+
+
+class HubClient:
+    """One worker connection on the hub: a bounded send queue drained by its own writer thread."""
+
+    def __init__(self, sock, queue_size):
+        self.sock = sock
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = False
+        self.thread = threading.Thread(target=self._write_loop, daemon=True)
+
+    def offer(self, kind, body):
+        """Queue a frame without blocking; returns False if the worker is too far behind."""
+        try:
+            self.queue.put_nowait((kind, body))
+            return True
+        except queue.Full:
+            return False
+
+    def _write_loop(self):
+        try:
+            while True:
+                frame = self.queue.get()
+                if frame is None:
+                    return
+                send_frame(self.sock, *frame)
+        except OSError:
+            pass
+        finally:
+            self.close()
+            self.sock.close()
+
+    def close(self):
+        """Shut the connection down; the reader and writer threads then exit."""
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            # The writer fails on the shut-down socket instead
+            pass
+
+
+class BusHub:
+    """Forwards scan frames between workers and keeps a bounded replay backlog."""
+
+    def __init__(self, path, backlog=DEFAULT_BACKLOG, client_queue=DEFAULT_CLIENT_QUEUE):
+        self.path = path
+        self.backlog = deque(maxlen=backlog)
+        self.client_queue = client_queue
+        self.lock = threading.Lock()
+        self.clients = set()
+        self.server = None
+        self.frames_forwarded = 0
+        self.slow_disconnects = 0
+
+    def start(self):
+        """Bind the socket and serve in a daemon thread."""
+        if os.path.exists(self.path):
+            # Stale socket from a previous run
+            os.unlink(self.path)
+        self.server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.server.bind(self.path)
+        self.server.listen(64)
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        logging.info(f"Scan bus hub listening on {self.path}")
+        return self
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve_client, args=(sock,), daemon=True).start()
+
+    def _serve_client(self, sock):
+        # Room for the whole backlog plus the live frames it may fall behind by
+        client = HubClient(sock, self.backlog.maxlen + self.client_queue)
+        with self.lock:
+            # Queue the backlog under the lock so no live frame slips in ahead of it
+            for body in self.backlog:
+                client.offer(REPLAY, body)
+            self.clients.add(client)
+        client.thread.start()
+        try:
+            while True:
+                kind, body = recv_frame(sock)
+                if kind == LIVE:
+                    self._broadcast(body)
+        except (OSError, ConnectionError):
+            pass
+        finally:
+            with self.lock:
+                self.clients.discard(client)
+            client.close()
+
+    def _broadcast(self, body):
+        # Frames are queued under the lock so every worker sees one order;
+        # the sends themselves happen on each client's writer thread
+        with self.lock:
+            self.backlog.append(body)
+            self.frames_forwarded += 1
+            for client in list(self.clients):
+                if not client.offer(LIVE, body):
+                    logging.warning(f"Scan bus worker is {self.client_queue} frames behind; disconnecting it")
+                    self.clients.discard(client)
+                    self.slow_disconnects += 1
+                    client.close()
+
+    def stop(self):
+        if self.server is not None:
+            self.server.close()
+            self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+def create_bus(url=None):
+    """Build the bus for a ``RELAY_BUS`` URL."""
+    url = (url or "local").strip()
+    if url == "local":
+        return LocalBus()
+    if url.startswith("unix:"):
+        return UnixSocketBus(url[len("unix:"):])
+    raise ValueError(f"Unsupported RELAY_BUS: {url}")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if len(sys.argv) != 3 or sys.argv[1] != "hub":
+        print("usage: python cluster.py hub /path/to/relay.sock")
+        sys.exit(2)
+    hub = BusHub(sys.argv[2], backlog=int(os.environ.get("RELAY_BUS_BACKLOG", DEFAULT_BACKLOG)),
+                 client_queue=int(os.environ.get("RELAY_BUS_CLIENT_QUEUE", DEFAULT_CLIENT_QUEUE))).start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        hub.stop()
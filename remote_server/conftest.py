@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules shared with the instrument backend, as app.py finds them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'shared'))
@@ -0,0 +1,44 @@
+"""
+Gunicorn settings for running the relay on several worker processes.
+
+    RELAY_WORKERS=4 RELAY_BUS=unix:/tmp/relay.sock gunicorn -c gunicorn.conf.py app:app
+
+The master hosts the scan bus hub, so every worker sees every ingested scan
+(see cluster.py). Socket.IO long-polling needs sticky sessions across
+workers; put a sticky load balancer in front or have clients use the
+websocket transport. SSE (/api/events) works on any worker.
+"""
+
+import os
+
+from cluster import BusHub, DEFAULT_BACKLOG, DEFAULT_CLIENT_QUEUE
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5001)}"
+workers = int(os.environ.get('RELAY_WORKERS', 1))
+if os.environ.get('ASYNC_MODE') == 'gevent':
+    # One greenlet per connection; websocket upgrades handled by gevent-websocket
+    worker_class = 'geventwebsocket.gunicorn.workers.GeventWebSocketWorker'
+    worker_connections = int(os.environ.get('RELAY_WORKER_CONNECTIONS', 10000))
+else:
+    worker_class = 'gthread'
+    threads = int(os.environ.get('RELAY_THREADS', 100))
+# SSE and Socket.IO connections are long-lived
+timeout = 0
+
+_hub = None
+
+
+def on_starting(server):
+    global _hub
+    bus_url = os.environ.get('RELAY_BUS', 'local')
+    if workers > 1 and not bus_url.startswith('unix:'):
+        raise RuntimeError("RELAY_WORKERS > 1 needs a shared bus, e.g. RELAY_BUS=unix:/tmp/relay.sock")
+    if bus_url.startswith('unix:'):
+        backlog = int(os.environ.get('RELAY_BUS_BACKLOG', DEFAULT_BACKLOG))
+        client_queue = int(os.environ.get('RELAY_BUS_CLIENT_QUEUE', DEFAULT_CLIENT_QUEUE))
+        _hub = BusHub(bus_url[len('unix:'):], backlog=backlog, client_queue=client_queue).start()
+
+
+def on_exit(server):
+    if _hub is not None:
+        _hub.stop()
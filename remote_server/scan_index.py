@@ -0,0 +1,248 @@
+"""
+Per-scan metadata columns and vectorized filter queries.
+
+Every session partition keeps one row per stored scan in a NumPy structured
+array:
+
+- time, scan number, detector stream, MS order, polarity
+- TIC, base peak m/z and intensity, precursor m/z
+
+Several detector streams can share a session and each numbers its scans on
+its own, so rows and scans are keyed by ``(stream_id, scan_number)``.
+
+The array is appended to at ingest and grows by doubling. Evicted or replaced
+scans are marked dead and compacted away in bulk. A query turns each condition
+into a boolean mask over a whole column and ANDs the masks together, so a
+filter such as "MS2, positive, precursor 500-510, TIC above 1e6, last 10
+minutes" is a handful of array comparisons rather than a loop over scan dicts.
+MS order, polarity and stream are small integer codes, so their masks act as
+bitmap indexes.
+
+``PrecursorIndex`` keeps a session's MS2 scans sorted by precursor m/z for
+"all spectra of precursor X ± ppm" lookups.
+"""
+
+import math
+import bisect
+
+import numpy as np
+
+POLARITY_CODES = {"positive": 1, "+": 1, "pos": 1, "negative": -1, "-": -1, "neg": -1}
+
+ROW_DTYPE = np.dtype([
+    ("time", "f8"),
+    ("scan_number", "i8"),
+    ("stream", "i4"),
+    ("ms_order", "i2"),
+    ("polarity", "i1"),
+    ("tic", "f8"),
+    ("base_peak_mz", "f8"),
+    ("base_peak_intensity", "f8"),
+    ("precursor_mz", "f8"),
+])
+
+# Query argument -> (column, comparison)
+RANGE_FILTERS = {
+    "min_tic": ("tic", np.greater_equal),
+    "max_tic": ("tic", np.less_equal),
+    "min_base_peak_mz": ("base_peak_mz", np.greater_equal),
+    "max_base_peak_mz": ("base_peak_mz", np.less_equal),
+    "min_base_peak_intensity": ("base_peak_intensity", np.greater_equal),
+    "max_base_peak_intensity": ("base_peak_intensity", np.less_equal),
+    "min_precursor_mz": ("precursor_mz", np.greater_equal),
+    "max_precursor_mz": ("precursor_mz", np.less_equal),
+    "from": ("time", np.greater_equal),
+    "to": ("time", np.less_equal),
+}
+
+
+def polarity_code(value):
+    if value is None:
+        return 0
+    return POLARITY_CODES.get(str(value).strip().lower(), 0)
+
+
+def scan_key(scan_data):
+    """``(stream_id, scan_number)``: scans of different detector streams never collide."""
+    return scan_data.get('stream_id'), int(scan_data.get('scan_number', 0))
+
+
+def precursor_of(scan_data):
+    value = scan_data.get('precursor_mz')
+    if value is None:
+        value = (scan_data.get('metadata') or {}).get('precursor_mz')
+    return float(value) if value is not None else math.nan
+
+
+def scan_row(scan_data, t, stream):
+    """Column values of one scan payload (summary block included at ingest)."""
+    summary = scan_data.get('summary') or {}
+    return (t, int(scan_data.get('scan_number', 0)), stream, int(scan_data.get('ms_order') or 1),
+            polarity_code(scan_data.get('polarity')),
+            float(summary.get('tic') or 0.0),
+            float(summary['base_peak_mz']) if summary.get('base_peak_mz') is not None else math.nan,
+            float(summary.get('base_peak_intensity') or 0.0),
+            precursor_of(scan_data))
+
+
+def parse_query(args, now):
+    """Validated filter criteria from query arguments or a JSON body.
+
+    ``ms_order`` takes one order or a list (``"2"``, ``"1,2"``, ``[1, 2]``),
+    ``polarity`` takes ``positive``/``negative``, the ``min_*``/``max_*``
+    bounds are numbers, ``from``/``to`` are epoch seconds and ``last`` is a
+    window in seconds ending at ``now``. Raises ``ValueError`` on bad input.
+    """
+    criteria = {}
+    ms_order = args.get('ms_order')
+    if ms_order not in (None, ""):
+        orders = ms_order if isinstance(ms_order, list) else str(ms_order).split(",")
+        criteria["ms_order"] = [int(order) for order in orders]
+    polarity = args.get('polarity')
+    if polarity not in (None, ""):
+        code = polarity_code(polarity)
+        if code == 0:
+            raise ValueError("polarity must be positive or negative")
+        criteria["polarity"] = code
+    for name in RANGE_FILTERS:
+        value = args.get(name)
+        if value not in (None, ""):
+            criteria[name] = float(value)
+    last = args.get('last')
+    if last not in (None, ""):
+        criteria["from"] = max(criteria.get("from", -math.inf), now - float(last))
+    return criteria
+
+
+class ScanColumns:
+    """Append-only metadata rows of one session's scans, keyed by ``scan_key``."""
+
+    def __init__(self, capacity=1024):
+        self.rows = np.zeros(capacity, dtype=ROW_DTYPE)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.size = 0
+        self.dead = 0
+        self.row_of = {}    # (stream_id, scan_number) -> row
+        self.stream_ids = []     # stream code -> stream_id
+        self.stream_codes = {}   # stream_id -> stream code
+
+    def stream_code(self, stream_id):
+        code = self.stream_codes.get(stream_id)
+        if code is None:
+            code = self.stream_codes[stream_id] = len(self.stream_ids)
+            self.stream_ids.append(stream_id)
+        return code
+
+    def add(self, scan_data, t):
+        key = scan_key(scan_data)
+        self.remove(key)
+        if self.size == self.rows.size:
+            self._grow()
+        self.rows[self.size] = scan_row(scan_data, t, self.stream_code(key[0]))
+        self.alive[self.size] = True
+        self.row_of[key] = self.size
+        self.size += 1
+
+    def remove(self, key):
+        row = self.row_of.pop(key, None)
+        if row is None:
+            return
+        self.alive[row] = False
+        self.dead += 1
+        if self.dead * 2 > self.size and self.size > 64:
+            self._compact()
+
+    def _grow(self):
+        self.rows = np.concatenate((self.rows, np.zeros(self.rows.size, dtype=ROW_DTYPE)))
+        self.alive = np.concatenate((self.alive, np.zeros(self.alive.size, dtype=bool)))
+
+    def _compact(self):
+        keep = np.flatnonzero(self.alive[:self.size])
+        n = keep.size
+        self.rows[:n] = self.rows[keep]
+        self.alive[:n] = True
+        self.alive[n:self.size] = False
+        self.size = n
+        self.dead = 0
+        self.row_of = {(self.stream_ids[stream], int(number)): i
+                       for i, (stream, number) in enumerate(zip(self.rows["stream"][:n], self.rows["scan_number"][:n]))}
+
+    def select(self, criteria):
+        """Matching rows (structured array) in time order."""
+        rows = self.rows[:self.size]
+        mask = self.alive[:self.size].copy()
+        if "ms_order" in criteria:
+            mask &= np.isin(rows["ms_order"], criteria["ms_order"])
+        if "polarity" in criteria:
+            mask &= rows["polarity"] == criteria["polarity"]
+        for name, (column, compare) in RANGE_FILTERS.items():
+            if name in criteria:
+                # NaN (e.g. no precursor on MS1) never satisfies a bound
+                mask &= compare(rows[column], criteria[name])
+        matched = rows[mask]
+        return matched[np.argsort(matched["time"], kind="stable")]
+
+
+def row_dict(row, session_id, stream_id=None):
+    """JSON-ready summary of one matched row."""
+    polarity = int(row["polarity"])
+    precursor = float(row["precursor_mz"])
+    base_peak = float(row["base_peak_mz"])
+    return {
+        "session_id": session_id,
+        "stream_id": stream_id,
+        "scan_number": int(row["scan_number"]),
+        "time": float(row["time"]),
+        "ms_order": int(row["ms_order"]),
+        "polarity": "Positive" if polarity > 0 else "Negative" if polarity < 0 else None,
+        "tic": float(row["tic"]),
+        "base_peak_mz": None if math.isnan(base_peak) else base_peak,
+        "base_peak_intensity": float(row["base_peak_intensity"]),
+        "precursor_mz": None if math.isnan(precursor) else precursor,
+    }
+
+
+class PrecursorIndex:
+    """MS2+ scan keys of one session sorted by precursor m/z.
+
+    Kept as two parallel lists updated with ``bisect`` at ingest, so a
+    lookup for ``mz ± ppm`` is two bisections plus the matching entries.
+    """
+
+    def __init__(self):
+        self.mzs = []
+        self.keys = []
+        self.precursor_of = {}    # (stream_id, scan_number) -> precursor m/z
+
+    def __len__(self):
+        return len(self.mzs)
+
+    def add(self, scan_data):
+        key = scan_key(scan_data)
+        self.remove(key)
+        if int(scan_data.get('ms_order') or 1) < 2:
+            return
+        mz = precursor_of(scan_data)
+        if math.isnan(mz):
+            return
+        i = bisect.bisect_right(self.mzs, mz)
+        self.mzs.insert(i, mz)
+        self.keys.insert(i, key)
+        self.precursor_of[key] = mz
+
+    def remove(self, key):
+        mz = self.precursor_of.pop(key, None)
+        if mz is None:
+            return
+        i = bisect.bisect_left(self.mzs, mz)
+        while self.keys[i] != key:
+            i += 1
+        del self.mzs[i]
+        del self.keys[i]
+
+    def lookup(self, mz, ppm):
+        """``(precursor_mz, scan_key)`` pairs within ``ppm`` of ``mz``."""
+        tolerance = mz * ppm * 1e-6
+        lo = bisect.bisect_left(self.mzs, mz - tolerance)
+        hi = bisect.bisect_right(self.mzs, mz + tolerance, lo)
+        return list(zip(self.mzs[lo:hi], self.keys[lo:hi]))
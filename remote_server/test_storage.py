@@ -0,0 +1,87 @@
+"""
+Tests for the relay's in-memory scan storage
+"""
+
+from datetime import datetime
+
+import app as relay
+from app import DataStorage
+
+
+def make_scan(session_id, scan_number, t, stream_id=None, **fields):
+    return dict({
+        "session_id": session_id,
+        "stream_id": stream_id,
+        "scan_number": scan_number,
+        "timestamp": datetime.fromtimestamp(t).isoformat(),
+        "masses": [100.0, 200.0],
+        "intensities": [1.0, 2.0]
+    }, **fields)
+
+
+def test_retention_keeps_interleaved_live_sessions():
+    storage = DataStorage()
+    storage.max_scans_to_keep = 20
+    for i in range(40):
+        storage.add_scan(make_scan("instA", i, 1000 + i))
+        storage.add_scan(make_scan("instB", i, 1000 + i + 0.5))
+    scans = {p.session_id: len(p.scans) for p in storage.sessions.values()}
+    assert scans == {"instA": 10, "instB": 10}
+    assert storage.scan_count == 20
+    assert storage.sessions_evicted == 0
+
+
+def test_retention_evicts_idle_sessions_whole():
+    storage = DataStorage()
+    storage.max_scans_to_keep = 20
+    storage.session_idle_seconds = 0
+    for i in range(15):
+        storage.add_scan(make_scan("old", i, 1000 + i))
+    for i in range(10):
+        storage.add_scan(make_scan("new", i, 2000 + i))
+    assert list(storage.sessions) == ["new"]
+    assert storage.scan_count == 10
+    assert storage.sessions_evicted == 1
+
+
+def test_time_average_uses_every_session(monkeypatch):
+    storage = DataStorage()
+    for i in range(3):
+        storage.add_scan(make_scan("instA", i, 1000 + i))
+        storage.add_scan(make_scan("instB", i, 1000 + i + 0.5))
+    monkeypatch.setattr(relay, "data_storage", storage)
+    client = relay.app.test_client()
+    average = client.get("/api/data/average/time?from=999&to=1010").get_json()["average"]
+    assert average["scan_count"] == 6
+    assert average["session_ids"] == ["instA", "instB"]
+    average = client.get("/api/data/average/time?from=999&to=1010&session_id=instB").get_json()["average"]
+    assert average["scan_count"] == 3
+    assert average["session_ids"] == ["instB"]
+    assert client.get("/api/data/average/time?from=inf&to=1010").status_code == 400
+
+
+def test_query_rejects_non_object_body():
+    client = relay.app.test_client()
+    for body in ([1, 2], "x", 3):
+        response = client.post("/api/query", json=body)
+        assert response.status_code == 400
+        assert response.get_json()["error"] == "Invalid query: body must be a JSON object"
+
+
+def test_same_scan_number_from_two_streams_of_one_session():
+    storage = DataStorage()
+    first = make_scan("run", 5, 1000, "inst/0", ms_order=2, precursor_mz=500.0)
+    second = make_scan("run", 5, 1001, "inst/1", ms_order=2, precursor_mz=500.0)
+    storage.add_scan(first)
+    storage.add_scan(second)
+    assert storage.scan_count == 2
+    assert storage.get_scan(5, "run", "inst/0") is first
+    assert storage.get_scan(5, "run", "inst/1") is second
+    # Without a stream, the stream written last
+    assert storage.get_scan(5, "run") is second
+    assert storage.query_time(999, 1002) == [first, second]
+    assert [scan for _, scan in storage.precursor_scans(500.0, 10)] == [first, second]
+    results, total = storage.query({"ms_order": [2]}, include_scans=True)
+    assert total == 2
+    assert [(r["stream_id"], r["scan"]) for r in results] == [("inst/0", first), ("inst/1", second)]
+    assert storage.describe_session("run")["stream_ids"] == ["inst/0", "inst/1"]
@@ -0,0 +1,45 @@
+"""
+Tests for scan fan-out and reconnect replay
+"""
+
+from cluster import LocalBus
+from scan_streaming import ScanFanout, next_event_id, parse_stream_options
+
+
+class RecordingSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, event, payload, to=None):
+        self.emitted.append((event, payload, to))
+
+
+def test_resume_on_another_fanout_sharing_a_bus():
+    # Two relay workers: each applies bus scans to its own fan-out
+    first, second = ScanFanout(RecordingSocketIO()), ScanFanout(RecordingSocketIO())
+    bus = LocalBus().start(lambda scan, replay: (first.publish(scan), second.publish(scan)))
+    seen = []
+    for scan_number in range(1, 6):
+        scan = {"scan_number": scan_number, "masses": [100.0], "intensities": [1.0],
+                "event_id": next_event_id()}
+        bus.publish(scan)
+        seen.append(scan["event_id"])
+
+    # A client that saw scan 2 on the first worker reconnects to the second
+    subscriber, missed = second.subscribe_sse(parse_stream_options(None), last_event_id=seen[1])
+    assert [message.split("\n")[0] for message in missed] == [f"id: {event_id}" for event_id in seen[2:]]
+    assert second.resyncs == 0
+
+    # Socket.IO resume on the second worker
+    sio = second.socketio
+    replayed, complete = second.replay_socket("sid", parse_stream_options(None), seen[3])
+    assert (replayed, complete) == (1, True)
+    assert sio.emitted[-1][1]["event_id"] == seen[4]
+
+
+def test_publish_assigns_an_id_when_missing():
+    fanout = ScanFanout(RecordingSocketIO())
+    fanout.publish({"scan_number": 1, "masses": [], "intensities": []})
+    fanout.publish({"scan_number": 2, "masses": [], "intensities": []})
+    first, second = [event_id for event_id, _, _ in fanout.replay]
+    assert second > first
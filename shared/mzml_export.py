@@ -0,0 +1,561 @@
+"""
+Incremental mzML export of acquisition sessions.
+
+Every session (``session_id``) is written to its own indexed mzML file as
+scans arrive. Each spectrum is encoded and appended right away:
+
+- m/z as 64-bit floats and intensities as 32-bit floats,
+- zlib-compressed and base64-encoded.
+
+The only per-spectrum state kept is its byte offset, and that goes to a
+sidecar file, so memory use does not grow with run length. Scans are handed
+over with ``submit`` and written by a background thread, so ingest never
+waits on compression or disk; a full queue drops the scan and counts it.
+
+When a session is closed (explicitly, after ``idle_seconds`` without scans,
+shortly after its acquisition ends, or at exit), the writer does three
+things:
+
+1. patches the spectrum count into the fixed-width placeholder,
+2. streams the offset index in from the sidecar,
+3. appends the SHA-1 checksum.
+
+It then renames ``<session>.mzML.part`` to ``<session>.mzML``. Next to it,
+``<session>.mzML.times.npy`` holds each spectrum's epoch time and byte
+offset, sorted by time. ``query_time`` bisects it and reads back only the
+spectra inside a time window, so the finished files double as an on-disk
+archive of the scans.
+
+With several relay workers, every worker sees every scan. Only the worker
+holding the export directory's lock file writes; the others just list and
+serve the files.
+"""
+
+import os
+import re
+import glob
+import zlib
+import queue
+import base64
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime
+from xml.etree import ElementTree
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+
+from scan_tracking import scan_time
+
+try:
+    import fcntl
+except ImportError:  # Windows: a single process, always the writer
+    fcntl = None
+
+PART_SUFFIX = ".part"
+COUNT_WIDTH = 10
+ENDED_GRACE_SECONDS = 2.0
+TIMES_SUFFIX = ".times.npy"
+TIME_INDEX_DTYPE = np.dtype([("time", "<f8"), ("offset", "<i8")])
+SAFE_NAME = re.compile(r"[^A-Za-z0-9_.-]")
+SCAN_ID = re.compile(r"controllerNumber=(\d+) scan=(\d+)")
+RUN_ID = re.compile(rb'<run id="([^"]*)"')
+# Dissociation method terms, by the ``activation`` name scans carry
+ACTIVATION_TERMS = {
+    "CID": ("MS:1000133", "collision-induced dissociation"),
+    "HCD": ("MS:1000422", "beam-type collision-induced dissociation"),
+    "ETD": ("MS:1000598", "electron transfer dissociation"),
+    "ECD": ("MS:1000250", "electron capture dissociation"),
+    "EThcD": ("MS:1002631", "electron-transfer/higher-energy collision dissociation"),
+}
+
+HEADER = """<?xml version="1.0" encoding="utf-8"?>
+<indexedmzML xmlns="http://psi.hupo.org/ms/mzml" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://psi.hupo.org/ms/mzml http://psidev.info/files/ms/mzML/xsd/mzML1.1.2_idx.xsd">
+  <mzML xmlns="http://psi.hupo.org/ms/mzml" xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" xsi:schemaLocation="http://psi.hupo.org/ms/mzml http://psidev.info/files/ms/mzML/xsd/mzML1.1.0.xsd" id={run_id} version="1.1.0">
+    <cvList count="2">
+      <cv id="MS" fullName="Proteomics Standards Initiative Mass Spectrometry Ontology" version="4.1.0" URI="https://raw.githubusercontent.com/HUPO-PSI/psi-ms-CV/master/psi-ms.obo"/>
+      <cv id="UO" fullName="Unit Ontology" version="09:04:2014" URI="https://raw.githubusercontent.com/bio-ontology-research-group/unit-ontology/master/unit.obo"/>
+    </cvList>
+    <fileDescription>
+      <fileContent>
+        <cvParam cvRef="MS" accession="MS:1000579" name="MS1 spectrum" value=""/>
+        <cvParam cvRef="MS" accession="MS:1000580" name="MSn spectrum" value=""/>
+        <cvParam cvRef="MS" accession="MS:1000127" name="centroid spectrum" value=""/>
+      </fileContent>
+    </fileDescription>
+    <softwareList count="1">
+      <software id="RemoteMSViewer" version="1.0">
+        <cvParam cvRef="MS" accession="MS:1000799" name="custom unreleased software tool" value="RemoteMSViewer"/>
+      </software>
+    </softwareList>
+    <instrumentConfigurationList count="1">
+      <instrumentConfiguration id="IC1">
+        <cvParam cvRef="MS" accession="MS:1000483" name="Thermo Fisher Scientific instrument model" value=""/>
+      </instrumentConfiguration>
+    </instrumentConfigurationList>
+    <dataProcessingList count="1">
+      <dataProcessing id="export">
+        <processingMethod order="1" softwareRef="RemoteMSViewer">
+          <cvParam cvRef="MS" accession="MS:1000544" name="Conversion to mzML" value=""/>
+        </processingMethod>
+      </dataProcessing>
+    </dataProcessingList>
+    <run id={run_id} defaultInstrumentConfigurationRef="IC1" startTimeStamp={start}>
+      <spectrumList count="{count}" defaultDataProcessingRef="export">
+"""
+
+FOOTER = """      </spectrumList>
+    </run>
+  </mzML>
+"""
+
+
+def cv(accession, name, value="", unit=None):
+    unit_attrs = ""
+    if unit is not None:
+        unit_cv = unit[0].split(":")[0]
+        unit_attrs = f' unitCvRef="{unit_cv}" unitAccession="{unit[0]}" unitName="{unit[1]}"'
+    return f'<cvParam cvRef="{accession.split(":")[0]}" accession="{accession}" name="{name}" value={quoteattr(str(value))}{unit_attrs}/>'
+
+
+def encode_array(values, dtype):
+    """zlib-compressed, base64-encoded little-endian binary array."""
+    return base64.b64encode(zlib.compress(np.asarray(values, dtype=dtype).astype(dtype).tobytes())).decode("ascii")
+
+
+def binary_array(values, dtype, array_cv, unit):
+    data = encode_array(values, "<f8" if dtype == 64 else "<f4")
+    precision = cv("MS:1000523", "64-bit float") if dtype == 64 else cv("MS:1000521", "32-bit float")
+    return (f'<binaryDataArray encodedLength="{len(data)}">'
+            f'{precision}{cv("MS:1000574", "zlib compression")}{cv(array_cv[0], array_cv[1], unit=unit)}'
+            f'<binary>{data}</binary></binaryDataArray>')
+
+
+def spectrum_id(scan_data):
+    """Thermo nativeID format, one controller per detector stream."""
+    controller = int(scan_data.get('detector') or 0) + 1
+    return f"controllerType=0 controllerNumber={controller} scan={int(scan_data.get('scan_number', 0))}"
+
+
+def render_spectrum(scan_data, index):
+    """One ``<spectrum>`` element for a scan payload."""
+    masses = scan_data.get('masses') or []
+    intensities = scan_data.get('intensities') or []
+    metadata = scan_data.get('metadata') or {}
+    summary = scan_data.get('summary') or {}
+    ms_order = int(scan_data.get('ms_order') or metadata.get('ms_order') or 1)
+    polarity = scan_data.get('polarity')
+
+    params = [cv("MS:1000511", "ms level", ms_order),
+              cv("MS:1000579", "MS1 spectrum") if ms_order == 1 else cv("MS:1000580", "MSn spectrum"),
+              cv("MS:1000127", "centroid spectrum")]
+    if polarity == "Positive":
+        params.append(cv("MS:1000130", "positive scan"))
+    elif polarity == "Negative":
+        params.append(cv("MS:1000129", "negative scan"))
+    if summary.get('point_count'):
+        params += [cv("MS:1000285", "total ion current", summary['tic']),
+                   cv("MS:1000504", "base peak m/z", summary['base_peak_mz'], ("MS:1000040", "m/z")),
+                   cv("MS:1000505", "base peak intensity", summary['base_peak_intensity'],
+                      ("MS:1000131", "number of detector counts")),
+                   cv("MS:1000528", "lowest observed m/z", summary['mz_min'], ("MS:1000040", "m/z")),
+                   cv("MS:1000527", "highest observed m/z", summary['mz_max'], ("MS:1000040", "m/z"))]
+
+    scan_params = []
+    if metadata.get('retention_time') is not None:
+        scan_params.append(cv("MS:1000016", "scan start time", metadata['retention_time'], ("UO:0000031", "minute")))
+    if metadata.get('injection_time') is not None:
+        scan_params.append(cv("MS:1000927", "ion injection time", metadata['injection_time'], ("UO:0000028", "millisecond")))
+    if scan_data.get('timestamp'):
+        scan_params.append(f'<userParam name="timestamp" value={quoteattr(str(scan_data["timestamp"]))} type="xsd:string"/>')
+
+    precursor = ""
+    precursor_mz = scan_data.get('precursor_mz', metadata.get('precursor_mz'))
+    if ms_order > 1 and precursor_mz is not None:
+        ion = [cv("MS:1000744", "selected ion m/z", precursor_mz, ("MS:1000040", "m/z"))]
+        if metadata.get('precursor_charge') is not None:
+            ion.append(cv("MS:1000041", "charge state", metadata['precursor_charge']))
+        # The dissociation method is left out when the scan did not report it
+        activation = ACTIVATION_TERMS.get(scan_data.get('activation'))
+        precursor = ('<precursorList count="1"><precursor><selectedIonList count="1"><selectedIon>'
+                     + "".join(ion) + '</selectedIon></selectedIonList>'
+                     + f'<activation>{cv(*activation) if activation else ""}</activation>'
+                     + '</precursor></precursorList>')
+
+    arrays = (binary_array(masses, 64, ("MS:1000514", "m/z array"), ("MS:1000040", "m/z"))
+              + binary_array(intensities, 32, ("MS:1000515", "intensity array"), ("MS:1000131", "number of detector counts")))
+    return (f'        <spectrum index="{index}" id={quoteattr(spectrum_id(scan_data))} defaultArrayLength="{len(masses)}">'
+            + "".join(params)
+            + f'<scanList count="1">{cv("MS:1000795", "no combination")}<scan>{"".join(scan_params)}</scan></scanList>'
+            + precursor
+            + f'<binaryDataArrayList count="2">{arrays}</binaryDataArrayList></spectrum>\n')
+
+
+def decode_array(element):
+    """Values of a ``<binaryDataArray>`` written by ``binary_array``."""
+    accessions = {param.get("accession") for param in element.iter("cvParam")}
+    dtype = "<f8" if "MS:1000523" in accessions else "<f4"
+    data = base64.b64decode(element.findtext("binary") or "")
+    if "MS:1000574" in accessions:
+        data = zlib.decompress(data)
+    return accessions, np.frombuffer(data, dtype=dtype)
+
+
+def parse_spectrum(element_bytes, session_id):
+    """Scan payload (arrays, order, polarity, time, precursor, activation) from one ``<spectrum>`` element."""
+    spectrum = ElementTree.fromstring(element_bytes)
+    scan_data = {"session_id": session_id, "metadata": {}}
+    match = SCAN_ID.search(spectrum.get("id", ""))
+    if match:
+        scan_data["detector"] = int(match.group(1)) - 1
+        scan_data["scan_number"] = int(match.group(2))
+    params = {param.get("accession"): param.get("value") for param in spectrum.iter("cvParam")}
+    scan_data["ms_order"] = int(params.get("MS:1000511") or 1)
+    scan_data["polarity"] = ("Positive" if "MS:1000130" in params
+                             else "Negative" if "MS:1000129" in params else None)
+    if params.get("MS:1000016") is not None:
+        scan_data["metadata"]["retention_time"] = float(params["MS:1000016"])
+    if params.get("MS:1000744") is not None:
+        scan_data["precursor_mz"] = float(params["MS:1000744"])
+    if params.get("MS:1000041") is not None:
+        scan_data["metadata"]["precursor_charge"] = int(params["MS:1000041"])
+    for name, (accession, _) in ACTIVATION_TERMS.items():
+        if accession in params:
+            scan_data["activation"] = name
+    for param in spectrum.iter("userParam"):
+        if param.get("name") == "timestamp":
+            scan_data["timestamp"] = param.get("value")
+    for array in spectrum.iter("binaryDataArray"):
+        accessions, values = decode_array(array)
+        if "MS:1000514" in accessions:
+            scan_data["masses"] = values.tolist()
+        elif "MS:1000515" in accessions:
+            scan_data["intensities"] = values.tolist()
+    return scan_data
+
+
+def read_element(f, offset, chunk_size=1 << 16):
+    """Bytes of the ``<spectrum>`` element starting at ``offset``."""
+    f.seek(offset)
+    data = b""
+    while True:
+        chunk = f.read(chunk_size)
+        if not chunk:
+            raise ValueError(f"Unterminated spectrum at offset {offset}")
+        # Only the new chunk (plus a tag's length of overlap) can hold the end tag
+        start = max(0, len(data) - len(b"</spectrum>"))
+        data += chunk
+        end = data.find(b"</spectrum>", start)
+        if end >= 0:
+            return data[:end + len(b"</spectrum>")]
+
+
+class MzMLWriter:
+    """Appends spectra to one ``.mzML.part`` file and finalizes it into an indexed mzML."""
+
+    def __init__(self, path, run_id):
+        self.path = path
+        self.part_path = path + PART_SUFFIX
+        self.index_path = path + ".idx" + PART_SUFFIX
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.count = 0
+        self.bytes_written = 0
+        self.opened_at = time.time()
+        self.last_write = self.opened_at
+        self.closed = False
+        self.ended = False
+        self.last_time = None
+        self.time_sorted = True
+
+        self.file = open(self.part_path, "wb")
+        self.index_file = open(self.index_path, "w", encoding="utf-8")
+        header = HEADER.format(run_id=quoteattr(run_id), start=quoteattr(datetime.now().isoformat(timespec="seconds")),
+                               count="0" * COUNT_WIDTH)
+        head = header.encode("utf-8")
+        # The count placeholder is patched in place at close
+        self.count_offset = head.index(b'<spectrumList count="') + len(b'<spectrumList count="')
+        self._write(head)
+
+    def _write(self, data):
+        self.file.write(data)
+        self.bytes_written += len(data)
+
+    def write(self, scan_data):
+        with self.lock:
+            if self.closed:
+                return False
+            offset = self.bytes_written
+            element = render_spectrum(scan_data, self.count).encode("utf-8")
+            self._write(element)
+            # Offsets of the spectrum start tag, collected on disk for the index
+            t = scan_time(scan_data)
+            t = self.last_write if t is None else t
+            self.index_file.write(f"{spectrum_id(scan_data)}\t{offset + element.index(b'<spectrum')}\t{t!r}\n")
+            if self.last_time is not None and t < self.last_time:
+                self.time_sorted = False
+            self.last_time = t
+            self.count += 1
+            self.last_write = time.time()
+            return True
+
+    def close(self):
+        """Write the index and checksum, then move the file into place."""
+        with self.lock:
+            if self.closed:
+                return self.path
+            self.closed = True
+            self._write(FOOTER.encode("utf-8") + b"  ")
+            index_offset = self.bytes_written
+            self._write(b'<indexList count="1">\n    <index name="spectrum">\n')
+            self.index_file.close()
+            # The time index is memory-mapped while it is filled, so it costs no RAM either
+            times_part = self.path + TIMES_SUFFIX + PART_SUFFIX
+            times = np.lib.format.open_memmap(times_part, mode="w+", dtype=TIME_INDEX_DTYPE, shape=(self.count,))
+            with open(self.index_path, "r", encoding="utf-8") as index:
+                for i, line in enumerate(index):
+                    ref, offset, t = line.rstrip("\n").split("\t")
+                    self._write(f'      <offset idRef={quoteattr(ref)}>{offset}</offset>\n'.encode("utf-8"))
+                    times[i] = (float(t), int(offset))
+            if not self.time_sorted:
+                times.sort(order="time")
+            times.flush()
+            del times
+            self._write(f'    </index>\n  </indexList>\n  <indexListOffset>{index_offset}</indexListOffset>\n'
+                        f'  <fileChecksum>'.encode("utf-8"))
+            self.file.seek(self.count_offset)
+            self.file.write(str(self.count).zfill(COUNT_WIDTH).encode("ascii"))
+            self.file.close()
+
+            # The checksum covers the file up to and including "<fileChecksum>"
+            sha1 = hashlib.sha1()
+            with open(self.part_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    sha1.update(chunk)
+            with open(self.part_path, "ab") as f:
+                f.write(f"{sha1.hexdigest()}</fileChecksum>\n</indexedmzML>\n".encode("utf-8"))
+            os.remove(self.index_path)
+            os.replace(times_part, self.path + TIMES_SUFFIX)
+            os.replace(self.part_path, self.path)
+            logging.info(f"Finished mzML export {self.path} ({self.count} spectra)")
+            return self.path
+
+    def describe(self):
+        return {
+            "spectra": self.count,
+            "bytes": self.bytes_written,
+            "opened_at": datetime.fromtimestamp(self.opened_at).isoformat(),
+            "last_write": datetime.fromtimestamp(self.last_write).isoformat(),
+            "complete": self.closed
+        }
+
+
+class MzMLExporter:
+    """Routes scans to one ``MzMLWriter`` per session and closes idle sessions."""
+
+    def __init__(self, directory=None, idle_seconds=60.0, queue_size=1000):
+        self.directory = os.path.abspath(directory) if directory else None
+        self.idle_seconds = idle_seconds
+        self.lock = threading.Lock()
+        self.writers = {}    # session_id -> MzMLWriter
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.is_writer = False
+        self.lock_file = None
+        self.stats = {"spectra": 0, "files_finished": 0, "errors": 0, "dropped": 0, "archive_reads": 0}
+        self.time_indexes = {}    # path -> (mtime, session_id, memory-mapped time index)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.is_writer = self._acquire_writer_lock()
+            if self.is_writer:
+                threading.Thread(target=self._drain, daemon=True).start()
+                threading.Thread(target=self._reap_idle, daemon=True).start()
+                atexit.register(self.close_all)
+
+    @classmethod
+    def from_env(cls):
+        return cls(directory=os.environ.get("MZML_EXPORT_DIR") or None,
+                   idle_seconds=float(os.environ.get("MZML_EXPORT_IDLE_SECONDS", 60.0)),
+                   queue_size=int(os.environ.get("MZML_EXPORT_QUEUE", 1000)))
+
+    @property
+    def enabled(self):
+        return self.directory is not None
+
+    def _acquire_writer_lock(self):
+        if fcntl is None:
+            return True
+        self.lock_file = open(os.path.join(self.directory, ".export.lock"), "w")
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            logging.info("Another process writes the mzML exports; this one only serves them")
+            return False
+
+    def file_name(self, session_id):
+        return SAFE_NAME.sub("_", str(session_id or "default")) + ".mzML"
+
+    def submit(self, scan_data):
+        """Queue a scan for export without blocking the caller."""
+        if not self.is_writer:
+            return
+        try:
+            self.queue.put_nowait(scan_data)
+        except queue.Full:
+            self.stats["dropped"] += 1
+
+    def finish(self, session_id):
+        """The session's acquisition has ended: close its file once scans stop arriving.
+
+        Scans still in flight (queued here or on their way from the backend)
+        can arrive after the end notice, so the file is closed after
+        ``ENDED_GRACE_SECONDS`` without scans instead of right away.
+        """
+        with self.lock:
+            writer = self.writers.get(session_id)
+            if writer is not None:
+                writer.ended = True
+
+    def _drain(self):
+        while True:
+            self.add_scan(self.queue.get())
+
+    def _free_path(self, session_id):
+        """Path for a new file; a session resumed after finishing gets a numbered continuation."""
+        base = self.file_name(session_id)[:-len(".mzML")]
+        path, part = os.path.join(self.directory, base + ".mzML"), 1
+        while os.path.exists(path):
+            part += 1
+            path = os.path.join(self.directory, f"{base}-{part}.mzML")
+        return path
+
+    def add_scan(self, scan_data):
+        """Write a scan to its session's file on the calling thread."""
+        if not self.is_writer:
+            return
+        session_id = scan_data.get('session_id') or "default"
+        try:
+            with self.lock:
+                writer = self.writers.get(session_id)
+                if writer is None:
+                    writer = MzMLWriter(self._free_path(session_id), str(session_id))
+                    self.writers[session_id] = writer
+                    logging.info(f"Exporting session {session_id} to {writer.part_path}")
+            if writer.write(scan_data):
+                self.stats["spectra"] += 1
+        except Exception as e:
+            self.stats["errors"] += 1
+            logging.error(f"Error exporting scan to mzML: {e}")
+
+    def close_session(self, session_id):
+        """Finalize a session's file; returns its path or ``None`` if it was not being written."""
+        with self.lock:
+            writer = self.writers.pop(session_id, None)
+        if writer is None:
+            return None
+        path = writer.close()
+        self.stats["files_finished"] += 1
+        return path
+
+    def close_all(self):
+        # Write what is still queued before finishing the files
+        while True:
+            try:
+                self.add_scan(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for session_id in list(self.writers):
+            try:
+                self.close_session(session_id)
+            except Exception as e:
+                logging.error(f"Error finishing mzML export of {session_id}: {e}")
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(min(self.idle_seconds, ENDED_GRACE_SECONDS))
+            now = time.time()
+            with self.lock:
+                idle = [s for s, w in self.writers.items()
+                        if now - w.last_write >= (ENDED_GRACE_SECONDS if w.ended else self.idle_seconds)]
+            for session_id in idle:
+                try:
+                    self.close_session(session_id)
+                except Exception as e:
+                    logging.error(f"Error finishing mzML export of {session_id}: {e}")
+
+    def list_exports(self):
+        """Finished files and sessions still being written."""
+        if not self.enabled:
+            return []
+        exports = []
+        with self.lock:
+            writing = {os.path.basename(w.path): (s, w.describe()) for s, w in self.writers.items()}
+        for name in sorted(os.listdir(self.directory)):
+            if name.endswith(".mzML") and name not in writing:
+                path = os.path.join(self.directory, name)
+                exports.append({"file": name, "bytes": os.path.getsize(path), "complete": True,
+                                "modified": datetime.fromtimestamp(os.path.getmtime(path)).isoformat()})
+            elif name.endswith(".mzML" + PART_SUFFIX) and name[:-len(PART_SUFFIX)] not in writing:
+                # Written by another worker (or left over from a crash)
+                exports.append({"file": name[:-len(PART_SUFFIX)], "bytes": os.path.getsize(os.path.join(self.directory, name)),
+                                "complete": False})
+        for name, (session_id, described) in writing.items():
+            exports.append(dict(described, file=name, session_id=session_id))
+        return exports
+
+    def finished_path(self, file_name):
+        """Absolute path of a finished export, or ``None``."""
+        if not self.enabled or SAFE_NAME.search(file_name) or not file_name.endswith(".mzML"):
+            return None
+        path = os.path.join(self.directory, file_name)
+        return path if os.path.isfile(path) else None
+
+    def _time_index(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self.time_indexes.get(path)
+        if cached is None or cached[0] != mtime:
+            with open(path, "rb") as f:
+                match = RUN_ID.search(f.read(1 << 12))
+            session_id = match.group(1).decode("utf-8") if match else None
+            times = np.load(path + TIMES_SUFFIX, mmap_mode="r")
+            cached = self.time_indexes[path] = (mtime, session_id, times)
+        return cached[1], cached[2]
+
+    def query_time(self, start_time=None, end_time=None, session_id=None, limit=None):
+        """Scans from finished exports with start_time <= time <= end_time (epoch seconds), oldest first.
+
+        Each file's time index is bisected and only the matching spectra are
+        read from disk: O(log n + k) per file.
+        """
+        if not self.enabled:
+            return []
+        found = []    # (time, scan payload)
+        for path in sorted(glob.glob(os.path.join(glob.escape(self.directory), "*.mzML"))):
+            if not os.path.exists(path + TIMES_SUFFIX):
+                continue
+            file_session, times = self._time_index(path)
+            if session_id is not None and file_session != session_id:
+                continue
+            column = times["time"]
+            lo = 0 if start_time is None else int(np.searchsorted(column, start_time, side="left"))
+            hi = column.size if end_time is None else int(np.searchsorted(column, end_time, side="right"))
+            if limit is not None:
+                hi = min(hi, lo + limit)
+            if lo >= hi:
+                continue
+            with open(path, "rb") as f:
+                for t, offset in times[lo:hi]:
+                    found.append((float(t), parse_spectrum(read_element(f, int(offset)), file_session)))
+            self.stats["archive_reads"] += hi - lo
+        found.sort(key=lambda item: item[0])
+        return [scan for _, scan in found[:limit]]
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats.update({"enabled": self.enabled, "directory": self.directory, "writer": self.is_writer,
+                      "open_sessions": len(self.writers), "queued": self.queue.qsize(),
+                      "idle_seconds": self.idle_seconds})
+        return stats
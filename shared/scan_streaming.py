@@ -0,0 +1,391 @@
+"""
+Per-subscriber fan-out of scan payloads.
+
+Subscribers declare options (e.g. summary-only, extended centroid
+columns, or an m/z window). Socket.IO clients with the same options share a room, SSE clients each get a bounded queue, and every
+scan is rendered and JSON-encoded once per distinct option set rather than
+once per client. An m/z window is cut from the sorted mass array with two
+binary searches, so a zoomed-in view receives only its slice of each scan.
+
+Every published scan carries an ``event_id``. It is assigned once where the
+scan enters the server (``next_event_id``) and travels with the scan, so
+every fan-out, and every relay worker behind the scan bus, knows a scan by
+the same ID; ``publish`` only assigns one when the scan has none. IDs are
+microseconds since the epoch, strictly increasing within a process, so they
+also keep increasing across restarts. Each fan-out keeps its recent scans, up
+to ``replay_size`` scans and about ``replay_bytes`` of point data. A client
+that reconnects with the last ID it saw (SSE ``Last-Event-ID``, or
+``last_event_id`` on Socket.IO) is sent only the scans it missed. A client
+that missed scans which are no longer buffered is sent what is left plus a
+``resync`` notice.
+"""
+
+import json
+import time
+import queue
+import bisect
+import logging
+import threading
+from collections import deque
+
+import numpy as np
+
+DEFAULT_TOP_N = 5
+# Payload keys holding per-point arrays, dropped from summary-only payloads
+ARRAY_KEYS = ('masses', 'intensities', 'server_centroids', 'centroid_columns')
+# Opt-in per-centroid columns, sent only to subscribers that request them
+EXTENDED_COLUMNS = ('charge', 'resolution', 'noise', 'baseline')
+# Scans kept per fan-out for clients that reconnect with their last event ID
+DEFAULT_REPLAY_SIZE = 500
+DEFAULT_REPLAY_BYTES = 64 * 1024 * 1024
+# Rough in-memory cost of one list value (float object plus list slot)
+REPLAY_BYTES_PER_VALUE = 32
+
+# Scans published before this process started cannot be replayed by it
+EVENT_ID_ORIGIN = time.time_ns() // 1000
+_last_event_id = EVENT_ID_ORIGIN
+_event_id_lock = threading.Lock()
+
+
+def next_event_id():
+    """A new event ID: epoch microseconds, strictly increasing within this process."""
+    global _last_event_id
+    with _event_id_lock:
+        _last_event_id = max(_last_event_id + 1, time.time_ns() // 1000)
+        return _last_event_id
+
+
+def scan_summary(masses, intensities, top_n=DEFAULT_TOP_N):
+    """TIC, base peak, m/z range, point count and the top-N peaks of a scan.
+
+    Top peaks are found with ``argpartition`` (O(n)) and only the N winners
+    are sorted, by descending intensity.
+    """
+    mz = np.asarray(masses, dtype=np.float64)
+    intensity = np.asarray(intensities, dtype=np.float64)
+    count = int(min(mz.size, intensity.size))
+    if count == 0:
+        return {
+            "point_count": 0,
+            "tic": 0.0,
+            "base_peak_mz": None,
+            "base_peak_intensity": 0.0,
+            "mz_min": None,
+            "mz_max": None,
+            "top_peaks": {"mz": [], "intensity": []}
+        }
+    mz, intensity = mz[:count], intensity[:count]
+
+    n = min(top_n, count)
+    top = np.argpartition(intensity, count - n)[count - n:]
+    top = top[np.argsort(intensity[top])[::-1]]
+
+    return {
+        "point_count": count,
+        "tic": float(intensity.sum()),
+        "base_peak_mz": float(mz[top[0]]),
+        "base_peak_intensity": float(intensity[top[0]]),
+        "mz_min": float(mz.min()),
+        "mz_max": float(mz.max()),
+        "top_peaks": {"mz": mz[top].tolist(), "intensity": intensity[top].tolist()}
+    }
+
+
+def add_summary(scan_data, top_n=DEFAULT_TOP_N):
+    """Attach a ``summary`` block to a scan payload unless it already has one."""
+    if 'summary' not in scan_data:
+        scan_data['summary'] = scan_summary(scan_data.get('masses', []),
+                                            scan_data.get('intensities', []),
+                                            top_n)
+    return scan_data
+
+
+def parse_mz_window(values):
+    """``(mz_min, mz_max)`` from ``mz_min``/``mz_max``; ``None`` when absent or invalid."""
+    try:
+        low = float(values['mz_min']) if values.get('mz_min') not in (None, '') else 0.0
+        high = float(values['mz_max']) if values.get('mz_max') not in (None, '') else float('inf')
+    except (TypeError, ValueError):
+        return None
+    if (low <= 0.0 and high == float('inf')) or low > high:
+        return None
+    return (low, high)
+
+
+def parse_stream_options(values):
+    """Normalise subscriber options from a Socket.IO payload or query args."""
+    values = values or {}
+    summary_only = str(values.get('summary_only', '')).lower() in ('1', 'true', 'yes', 'on') \
+        or values.get('mode') == 'summary'
+    columns = values.get('columns') or ()
+    if isinstance(columns, str):
+        columns = columns.split(',')
+    requested = {str(column).strip().lower() for column in columns}
+    return {
+        "mode": "summary" if summary_only else "full",
+        "columns": () if summary_only else tuple(c for c in EXTENDED_COLUMNS if c in requested),
+        "mz_window": None if summary_only else parse_mz_window(values)
+    }
+
+
+def parse_event_id(value):
+    """Event ID from a ``Last-Event-ID`` header or resume token; ``None`` if absent or malformed."""
+    try:
+        return int(str(value).strip()) if value not in (None, "") else None
+    except ValueError:
+        return None
+
+
+def sse_message(event_id, data, event=None):
+    """One Server-Sent Events message."""
+    head = f"event: {event}\n" if event else ""
+    if event_id is not None:
+        head += f"id: {event_id}\n"
+    return f"{head}data: {data}\n\n"
+
+
+def replay_cost(scan_data):
+    """Approximate memory held by a scan's per-point arrays."""
+    values = len(scan_data.get('masses') or ()) * (2 + len(scan_data.get('centroid_columns') or ()))
+    server = scan_data.get('server_centroids') or {}
+    values += 2 * len(server.get('masses') or ())
+    return values * REPLAY_BYTES_PER_VALUE
+
+
+def options_key(options, prefix=''):
+    key = f"{prefix}scans:{options['mode']}"
+    if options.get('columns'):
+        key += ":" + ",".join(options['columns'])
+    if options.get('mz_window'):
+        key += ":mz={!r}-{!r}".format(*options['mz_window'])
+    return key
+
+
+def window_bounds(masses, mz_window):
+    """Index range of the sorted ``masses`` inside ``mz_window``."""
+    low, high = mz_window
+    if isinstance(masses, np.ndarray):
+        return int(np.searchsorted(masses, low, side='left')), int(np.searchsorted(masses, high, side='right'))
+    # Payload arrays are lists: bisect them in place instead of converting
+    lo = bisect.bisect_left(masses, low)
+    return lo, bisect.bisect_right(masses, high, lo)
+
+
+def slice_window(scan_data, mz_window):
+    """Copy of a scan payload with its per-point arrays cut to ``mz_window``."""
+    masses = scan_data.get('masses')
+    if masses is None:
+        return scan_data
+    lo, hi = window_bounds(masses, mz_window)
+    payload = dict(scan_data)
+    payload['masses'] = masses[lo:hi]
+    payload['intensities'] = scan_data.get('intensities', [])[lo:hi]
+    columns = scan_data.get('centroid_columns')
+    if columns:
+        payload['centroid_columns'] = {name: values[lo:hi] for name, values in columns.items()}
+    server = scan_data.get('server_centroids')
+    if server and server.get('masses') is not None:
+        s_lo, s_hi = window_bounds(server['masses'], mz_window)
+        payload['server_centroids'] = dict(server, masses=server['masses'][s_lo:s_hi],
+                                           intensities=server['intensities'][s_lo:s_hi])
+    payload['mz_window'] = {"mz_min": mz_window[0], "mz_max": mz_window[1], "points": hi - lo,
+                            "points_total": len(masses)}
+    return payload
+
+
+def render_scan(scan_data, options):
+    """Build the payload variant a subscriber with ``options`` should receive."""
+    if options['mode'] == 'summary':
+        payload = {k: v for k, v in scan_data.items() if k not in ARRAY_KEYS}
+        payload['summary_only'] = True
+        return payload
+    if options.get('mz_window'):
+        scan_data = slice_window(scan_data, options['mz_window'])
+    available = scan_data.get('centroid_columns')
+    if available is None:
+        return scan_data
+    payload = {k: v for k, v in scan_data.items() if k != 'centroid_columns'}
+    columns = {c: available[c] for c in options.get('columns', ()) if c in available}
+    if columns:
+        payload['centroid_columns'] = columns
+    return payload
+
+
+class ScanFanout:
+    """Delivers each scan to Socket.IO rooms and SSE queues by subscriber options.
+
+    ``room_prefix`` namespaces the rooms so several fan-outs (e.g. one per
+    detector stream) can share a Socket.IO server. SSE queues hold
+    ``(event_id, json)`` pairs.
+    """
+
+    def __init__(self, socketio, event='scan_data', sse_queue_size=100, room_prefix='',
+                 replay_size=DEFAULT_REPLAY_SIZE, replay_bytes=DEFAULT_REPLAY_BYTES):
+        self.socketio = socketio
+        self.event = event
+        self.room_prefix = room_prefix
+        self.sse_queue_size = sse_queue_size
+        self.lock = threading.Lock()
+        self.socket_subscribers = {}  # sid -> options
+        self.sse_subscribers = {}     # queue -> options
+        self.scans_published = 0
+        self.sse_drops = 0
+        self.replay = deque()  # (event_id, scan_data, cost), oldest first
+        self.replay_size = replay_size
+        self.replay_bytes = replay_bytes
+        self.replay_cost = 0
+        self.last_event_id = EVENT_ID_ORIGIN
+        # Newest ID dropped from the buffer: clients behind it cannot be fully replayed
+        self.evicted_event_id = EVENT_ID_ORIGIN
+        self.scans_replayed = 0
+        self.resyncs = 0
+
+    def subscribe_socket(self, sid, options):
+        """Register a Socket.IO client; returns ``(room, previous_room)``."""
+        with self.lock:
+            previous = self.socket_subscribers.get(sid)
+            self.socket_subscribers[sid] = options
+        return self.room_for(options), self.room_for(previous) if previous else None
+
+    def unsubscribe_socket(self, sid):
+        with self.lock:
+            options = self.socket_subscribers.pop(sid, None)
+        return self.room_for(options) if options else None
+
+    def room_for(self, options):
+        return options_key(options, self.room_prefix)
+
+    def requested_columns(self):
+        """Extended centroid columns requested by at least one subscriber."""
+        with self.lock:
+            return {column
+                    for options in list(self.socket_subscribers.values()) + list(self.sse_subscribers.values())
+                    for column in options.get('columns', ())}
+
+    def subscribe_sse(self, options, last_event_id=None):
+        """Register an SSE client; returns ``(queue, missed)``.
+
+        ``missed`` holds the SSE messages to send before reading the queue:
+        the buffered scans after ``last_event_id``, led by a ``resync``
+        notice if some of the missed scans are no longer buffered.
+        """
+        subscriber = queue.Queue(maxsize=self.sse_queue_size)
+        with self.lock:
+            # Snapshot and register together so no scan is both replayed and queued
+            missed, complete = self._since(last_event_id)
+            notice = None if complete else self._resync(last_event_id)
+            self.sse_subscribers[subscriber] = options
+        messages = [sse_message(event_id, json.dumps(render_scan(scan_data, options)))
+                    for event_id, scan_data in missed]
+        if notice:
+            messages.insert(0, sse_message(None, json.dumps(notice), event='resync'))
+        return subscriber, messages
+
+    def unsubscribe_sse(self, subscriber):
+        with self.lock:
+            self.sse_subscribers.pop(subscriber, None)
+
+    def _since(self, last_event_id):
+        """Buffered ``(event_id, scan_data)`` after ``last_event_id`` and whether that covers every missed scan."""
+        if last_event_id is None:
+            return [], True
+        complete = last_event_id >= self.evicted_event_id
+        if last_event_id >= self.last_event_id:
+            missed = []
+        else:
+            missed = [(event_id, scan_data) for event_id, scan_data, _ in self.replay if event_id > last_event_id]
+        self.scans_replayed += len(missed)
+        if not complete:
+            self.resyncs += 1
+        return missed, complete
+
+    def _resync(self, last_event_id):
+        return {"last_event_id": last_event_id,
+                "oldest_event_id": self.replay[0][0] if self.replay else None,
+                "latest_event_id": self.last_event_id}
+
+    def replay_socket(self, sid, options, last_event_id):
+        """Send a resuming Socket.IO client the scans it missed.
+
+        Call it after the client joined its room. A scan published in between
+        can arrive twice; clients skip event IDs they have already seen.
+        Returns ``(replayed, complete)``.
+        """
+        with self.lock:
+            missed, complete = self._since(last_event_id)
+            notice = None if complete else self._resync(last_event_id)
+        if notice:
+            self.socketio.emit('resync', notice, to=sid)
+        for _, scan_data in missed:
+            self.socketio.emit(self.event, render_scan(scan_data, options), to=sid)
+        return len(missed), complete
+
+    def publish(self, scan_data):
+        """Deliver a scan, keeping its ``event_id`` (a new one is assigned if it has none)."""
+        event_id = scan_data.get('event_id') or next_event_id()
+        with self.lock:
+            self.last_event_id = max(self.last_event_id, event_id)
+            # Tag a shallow copy so stored scans are not touched
+            scan_data = dict(scan_data, event_id=event_id)
+            cost = replay_cost(scan_data)
+            self.replay.append((event_id, scan_data, cost))
+            self.replay_cost += cost
+            while self.replay and (len(self.replay) > self.replay_size or self.replay_cost > self.replay_bytes):
+                evicted, _, evicted_cost = self.replay.popleft()
+                self.evicted_event_id = max(self.evicted_event_id, evicted)
+                self.replay_cost -= evicted_cost
+            socket_options = {self.room_for(o): o for o in self.socket_subscribers.values()}
+            sse_subscribers = list(self.sse_subscribers.items())
+
+        rendered = {}
+        encoded = {}
+
+        def variant(options):
+            key = options_key(options)
+            if key not in rendered:
+                rendered[key] = render_scan(scan_data, options)
+            return key, rendered[key]
+
+        for room, options in socket_options.items():
+            _, payload = variant(options)
+            self.socketio.emit(self.event, payload, to=room)
+
+        for subscriber, options in sse_subscribers:
+            key, payload = variant(options)
+            if key not in encoded:
+                encoded[key] = (event_id, json.dumps(payload))
+            try:
+                subscriber.put_nowait(encoded[key])
+            except queue.Full:
+                # Slow reader: drop its oldest scan rather than block ingest
+                self.sse_drops += 1
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(encoded[key])
+                except Exception:
+                    pass
+            except Exception as e:
+                logging.error(f"Error adding data to SSE queue: {e}")
+
+        self.scans_published += 1
+
+    def get_stats(self):
+        with self.lock:
+            rooms = {}
+            for options in self.socket_subscribers.values():
+                key = self.room_for(options)
+                rooms[key] = rooms.get(key, 0) + 1
+            return {
+                "socket_subscribers": len(self.socket_subscribers),
+                "sse_subscribers": len(self.sse_subscribers),
+                "rooms": rooms,
+                "scans_published": self.scans_published,
+                "sse_drops": self.sse_drops,
+                "last_event_id": self.last_event_id,
+                "replay_buffered": len(self.replay),
+                "replay_capacity": self.replay_size,
+                "replay_bytes": self.replay_cost,
+                "replay_bytes_capacity": self.replay_bytes,
+                "scans_replayed": self.scans_replayed,
+                "resyncs": self.resyncs
+            }
@@ -0,0 +1,142 @@
+"""
+Instrument-native scan numbering and gap detection.
+
+Scans are identified by ``(session_id, scan_number)``: the scan number comes
+from the instrument (scan header/trailer) where available, and the session
+ID changes with every acquisition stream (and process start), so numbers
+that restart with a new acquisition never collide.
+
+``PipelineGaps`` observes the scan numbers seen at each stage of the
+pipeline (instrument callback, fan-out, remote push, relay) and counts
+missing, duplicate and out-of-order scans per stage and stream, which shows
+where scans get lost at a given acquisition rate.
+"""
+
+import uuid
+import threading
+from datetime import datetime
+
+# Header/trailer keys holding the instrument's scan number, in order of preference
+SCAN_NUMBER_KEYS = (
+    ("Header", "Scan"),
+    ("Header", "ScanNumber"),
+    ("Trailer", "Access Id:"),
+    ("Trailer", "Access id:"),
+)
+
+
+def new_session_id(source="backend"):
+    """Sortable, unique session ID, e.g. ``20260101T120000-1-3fa2c1``."""
+    return f"{datetime.now():%Y%m%dT%H%M%S}-{source}-{uuid.uuid4().hex[:6]}"
+
+
+def lookup(mapping, key):
+    """Read ``key`` from a .NET string dictionary (or a dict); ``None`` if absent."""
+    if mapping is None:
+        return None
+    try:
+        if hasattr(mapping, "ContainsKey"):
+            return mapping[key] if mapping.ContainsKey(key) else None
+        return mapping.get(key)
+    except Exception:
+        return None
+
+
+def native_scan_number(scan):
+    """The instrument's own scan number for an IAPI scan, or ``None``."""
+    for section, key in SCAN_NUMBER_KEYS:
+        value = lookup(getattr(scan, section, None), key)
+        if value is None:
+            continue
+        try:
+            return int(float(str(value).strip()))
+        except ValueError:
+            continue
+    return None
+
+
+def scan_key(session_id, scan_number):
+    return f"{session_id}:{scan_number}"
+
+
+def scan_time(scan_data):
+    """Epoch seconds of a scan's ``timestamp`` (ISO-8601 or epoch), or ``None``."""
+    value = scan_data.get('timestamp')
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class GapTracker:
+    """Sequence continuity of one stage, per (session, stream)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last = {}  # (session_id, stream_id) -> last scan number
+        self.received = 0
+        self.gaps = 0
+        self.missed = 0
+        self.duplicates = 0
+        self.out_of_order = 0
+
+    def observe(self, session_id, stream_id, scan_number):
+        """Record one scan; returns the number of scans missing before it."""
+        if scan_number is None:
+            return 0
+        key = (session_id, stream_id)
+        with self.lock:
+            self.received += 1
+            last = self.last.get(key)
+            if last is None:
+                self.last[key] = scan_number
+                return 0
+            if scan_number == last:
+                self.duplicates += 1
+                return 0
+            if scan_number < last:
+                self.out_of_order += 1
+                return 0
+            self.last[key] = scan_number
+            missing = scan_number - last - 1
+            if missing > 0:
+                self.gaps += 1
+                self.missed += missing
+            return missing
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "received": self.received,
+                "gaps": self.gaps,
+                "missed": self.missed,
+                "duplicates": self.duplicates,
+                "out_of_order": self.out_of_order,
+                "streams": len(self.last)
+            }
+
+
+class PipelineGaps:
+    """Gap trackers for the named stages of the scan pipeline."""
+
+    def __init__(self, stages):
+        self.stages = {stage: GapTracker() for stage in stages}
+
+    def observe(self, stage, scan_data):
+        """Observe a scan payload carrying ``session_id``/``stream_id``/``scan_number``.
+
+        Scans numbered locally (no native number) are contiguous by
+        construction at the callback, but still reveal losses downstream.
+        """
+        return self.stages[stage].observe(scan_data.get('session_id'),
+                                          scan_data.get('stream_id'),
+                                          scan_data.get('scan_number'))
+
+    def get_stats(self):
+        return {stage: tracker.get_stats() for stage, tracker in self.stages.items()}
@@ -0,0 +1,613 @@
+"""
+Vectorized spectrum processing stages for the scan pipeline.
+
+Every stage works on sorted numpy m/z and intensity arrays and avoids Python
+loops over peaks, so it can run inline in the scan handler.
+"""
+
+import os
+import time
+import logging
+
+import numpy as np
+
+# Mass difference between 13C and 12C
+ISOTOPE_SPACING = 1.0033548
+PROTON_MASS = 1.00727646688
+
+CENTROID_METHODS = ("weighted", "gaussian")
+# A fitted Gaussian apex may exceed the sampled apex by at most this factor (log)
+MAX_GAUSSIAN_LOG_GAIN = np.log(2.0)
+
+
+def estimate_noise(intensity):
+    """Robust noise level: median of the non-zero profile intensities."""
+    positive = intensity[intensity > 0]
+    if positive.size == 0:
+        return 1.0
+    return max(float(np.median(positive)), np.finfo(np.float32).tiny)
+
+
+def find_local_maxima(intensity):
+    """Indices of strict-left / non-strict-right local maxima (plateaus count once)."""
+    if intensity.size < 3:
+        return np.flatnonzero(intensity == intensity.max()) if intensity.size else np.empty(0, dtype=np.int64)
+    y = intensity
+    is_max = (y[1:-1] > y[:-2]) & (y[1:-1] >= y[2:])
+    return np.flatnonzero(is_max) + 1
+
+
+def _weighted_centroids(mz, intensity, apex, half_window):
+    offsets = np.arange(-half_window, half_window + 1)
+    window = np.clip(apex[:, None] + offsets[None, :], 0, mz.size - 1)
+    weights = intensity[window].astype(np.float64)
+    # Only use points on the descending flanks so windows stop at valleys
+    right = np.cumprod(np.diff(weights[:, half_window:], axis=1) <= 0, axis=1).astype(bool)
+    left = np.cumprod(np.diff(weights[:, half_window::-1], axis=1) <= 0, axis=1).astype(bool)
+    keep = np.concatenate([left[:, ::-1], np.ones((apex.size, 1), dtype=bool), right], axis=1)
+    # Clipped edge indices repeat the boundary point; count it only once
+    keep[:, 1:] &= window[:, 1:] != window[:, :-1]
+    weights = np.where(keep, weights, 0.0)
+    total = weights.sum(axis=1)
+    total = np.where(total > 0, total, 1.0)
+    return (weights * mz[window]).sum(axis=1) / total
+
+
+def _gaussian_centroids(mz, intensity, apex):
+    """Three-point Gaussian (parabola on log intensity) apex interpolation."""
+    left = np.maximum(apex - 1, 0)
+    right = np.minimum(apex + 1, mz.size - 1)
+    x1, x2, x3 = mz[left], mz[apex], mz[right]
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        y1, y2, y3 = (np.log(intensity[i].astype(np.float64)) for i in (left, apex, right))
+        # Parabola through the three points in coordinates relative to the apex
+        u1, u3 = x1 - x2, x3 - x2
+        d1, d3 = y1 - y2, y3 - y2
+        det = u1 * u3 * (u1 - u3)
+        a = (d1 * u3 - d3 * u1) / det
+        b = (d3 * u1 ** 2 - d1 * u3 ** 2) / det
+        vertex = x2 - b / (2 * a)
+        log_gain = -b ** 2 / (4 * a)
+        height = np.exp(y2 + np.minimum(log_gain, MAX_GAUSSIAN_LOG_GAIN))
+    # Fall back to the apex sample where the fit is degenerate, not concave or
+    # implausibly far above the sampled apex (e.g. near-duplicate m/z samples)
+    valid = (np.isfinite(vertex) & np.isfinite(log_gain) & (a < 0)
+             & (vertex >= x1) & (vertex <= x3) & (log_gain <= MAX_GAUSSIAN_LOG_GAIN))
+    centroid_mz = np.where(valid, vertex, x2)
+    centroid_intensity = np.where(valid, height, intensity[apex])
+    return centroid_mz, centroid_intensity
+
+
+def centroid_profile(mz, intensity, snr_threshold=3.0, method="weighted", noise=None, half_window=2):
+    """Pick peaks in a sorted profile spectrum.
+
+    Args:
+        mz: sorted profile m/z values.
+        intensity: profile intensities aligned with ``mz``.
+        snr_threshold: minimum apex intensity over ``noise`` for a peak to be kept.
+        method: ``"weighted"`` (intensity-weighted mean over the apex window)
+            or ``"gaussian"`` (three-point Gaussian apex fit).
+        noise: noise level; estimated from the profile when omitted.
+        half_window: profile points either side of the apex for the weighted mean.
+
+    Returns:
+        ``(centroid_mz, centroid_intensity)`` as float64 / float32 arrays.
+    """
+    if method not in CENTROID_METHODS:
+        raise ValueError(f"Unknown centroiding method: {method}")
+    mz = np.asarray(mz, dtype=np.float64)
+    intensity = np.asarray(intensity, dtype=np.float32)
+    if mz.size == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+
+    noise_level = estimate_noise(intensity) if noise is None else float(noise)
+    apex = find_local_maxima(intensity)
+    apex = apex[intensity[apex] >= snr_threshold * noise_level]
+    if apex.size == 0:
+        return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float32)
+
+    if method == "gaussian":
+        centroid_mz, centroid_intensity = _gaussian_centroids(mz, intensity, apex)
+    else:
+        centroid_mz = _weighted_centroids(mz, intensity, apex, half_window)
+        centroid_intensity = intensity[apex]
+    return centroid_mz, np.asarray(centroid_intensity, dtype=np.float32)
+
+
+def cluster_starts(mz, ppm_tolerance):
+    """Start indices of ppm-bounded clusters in the sorted array ``mz``.
+
+    Peaks are first split wherever the gap between neighbours exceeds
+    ``ppm_tolerance``. Each group is then cut on a grid of ``ppm_tolerance``
+    steps in log m/z anchored at its first peak, so groups that are still
+    wider than the tolerance (dense data chains) are split as well. A grid
+    cell is never wider than ``ppm_tolerance`` of its lower edge, and so no
+    cluster is wider than the tolerance of its first peak. Both passes are
+    whole-array operations.
+    """
+    tolerance = ppm_tolerance * 1e-6
+    gap = np.r_[True, np.diff(mz) > mz[:-1] * tolerance]
+    starts = np.flatnonzero(gap)
+    anchor = np.repeat(mz[starts], np.diff(np.r_[starts, mz.size]))
+    cell = np.floor(np.log(mz / anchor) / np.log1p(tolerance))
+    return np.flatnonzero(gap | np.r_[True, cell[1:] != cell[:-1]])
+
+
+def average_spectra(spectra, ppm_tolerance=5.0):
+    """Merge centroid lists onto a common m/z grid and average them.
+
+    All peaks are pooled and sorted once, then grouped by ``cluster_starts``
+    so that no cluster spans more than ``ppm_tolerance``. Cluster m/z is the
+    intensity-weighted mean, intensity the sum divided by the number of
+    spectra (peaks absent from a scan count as zero).
+
+    Args:
+        spectra: iterable of ``(masses, intensities)`` pairs.
+        ppm_tolerance: maximum width of a cluster, relative to its lowest m/z.
+
+    Returns:
+        ``(mz, intensity, scan_counts)`` arrays, where ``scan_counts`` is the
+        number of pooled peaks in each cluster.
+    """
+    spectra = [(np.asarray(m, dtype=np.float64), np.asarray(i, dtype=np.float64)) for m, i in spectra]
+    n_spectra = len(spectra)
+    if n_spectra == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    mz = np.concatenate([m for m, _ in spectra])
+    intensity = np.concatenate([i[:m.size] for m, i in spectra])
+    if mz.size == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+
+    order = np.argsort(mz)
+    mz, intensity = mz[order], intensity[order]
+    starts = cluster_starts(mz, ppm_tolerance)
+
+    summed = np.add.reduceat(intensity, starts)
+    weighted = np.add.reduceat(mz * intensity, starts)
+    counts = np.diff(np.r_[starts, mz.size])
+    # Clusters with zero total intensity fall back to their plain mean m/z
+    plain = np.add.reduceat(mz, starts) / counts
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cluster_mz = np.where(summed > 0, weighted / summed, plain)
+    return cluster_mz, summed / n_spectra, counts
+
+
+class ProcessingStage:
+    """Common latency bookkeeping for optional per-scan processing stages.
+
+    A stage with ``latency_budget_ms`` set suspends itself when its moving
+    average latency exceeds the budget, so a high acquisition rate cannot
+    back up the scan handler; re-configuring the stage resumes it.
+    """
+
+    name = "stage"
+
+    def __init__(self, latency_budget_ms=None):
+        self.latency_budget_ms = latency_budget_ms
+        self.suspended = False
+        self.scans_processed = 0
+        self.total_seconds = 0.0
+        self.last_ms = 0.0
+        self.average_ms = 0.0
+
+    def _record(self, elapsed):
+        self.scans_processed += 1
+        self.total_seconds += elapsed
+        self.last_ms = elapsed * 1000.0
+        # Exponential moving average over roughly the last 20 scans
+        self.average_ms += (self.last_ms - self.average_ms) * (0.05 if self.scans_processed > 1 else 1.0)
+        if self.latency_budget_ms and self.average_ms > self.latency_budget_ms and not self.suspended:
+            self.suspended = True
+            logging.warning(f"{self.name} suspended: {self.average_ms:.2f} ms/scan exceeds "
+                            f"budget of {self.latency_budget_ms} ms")
+
+    def _resume(self):
+        self.suspended = False
+        self.average_ms = 0.0
+
+    def get_stats(self):
+        return {
+            "suspended": self.suspended,
+            "latency_budget_ms": self.latency_budget_ms,
+            "scans_processed": self.scans_processed,
+            "last_ms": self.last_ms,
+            "average_ms": self.average_ms,
+            "mean_ms": (self.total_seconds / self.scans_processed * 1000.0) if self.scans_processed else 0.0
+        }
+
+
+class ServerCentroider(ProcessingStage):
+    """Backend centroiding stage with its settings and latency statistics.
+
+    Modes: ``off``; ``attach`` adds ``server_centroids`` to the scan payload;
+    ``replace`` swaps the instrument centroids for the server ones.
+    """
+
+    name = "centroiding"
+    MODES = ("off", "attach", "replace")
+
+    def __init__(self, mode="off", method="weighted", snr_threshold=3.0, half_window=2, latency_budget_ms=None):
+        super().__init__(latency_budget_ms)
+        self.configure(mode=mode, method=method, snr_threshold=snr_threshold, half_window=half_window,
+                       latency_budget_ms=latency_budget_ms)
+
+    @classmethod
+    def from_env(cls):
+        budget = os.environ.get("SERVER_CENTROIDING_LATENCY_BUDGET_MS")
+        return cls(
+            mode=os.environ.get("SERVER_CENTROIDING", "off").lower(),
+            method=os.environ.get("SERVER_CENTROIDING_METHOD", "weighted").lower(),
+            snr_threshold=float(os.environ.get("SERVER_CENTROIDING_SNR", 3.0)),
+            half_window=int(os.environ.get("SERVER_CENTROIDING_HALF_WINDOW", 2)),
+            latency_budget_ms=float(budget) if budget else None
+        )
+
+    def configure(self, mode=None, method=None, snr_threshold=None, half_window=None, latency_budget_ms=None):
+        if mode is not None:
+            if mode not in self.MODES:
+                raise ValueError(f"Unknown centroiding mode: {mode}")
+            self.mode = mode
+        if method is not None:
+            if method not in CENTROID_METHODS:
+                raise ValueError(f"Unknown centroiding method: {method}")
+            self.method = method
+        if snr_threshold is not None:
+            self.snr_threshold = float(snr_threshold)
+        if half_window is not None:
+            self.half_window = int(half_window)
+        if latency_budget_ms is not None:
+            self.latency_budget_ms = float(latency_budget_ms) or None
+        self._resume()
+
+    @property
+    def enabled(self):
+        return self.mode != "off" and not self.suspended
+
+    def apply(self, scan_data, profile_mz, profile_intensity):
+        """Centroid a profile and merge the result into ``scan_data`` in place."""
+        start = time.perf_counter()
+        centroid_mz, centroid_intensity = centroid_profile(
+            profile_mz, profile_intensity,
+            snr_threshold=self.snr_threshold,
+            method=self.method,
+            half_window=self.half_window
+        )
+        self._record(time.perf_counter() - start)
+
+        if self.mode == "replace":
+            scan_data['masses'] = centroid_mz.tolist()
+            scan_data['intensities'] = centroid_intensity.tolist()
+            scan_data['centroid_count'] = int(centroid_mz.size)
+            scan_data['centroid_source'] = "server"
+        else:
+            scan_data['server_centroids'] = {
+                'masses': centroid_mz.tolist(),
+                'intensities': centroid_intensity.tolist(),
+                'method': self.method
+            }
+        return scan_data
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            "mode": self.mode,
+            "method": self.method,
+            "snr_threshold": self.snr_threshold
+        })
+        return stats
+
+
+def _follow_isotopes(mz, intensity, charge, ppm_tolerance):
+    """For every peak, the index of its next isotope peak at ``charge`` (or -1)."""
+    target = mz + ISOTOPE_SPACING / charge
+    right = np.searchsorted(mz, target)
+    left = np.maximum(right - 1, 0)
+    right = np.minimum(right, mz.size - 1)
+    # Nearest candidate on either side of the target
+    nearest = np.where(np.abs(mz[left] - target) <= np.abs(mz[right] - target), left, right)
+    within = np.abs(mz[nearest] - target) <= target * ppm_tolerance * 1e-6
+    return np.where(within & (nearest != np.arange(mz.size)), nearest, -1)
+
+
+def deisotope(mz, intensity, max_charge=6, ppm_tolerance=10.0, min_peaks=2, max_isotopes=8, polarity="Positive"):
+    """Group centroids into isotope envelopes and assign charge states.
+
+    Each charge state is tested for every peak at once via ``searchsorted``;
+    isotope chains are then followed for at most ``max_isotopes`` steps. A
+    peak starts an envelope when it has no isotope predecessor and its chain
+    is at least ``min_peaks`` long; the charge with the longest chain wins.
+    Where envelopes overlap, shared peaks go to the more intense envelope.
+
+    Returns a dict of equally long lists: ``mono_mz``, ``charge``,
+    ``neutral_mass``, ``intensity`` (envelope total) and ``peak_count``.
+    """
+    mz = np.asarray(mz, dtype=np.float64)
+    intensity = np.asarray(intensity, dtype=np.float64)
+    empty = {"mono_mz": [], "charge": [], "neutral_mass": [], "intensity": [], "peak_count": []}
+    if mz.size < min_peaks:
+        return empty
+
+    charges = np.arange(1, max_charge + 1)
+    links = np.stack([_follow_isotopes(mz, intensity, z, ppm_tolerance) for z in charges])
+
+    # Chain length per (charge, peak) by pointer jumping
+    lengths = np.ones(links.shape, dtype=np.int64)
+    cursor = links.copy()
+    for _ in range(max_isotopes - 1):
+        active = cursor >= 0
+        if not active.any():
+            break
+        lengths += active
+        cursor = np.where(active, np.take_along_axis(links, np.maximum(cursor, 0), axis=1), -1)
+
+    # A peak that is some other peak's next isotope at charge z cannot start a z-envelope
+    has_predecessor = np.zeros(links.shape, dtype=bool)
+    rows, cols = np.nonzero(links >= 0)
+    has_predecessor[rows, links[rows, cols]] = True
+    lengths = np.where(has_predecessor, 0, lengths)
+
+    # Longest chain wins; ties prefer the higher charge
+    best_row = (lengths.shape[0] - 1) - np.argmax(lengths[::-1], axis=0)
+    best_length = lengths[best_row, np.arange(mz.size)]
+    starts = np.flatnonzero(best_length >= min_peaks)
+    if starts.size == 0:
+        return empty
+    start_rows = best_row[starts]
+
+    # Member matrix (envelope x isotope index), -1 padded
+    members = np.full((starts.size, max_isotopes), -1, dtype=np.int64)
+    members[:, 0] = starts
+    for k in range(1, max_isotopes):
+        previous = members[:, k - 1]
+        members[:, k] = np.where(previous >= 0, links[start_rows, np.maximum(previous, 0)], -1)
+
+    # Resolve shared peaks: write owners from least to most intense envelope
+    valid = members >= 0
+    totals = np.where(valid, intensity[np.maximum(members, 0)], 0.0).sum(axis=1)
+    order = np.argsort(totals, kind="stable")
+    owner = np.full(mz.size, -1, dtype=np.int64)
+    for k in range(max_isotopes):
+        column = members[order, k]
+        keep = column >= 0
+        owner[column[keep]] = order[keep]
+    owned = valid & (owner[np.maximum(members, 0)] == np.arange(starts.size)[:, None])
+    owned[:, 0] = valid[:, 0]
+
+    peak_count = owned.sum(axis=1)
+    keep = peak_count >= min_peaks
+    charge = charges[start_rows][keep]
+    mono = mz[starts][keep]
+    total = np.where(owned, intensity[np.maximum(members, 0)], 0.0).sum(axis=1)[keep]
+    sign = -1.0 if str(polarity).lower().startswith("neg") else 1.0
+    neutral = (mono - sign * PROTON_MASS) * charge
+
+    return {
+        "mono_mz": mono.tolist(),
+        "charge": charge.tolist(),
+        "neutral_mass": neutral.tolist(),
+        "intensity": total.tolist(),
+        "peak_count": peak_count[keep].tolist()
+    }
+
+
+class Deisotoper(ProcessingStage):
+    """Optional deisotoping / charge deconvolution stage.
+
+    Attaches ``deisotoped`` annotations and the stage latency
+    (``processing_ms.deisotoping``) to each scan payload.
+    """
+
+    name = "deisotoping"
+
+    def __init__(self, enabled=False, max_charge=6, ppm_tolerance=10.0, min_peaks=2, latency_budget_ms=None):
+        super().__init__(latency_budget_ms)
+        self.enabled_setting = False
+        self.configure(enabled=enabled, max_charge=max_charge, ppm_tolerance=ppm_tolerance,
+                       min_peaks=min_peaks, latency_budget_ms=latency_budget_ms)
+
+    @classmethod
+    def from_env(cls):
+        budget = os.environ.get("DEISOTOPING_LATENCY_BUDGET_MS")
+        return cls(
+            enabled=os.environ.get("DEISOTOPING", "off").lower() in ("1", "on", "true", "yes"),
+            max_charge=int(os.environ.get("DEISOTOPING_MAX_CHARGE", 6)),
+            ppm_tolerance=float(os.environ.get("DEISOTOPING_PPM", 10.0)),
+            min_peaks=int(os.environ.get("DEISOTOPING_MIN_PEAKS", 2)),
+            latency_budget_ms=float(budget) if budget else None
+        )
+
+    def configure(self, enabled=None, max_charge=None, ppm_tolerance=None, min_peaks=None, latency_budget_ms=None):
+        if max_charge is not None:
+            if int(max_charge) < 1:
+                raise ValueError("max_charge must be at least 1")
+            self.max_charge = int(max_charge)
+        if ppm_tolerance is not None:
+            if float(ppm_tolerance) <= 0:
+                raise ValueError("ppm_tolerance must be positive")
+            self.ppm_tolerance = float(ppm_tolerance)
+        if min_peaks is not None:
+            self.min_peaks = max(int(min_peaks), 2)
+        if latency_budget_ms is not None:
+            self.latency_budget_ms = float(latency_budget_ms) or None
+        if enabled is not None:
+            self.enabled_setting = bool(enabled)
+        self._resume()
+
+    @property
+    def enabled(self):
+        return self.enabled_setting and not self.suspended
+
+    def apply(self, scan_data):
+        """Annotate ``scan_data`` in place with its isotope envelopes."""
+        start = time.perf_counter()
+        scan_data['deisotoped'] = deisotope(
+            scan_data.get('masses', []),
+            scan_data.get('intensities', []),
+            max_charge=self.max_charge,
+            ppm_tolerance=self.ppm_tolerance,
+            min_peaks=self.min_peaks,
+            polarity=scan_data.get('polarity', "Positive")
+        )
+        elapsed = time.perf_counter() - start
+        self._record(elapsed)
+        scan_data.setdefault('processing_ms', {})['deisotoping'] = elapsed * 1000.0
+        return scan_data
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            "enabled": self.enabled_setting,
+            "max_charge": self.max_charge,
+            "ppm_tolerance": self.ppm_tolerance,
+            "min_peaks": self.min_peaks
+        })
+        return stats
+
+
+def peak_mask(intensity, noise=None, min_intensity=0.0, min_relative=0.0, min_snr=0.0):
+    """Boolean mask of the centroids that pass every enabled threshold.
+
+    ``min_relative`` is a fraction of the base peak intensity. ``min_snr``
+    divides by the per-centroid ``noise`` where it is known and positive,
+    and by a scan-wide estimate (median non-zero intensity) elsewhere.
+    """
+    intensity = np.asarray(intensity, dtype=np.float64)
+    keep = np.ones(intensity.size, dtype=bool)
+    if intensity.size == 0:
+        return keep
+    if min_intensity > 0:
+        keep &= intensity >= min_intensity
+    if min_relative > 0:
+        keep &= intensity >= min_relative * intensity.max()
+    if min_snr > 0:
+        level = np.full(intensity.size, estimate_noise(intensity))
+        if noise is not None:
+            noise = np.asarray(noise, dtype=np.float64)
+            known = np.isfinite(noise) & (noise > 0)
+            level[known] = noise[known]
+        keep &= intensity >= min_snr * level
+    return keep
+
+
+class PeakFilter(ProcessingStage):
+    """Drops near-noise centroids at ingest by absolute, relative or S/N threshold.
+
+    Each filtered scan gets a ``peak_filter`` block with the points removed
+    and their size in bytes (8 per value of every per-point column sent),
+    plus the stage latency under ``processing_ms.peak_filter``.
+    """
+
+    name = "peak_filter"
+
+    def __init__(self, enabled=False, min_intensity=0.0, min_relative=0.0, min_snr=0.0, latency_budget_ms=None):
+        super().__init__(latency_budget_ms)
+        self.enabled_setting = False
+        self.points_in = 0
+        self.points_removed = 0
+        self.bytes_removed = 0
+        self.configure(enabled=enabled, min_intensity=min_intensity, min_relative=min_relative,
+                       min_snr=min_snr, latency_budget_ms=latency_budget_ms)
+
+    @classmethod
+    def from_env(cls):
+        budget = os.environ.get("PEAK_FILTER_LATENCY_BUDGET_MS")
+        return cls(
+            enabled=os.environ.get("PEAK_FILTER", "off").lower() in ("1", "on", "true", "yes"),
+            min_intensity=float(os.environ.get("PEAK_FILTER_MIN_INTENSITY", 0.0)),
+            min_relative=float(os.environ.get("PEAK_FILTER_MIN_RELATIVE", 0.0)),
+            min_snr=float(os.environ.get("PEAK_FILTER_MIN_SNR", 0.0)),
+            latency_budget_ms=float(budget) if budget else None
+        )
+
+    def configure(self, enabled=None, min_intensity=None, min_relative=None, min_snr=None, latency_budget_ms=None):
+        if min_intensity is not None:
+            if float(min_intensity) < 0:
+                raise ValueError("min_intensity must not be negative")
+            self.min_intensity = float(min_intensity)
+        if min_relative is not None:
+            if not 0 <= float(min_relative) < 1:
+                raise ValueError("min_relative must be a fraction of the base peak (0 <= x < 1)")
+            self.min_relative = float(min_relative)
+        if min_snr is not None:
+            if float(min_snr) < 0:
+                raise ValueError("min_snr must not be negative")
+            self.min_snr = float(min_snr)
+        if latency_budget_ms is not None:
+            self.latency_budget_ms = float(latency_budget_ms) or None
+        if enabled is not None:
+            self.enabled_setting = bool(enabled)
+        self._resume()
+
+    @property
+    def enabled(self):
+        return self.enabled_setting and not self.suspended
+
+    @property
+    def needs_noise(self):
+        """Whether per-centroid noise values would sharpen the S/N threshold."""
+        return self.enabled and self.min_snr > 0
+
+    def _mask(self, intensity, noise):
+        return peak_mask(intensity, noise, self.min_intensity, self.min_relative, self.min_snr)
+
+    def _report(self, scan_data, total, removed, bytes_per_point, elapsed):
+        self._record(elapsed)
+        self.points_in += total
+        self.points_removed += removed
+        self.bytes_removed += removed * bytes_per_point
+        scan_data['peak_filter'] = {
+            "points_in": total,
+            "points_removed": removed,
+            "bytes_removed": removed * bytes_per_point
+        }
+        scan_data.setdefault('processing_ms', {})['peak_filter'] = elapsed * 1000.0
+
+    def filter_centroids(self, centroids, scan_data, columns=()):
+        """Filter a structured centroid array (``mz``, ``intensity``, optional ``noise``) before it is encoded.
+
+        ``columns`` are the extended columns that will be sent; a ``noise``
+        column extracted only for the S/N threshold is not counted in the
+        bytes removed.
+        """
+        start = time.perf_counter()
+        noise = centroids["noise"] if "noise" in (centroids.dtype.names or ()) else None
+        keep = self._mask(centroids["intensity"], noise)
+        filtered = centroids if keep.all() else centroids[keep]
+        self._report(scan_data, int(centroids.size), int(centroids.size - filtered.size),
+                     8 * (2 + len(columns)), time.perf_counter() - start)
+        return filtered
+
+    def apply(self, scan_data):
+        """Filter the per-point lists of a scan payload in place.
+
+        S/N uses the payload's ``noise`` centroid column when it has one.
+        Callers must recompute any ``summary`` block afterwards.
+        """
+        start = time.perf_counter()
+        intensities = scan_data.get('intensities') or []
+        columns = scan_data.get('centroid_columns') or {}
+        keep = self._mask(intensities, columns.get('noise'))
+        removed = int(keep.size - np.count_nonzero(keep))
+        if removed:
+            index = np.flatnonzero(keep)
+            scan_data['masses'] = np.asarray(scan_data.get('masses', []), dtype=np.float64)[index].tolist()
+            scan_data['intensities'] = np.asarray(intensities, dtype=np.float64)[index].tolist()
+            if columns:
+                scan_data['centroid_columns'] = {name: [values[i] for i in index] for name, values in columns.items()}
+            if 'centroid_count' in scan_data:
+                scan_data['centroid_count'] = int(index.size)
+        self._report(scan_data, int(keep.size), removed, 8 * (2 + len(columns)), time.perf_counter() - start)
+        return scan_data
+
+    def get_stats(self):
+        stats = super().get_stats()
+        stats.update({
+            "enabled": self.enabled_setting,
+            "min_intensity": self.min_intensity,
+            "min_relative": self.min_relative,
+            "min_snr": self.min_snr,
+            "points_in": self.points_in,
+            "points_removed": self.points_removed,
+            "bytes_removed": self.bytes_removed
+        })
+        return stats
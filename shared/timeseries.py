@@ -0,0 +1,170 @@
+"""
+Ring-buffered numeric time series with downsampled reads.
+
+Each series keeps its samples in two preallocated NumPy arrays (epoch
+seconds and value). Batches are written with slice assignment, so memory
+stays fixed no matter how long the instrument runs. Reads cut the requested
+time window with ``searchsorted`` and reduce it to at most ``max_points``
+points per series:
+
+- ``minmax`` (default) keeps the minimum and maximum of each bucket, so
+  spikes survive.
+- ``mean`` keeps one averaged point per bucket.
+
+Batches travel as ``{name: {"t": [...], "v": [...]}}``. The same layout is
+used for pushing them to the relay and for reading them back.
+"""
+
+import math
+import threading
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_CAPACITY = 86400
+DEFAULT_MAX_POINTS = 1000
+DOWNSAMPLE_METHODS = ("minmax", "mean")
+
+
+def parse_time(value):
+    """Epoch seconds from an epoch-seconds or ISO-8601 query argument (``None`` passes through)."""
+    if value is None or value == "":
+        return None
+    try:
+        t = float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+    if not math.isfinite(t):
+        raise ValueError(f"time must be finite, got {value}")
+    return t
+
+
+class TimeSeriesRing:
+    """Fixed-capacity ring of ``(time, value)`` samples."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.values = np.empty(capacity, dtype=np.float64)
+        self.end = 0      # next write position
+        self.count = 0
+        self.total = 0
+
+    def extend(self, times, values):
+        times = np.asarray(times, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        n = times.size
+        self.total += n
+        if n >= self.capacity:
+            times, values, n = times[-self.capacity:], values[-self.capacity:], self.capacity
+        first = min(n, self.capacity - self.end)
+        self.times[self.end:self.end + first] = times[:first]
+        self.values[self.end:self.end + first] = values[:first]
+        if first < n:
+            self.times[:n - first] = times[first:]
+            self.values[:n - first] = values[first:]
+        self.end = (self.end + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def ordered(self):
+        """All samples, oldest first."""
+        if self.count < self.capacity:
+            return self.times[:self.count], self.values[:self.count]
+        return (np.concatenate((self.times[self.end:], self.times[:self.end])),
+                np.concatenate((self.values[self.end:], self.values[:self.end])))
+
+    def window(self, t_from=None, t_to=None):
+        times, values = self.ordered()
+        lo = 0 if t_from is None else int(np.searchsorted(times, t_from, side="left"))
+        hi = times.size if t_to is None else int(np.searchsorted(times, t_to, side="right"))
+        return times[lo:hi], values[lo:hi]
+
+    def latest(self):
+        if self.count == 0:
+            return None, None
+        index = (self.end - 1) % self.capacity
+        return float(self.times[index]), float(self.values[index])
+
+
+def downsample(times, values, max_points=DEFAULT_MAX_POINTS, method="minmax"):
+    """Reduce a series to at most ``max_points`` points over equal-count buckets."""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    n = times.size
+    if n <= max_points or max_points < 2:
+        return times, values
+    buckets = max_points // 2 if method == "minmax" else max_points
+    starts = np.unique(np.linspace(0, n, buckets, endpoint=False).astype(np.int64))
+    if method == "mean":
+        sizes = np.diff(np.append(starts, n))
+        return (np.add.reduceat(times, starts) / sizes,
+                np.add.reduceat(values, starts) / sizes)
+
+    # Index of the minimum and maximum inside each bucket, kept in time order
+    bucket = np.repeat(np.arange(starts.size), np.diff(np.append(starts, n)))
+    order = np.lexsort((values, bucket))
+    ends = np.append(starts[1:], n) - 1
+    low, high = order[starts], order[ends]
+    picks = np.sort(np.unique(np.concatenate((low, high))))
+    return times[picks], values[picks]
+
+
+class TimeSeriesStore:
+    """Named ``TimeSeriesRing`` series, written in batches."""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, max_series=256):
+        self.lock = threading.Lock()
+        self.capacity = capacity
+        self.max_series = max_series
+        self.series = {}
+        self.batches = 0
+        self.rejected_series = 0
+
+    def add_batch(self, batch):
+        """Append ``{name: {"t": [...], "v": [...]}}``; returns the number of samples stored."""
+        stored = 0
+        with self.lock:
+            for name, samples in batch.items():
+                ring = self.series.get(name)
+                if ring is None:
+                    if len(self.series) >= self.max_series:
+                        self.rejected_series += 1
+                        continue
+                    ring = self.series[name] = TimeSeriesRing(self.capacity)
+                times, values = samples.get("t", ()), samples.get("v", ())
+                if len(times) != len(values):
+                    raise ValueError(f"Series {name}: t and v must have the same length")
+                ring.extend(times, values)
+                stored += len(times)
+            self.batches += 1
+        return stored
+
+    def describe(self):
+        with self.lock:
+            described = {}
+            for name, ring in self.series.items():
+                t, v = ring.latest()
+                described[name] = {"count": ring.count, "total": ring.total, "latest_time": t, "latest_value": v}
+            return described
+
+    def query(self, names=None, t_from=None, t_to=None, max_points=DEFAULT_MAX_POINTS, method="minmax"):
+        """Downsampled samples of the named series (all when ``names`` is empty) in a time window."""
+        result = {}
+        with self.lock:
+            selected = [(name, self.series[name]) for name in (names or self.series) if name in self.series]
+            # Copied under the lock; a later batch may overwrite ring slots
+            windows = [(name,) + tuple(column.copy() for column in ring.window(t_from, t_to)) for name, ring in selected]
+        for name, times, values in windows:
+            t, v = downsample(times, values, max_points, method)
+            result[name] = {"t": t.tolist(), "v": v.tolist(), "points_in_range": int(times.size)}
+        return result
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "series": len(self.series),
+                "capacity_per_series": self.capacity,
+                "batches": self.batches,
+                "samples": sum(ring.total for ring in self.series.values()),
+                "rejected_series": self.rejected_series
+            }
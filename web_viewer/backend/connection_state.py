@@ -0,0 +1,279 @@
+"""
+Observable state of the instrument connection.
+
+The connection is established in the background while the HTTP/Socket.IO
+server is already serving. Each step of the connection sequence is a named
+phase; entering a phase moves the state machine to that state, and the
+duration of every phase is kept so ``/status`` can show what the backend is
+waiting on and how long each step took.
+
+States::
+
+    idle -> creating_api -> starting_online_access -> waiting_for_service
+         -> discovering_instruments -> attaching -> connected
+    any phase -> failed          (error kept in ``last_error``)
+    failed -> mock               (when falling back to the mock instrument)
+    connected -> disconnected    (liveness probe failed; the supervisor
+                                  reconnects through the phases above)
+"""
+
+import os
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+IDLE = "idle"
+CONNECTED = "connected"
+FAILED = "failed"
+MOCK = "mock"
+
+
+class ConnectionState:
+    """Thread-safe connection state machine with per-phase timings."""
+
+    def __init__(self, history_size=50):
+        self.lock = threading.Lock()
+        self.state = IDLE
+        self.since = time.time()
+        self.attempt = 0
+        self.last_error = None
+        self.phases = {}      # phase name -> {"seconds", "ok", "attempt"} of the latest run
+        self.history = deque(maxlen=history_size)
+        self.listeners = []
+
+    def add_listener(self, callback):
+        """``callback(state, previous_state)`` is called on every transition."""
+        self.listeners.append(callback)
+
+    def set_state(self, state, error=None):
+        with self.lock:
+            previous = self.state
+            self.state = state
+            self.since = time.time()
+            if error is not None:
+                self.last_error = error
+            self.history.append({"state": state, "at": self.since, "error": error})
+        if previous != state:
+            logging.info(f"Instrument connection: {previous} -> {state}")
+            for callback in list(self.listeners):
+                try:
+                    callback(state, previous)
+                except Exception as e:
+                    logging.error(f"Connection state listener failed: {e}")
+
+    def begin_attempt(self):
+        with self.lock:
+            self.attempt += 1
+            self.phases = {}
+            return self.attempt
+
+    @contextmanager
+    def phase(self, name):
+        """Enter state ``name`` for the duration of the block and time it."""
+        self.set_state(name)
+        t0 = time.perf_counter()
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            seconds = round(time.perf_counter() - t0, 4)
+            with self.lock:
+                self.phases[name] = {"seconds": seconds, "ok": ok, "attempt": self.attempt}
+            logging.info(f"Connection phase {name}: {seconds:.3f}s ({'ok' if ok else 'failed'})")
+
+    def fail(self, error):
+        self.set_state(FAILED, error=str(error))
+
+    def is_connected(self):
+        return self.state == CONNECTED
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                "state": self.state,
+                "since": self.since,
+                "seconds_in_state": round(time.time() - self.since, 3),
+                "attempt": self.attempt,
+                "last_error": self.last_error,
+                "phases": {name: dict(p) for name, p in self.phases.items()},
+                "history": list(self.history)
+            }
+
+
+class ReconnectSupervisor:
+    """Watches a live connection with cheap probes and reconnects with backoff.
+
+    ``probe()`` must be fast and side-effect free (e.g. read a Connected
+    flag); ``reconnect()`` performs one full connection attempt and raises on
+    failure. Failed attempts back off exponentially with jitter so a flaky
+    link does not turn into a reconnect storm. Every outage is recorded with
+    its duration and an estimate of the scans missed, based on the scan rate
+    observed (via ``scan_count()``) just before the link dropped.
+    """
+
+    def __init__(self, state, probe, reconnect, scan_count=None, probe_interval=5.0,
+                 base_delay=1.0, max_delay=60.0, factor=2.0, jitter=0.5, history_size=50):
+        self.state = state
+        self.probe = probe
+        self.reconnect = reconnect
+        self.scan_count = scan_count
+        self.probe_interval = probe_interval
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.connected = False
+        self.consecutive_failures = 0
+        self.next_attempt_at = None
+        self.probes = 0
+        self.probe_failures = 0
+        self.reconnect_attempts = 0
+        self.reconnects = 0
+        self.current_outage = None
+        self.outages = deque(maxlen=history_size)
+        self.total_outage_seconds = 0.0
+        self.total_missed_scans = 0.0
+        self._rate = 0.0
+        self._last_count = None
+        self._last_sample = None
+
+    @classmethod
+    def from_env(cls, state, probe, reconnect, scan_count=None):
+        env = os.environ.get
+        return cls(state, probe, reconnect, scan_count,
+                   probe_interval=float(env('RECONNECT_PROBE_INTERVAL', 5.0)),
+                   base_delay=float(env('RECONNECT_BASE_DELAY', 1.0)),
+                   max_delay=float(env('RECONNECT_MAX_DELAY', 60.0)))
+
+    def start(self, connected=True):
+        """Start supervising; ``connected=False`` starts in the reconnect loop."""
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        self.connected = connected
+        if not connected:
+            self._begin_outage("initial connection failed")
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5):
+        self.stop_event.set()
+        if self.thread is not None and self.thread.is_alive() and self.thread is not threading.current_thread():
+            self.thread.join(timeout=timeout)
+
+    def next_delay(self):
+        """Exponential backoff with jitter, capped at ``max_delay``."""
+        delay = min(self.max_delay, self.base_delay * self.factor ** self.consecutive_failures)
+        return delay * (1.0 - self.jitter * random.random())
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            if self.connected:
+                if self._probe():
+                    self._sample_rate()
+                    self.stop_event.wait(self.probe_interval)
+                    continue
+                self.connected = False
+                self._begin_outage("liveness probe failed")
+
+            delay = self.next_delay()
+            self.next_attempt_at = time.time() + delay
+            if self.stop_event.wait(delay):
+                break
+            self.next_attempt_at = None
+            self.reconnect_attempts += 1
+            if self.current_outage is not None:
+                self.current_outage["attempts"] += 1
+            try:
+                self.reconnect()
+            except Exception as e:
+                self.consecutive_failures += 1
+                logging.warning(f"Reconnect attempt {self.reconnect_attempts} failed: {e}")
+                continue
+            self.consecutive_failures = 0
+            self.reconnects += 1
+            self.connected = True
+            self._end_outage()
+
+    def _probe(self):
+        self.probes += 1
+        try:
+            ok = bool(self.probe())
+        except Exception as e:
+            logging.warning(f"Liveness probe error: {e}")
+            ok = False
+        if not ok:
+            self.probe_failures += 1
+        return ok
+
+    def _sample_rate(self):
+        """Smoothed scans per second while connected."""
+        if self.scan_count is None:
+            return
+        now = time.time()
+        count = self.scan_count()
+        if self._last_count is not None and now > self._last_sample:
+            rate = max(count - self._last_count, 0) / (now - self._last_sample)
+            self._rate = rate if self._rate == 0.0 else 0.7 * self._rate + 0.3 * rate
+        self._last_count, self._last_sample = count, now
+
+    def _begin_outage(self, reason):
+        logging.warning(f"Instrument connection lost: {reason}")
+        with self.lock:
+            self.current_outage = {
+                "started_at": time.time(),
+                "ended_at": None,
+                "seconds": None,
+                "reason": reason,
+                "attempts": 0,
+                "scan_rate_hz": round(self._rate, 3),
+                "estimated_missed_scans": None
+            }
+        self.state.set_state("disconnected", error=reason)
+
+    def _end_outage(self):
+        with self.lock:
+            outage = self.current_outage
+            self.current_outage = None
+            if outage is None:
+                return
+            outage["ended_at"] = time.time()
+            outage["seconds"] = round(outage["ended_at"] - outage["started_at"], 3)
+            outage["estimated_missed_scans"] = int(round(outage["scan_rate_hz"] * outage["seconds"]))
+            self.outages.append(outage)
+            self.total_outage_seconds += outage["seconds"]
+            self.total_missed_scans += outage["estimated_missed_scans"]
+        # Rate sampling restarts from the reconnected scan counters
+        self._last_count = None
+        logging.info(f"Instrument connection restored after {outage['seconds']:.1f}s, "
+                     f"~{outage['estimated_missed_scans']} scans missed")
+
+    def get_stats(self):
+        with self.lock:
+            current = dict(self.current_outage) if self.current_outage else None
+            if current is not None:
+                current["seconds"] = round(time.time() - current["started_at"], 3)
+                current["estimated_missed_scans"] = int(round(current["scan_rate_hz"] * current["seconds"]))
+            return {
+                "running": self.thread is not None and self.thread.is_alive(),
+                "connected": self.connected,
+                "scan_rate_hz": round(self._rate, 3),
+                "probes": self.probes,
+                "probe_failures": self.probe_failures,
+                "reconnect_attempts": self.reconnect_attempts,
+                "reconnects": self.reconnects,
+                "consecutive_failures": self.consecutive_failures,
+                "next_attempt_in": round(self.next_attempt_at - time.time(), 2) if self.next_attempt_at else None,
+                "current_outage": current,
+                "outages": list(self.outages),
+                "total_outage_seconds": round(self.total_outage_seconds, 3),
+                "total_estimated_missed_scans": int(self.total_missed_scans)
+            }
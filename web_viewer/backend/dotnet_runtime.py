@@ -0,0 +1,142 @@
+"""
+.NET runtime and Thermo IAPI assembly loading.
+
+The runtime is loaded once and every assembly is resolved and referenced
+once, no matter how often ``load_assemblies`` is called. Directory listings
+and assembly versions are only logged when diagnostics are requested
+(``DOTNET_DIAGNOSTICS=1``). Each step is timed in ``startup_timer`` so
+``/status`` can show where startup time goes.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+DEFAULT_API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               '..', '..', 'lib', 'Exploris4.3-and-higher')
+ASSEMBLIES = (
+    'Thermo.API.NetStd-1.0.dll',
+    'Thermo.API.Exploris.NetStd-1.0.dll',
+    'Thermo.API.Spectrum.NetStd-1.0.dll',
+)
+
+
+class StartupTimer:
+    """Records named startup phases with their wall-clock durations."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.phases = []
+
+    @contextmanager
+    def phase(self, name):
+        entry = {"phase": name, "started_at": time.time(), "seconds": None, "ok": None}
+        with self.lock:
+            self.phases.append(entry)
+        t0 = time.perf_counter()
+        try:
+            yield entry
+            entry["ok"] = True
+        except Exception as e:
+            entry["ok"] = False
+            entry["error"] = str(e)
+            raise
+        finally:
+            entry["seconds"] = round(time.perf_counter() - t0, 4)
+            logging.info(f"Startup phase {name}: {entry['seconds']:.3f}s")
+
+    def to_dict(self):
+        with self.lock:
+            phases = [dict(p) for p in self.phases]
+        return {
+            "phases": phases,
+            "total_seconds": round(sum(p["seconds"] or 0.0 for p in phases), 4)
+        }
+
+
+startup_timer = StartupTimer()
+
+_lock = threading.Lock()
+_runtime_loaded = False
+_loaded_assemblies = {}  # file name -> absolute path
+
+
+def diagnostics_enabled():
+    return os.environ.get('DOTNET_DIAGNOSTICS', '').lower() in ('1', 'true', 'yes', 'on')
+
+
+def log_directory(path):
+    """Log the directory tree (diagnostics only)."""
+    for root, dirs, files in os.walk(path):
+        logging.info(f"Directory: {root}")
+        for f in files:
+            logging.info(f"  File: {f} ({os.path.getsize(os.path.join(root, f))} bytes)")
+
+
+def load_runtime(runtime="coreclr"):
+    """Load the CLR once; importing ``clr`` before this would pick the default runtime."""
+    global _runtime_loaded
+    with _lock:
+        if _runtime_loaded:
+            import clr
+            return clr
+        import pythonnet
+        try:
+            pythonnet.load(runtime)
+        except Exception as e:
+            # Already loaded by an earlier ``import clr``; use whatever is active
+            logging.warning(f"Could not load {runtime} runtime: {e}")
+        import clr
+        _runtime_loaded = True
+        return clr
+
+
+def load_assemblies(api_dir=DEFAULT_API_DIR, diagnostics=None):
+    """Reference each IAPI assembly exactly once and return the ``clr`` module."""
+    if diagnostics is None:
+        diagnostics = diagnostics_enabled()
+    api_dir = os.path.abspath(api_dir)
+    clr = load_runtime()
+
+    with _lock:
+        if diagnostics:
+            log_directory(api_dir)
+        for name in ASSEMBLIES:
+            if name in _loaded_assemblies:
+                continue
+            path = os.path.join(api_dir, name)
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Assembly not found: {path}")
+            clr.AddReference(path)
+            _loaded_assemblies[name] = path
+            if diagnostics:
+                try:
+                    assembly = clr.GetClrType(name.replace('.dll', '')).Assembly
+                    logging.info(f"Loaded {name}, version {assembly.GetName().Version}")
+                except Exception as e:
+                    logging.info(f"Loaded {name} (version unavailable: {e})")
+    return clr
+
+
+def loaded_assemblies():
+    with _lock:
+        return dict(_loaded_assemblies)
+
+
+def unload():
+    """Shut the runtime down at exit, if it was loaded."""
+    global _runtime_loaded
+    with _lock:
+        if not _runtime_loaded:
+            return
+        try:
+            import pythonnet
+            logging.info("Cleaning up .NET runtime...")
+            pythonnet.unload()
+            logging.info(".NET runtime cleanup completed")
+        except Exception as e:
+            logging.warning(f"Runtime cleanup warning: {e}")
+        _runtime_loaded = False
@@ -0,0 +1,156 @@
+"""
+Cached instrument status, updated from events instead of per-request reads.
+
+``/status`` used to read ``container.ServiceConnected`` and
+``Control.Acquisition.State`` through pythonnet on every poll. The cache
+keeps a snapshot of those values instead, updated from:
+
+- ``Control.Acquisition.StateChanged`` (the new state comes with the event),
+- ``container.ServiceConnectionChanged``,
+- connection state transitions and mock acquisition start/stop,
+- a slow background poll (``STATUS_POLL_INTERVAL`` seconds) as a fallback
+  for missed events.
+
+Reading the snapshot is a dict copy under a lock. Every change bumps
+``version`` and is handed to the listeners, which push it to Socket.IO
+clients as a ``status`` event.
+"""
+
+import os
+import time
+import logging
+import threading
+
+RUNNING = "Running"
+
+
+def acquisition_fields(state):
+    """Status fields from an IAPI acquisition state object."""
+    system_state = str(state.SystemState) if hasattr(state, "SystemState") else None
+    return {
+        "system_state": system_state,
+        "system_mode": str(state.SystemMode) if hasattr(state, "SystemMode") else None,
+        "acquisition_active": system_state == RUNNING
+    }
+
+
+class InstrumentStatusCache:
+    """Thread-safe instrument status snapshot with change notification."""
+
+    def __init__(self, poll_interval=10.0):
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.status = {
+            "instrument_connected": False,
+            "online_access": False,
+            "acquisition_active": False,
+            "system_state": None,
+            "system_mode": None,
+            "connection_state": None
+        }
+        self.version = 0
+        self.updated_at = time.time()
+        self.last_source = None
+        self.listeners = []
+        self.handlers = []     # (event owner, event name, handler) to unregister
+        self.reader = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.stats = {"events": 0, "polls": 0, "poll_errors": 0, "changes": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(poll_interval=float(os.environ.get("STATUS_POLL_INTERVAL", 10.0)))
+
+    def add_listener(self, callback):
+        """``callback(snapshot)`` is called after every change."""
+        self.listeners.append(callback)
+
+    def update(self, source, **fields):
+        """Merge ``fields`` into the snapshot; notifies listeners if anything changed."""
+        with self.lock:
+            if source != "poll":
+                self.stats["events"] += 1
+            changed = {k: v for k, v in fields.items() if self.status.get(k) != v}
+            if not changed:
+                return False
+            self.status.update(changed)
+            self.version += 1
+            self.updated_at = time.time()
+            self.last_source = source
+            self.stats["changes"] += 1
+        snapshot = self.snapshot()
+        for callback in list(self.listeners):
+            try:
+                callback(snapshot)
+            except Exception as e:
+                logging.error(f"Status listener failed: {e}")
+        return True
+
+    def snapshot(self):
+        with self.lock:
+            snapshot = dict(self.status)
+            snapshot.update({"version": self.version, "updated_at": self.updated_at, "source": self.last_source})
+            return snapshot
+
+    def attach(self, instrument, container):
+        """Follow acquisition state and service connection events of the primary instrument."""
+        self.detach()
+        acquisition = instrument.Control.Acquisition
+
+        def on_state_changed(sender, args):
+            self.update("event", **acquisition_fields(args.State))
+
+        def on_service_changed(sender, args):
+            self.update("event", online_access=bool(container.ServiceConnected))
+
+        acquisition.StateChanged += on_state_changed
+        self.handlers.append((acquisition, "StateChanged", on_state_changed))
+        if hasattr(container, "ServiceConnectionChanged"):
+            container.ServiceConnectionChanged += on_service_changed
+            self.handlers.append((container, "ServiceConnectionChanged", on_service_changed))
+
+        # Seed the snapshot once; events keep it current from here on
+        self.update("attach", online_access=bool(container.ServiceConnected), **acquisition_fields(acquisition.State))
+
+    def detach(self):
+        handlers, self.handlers = self.handlers, []
+        for owner, event, handler in handlers:
+            try:
+                binding = getattr(owner, event)
+                binding -= handler
+                setattr(owner, event, binding)
+            except Exception as e:
+                logging.error(f"Error removing {event} handler: {e}")
+
+    def start_polling(self, reader):
+        """Call ``reader()`` (returns status fields) every ``poll_interval`` seconds."""
+        self.reader = reader
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.detach()
+
+    def _run(self):
+        while not self.stop_event.wait(self.poll_interval):
+            try:
+                fields = self.reader()
+            except Exception as e:
+                self.stats["poll_errors"] += 1
+                logging.warning(f"Status poll failed: {e}")
+                continue
+            self.stats["polls"] += 1
+            if fields:
+                self.update("poll", **fields)
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats.update({"version": self.version, "poll_interval": self.poll_interval,
+                      "event_handlers": len(self.handlers)})
+        return stats
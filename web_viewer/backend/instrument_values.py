@@ -0,0 +1,217 @@
+"""
+Instrument readback collector (vacuum, temperatures, spray voltage, ...).
+
+Values are read from ``instrument.Control.InstrumentValues`` (see the
+InstrumentValues example). Every node is subscribed to once through
+``ContentChanged``. The event handler only parses the text and appends a
+``(name, time, value)`` tuple to a pending list. A flush thread moves the
+pending samples into the ring-buffered ``TimeSeriesStore`` in one batch per
+``flush_interval`` and hands the same batch to ``on_batch`` (e.g. the relay
+push). Scan handling never makes instrument-value interop calls.
+
+Nodes whose content does not change on its own can be polled as a fallback
+(``INSTRUMENT_VALUES_POLL``, seconds). Non-numeric contents are counted and
+skipped. The mock instrument feeds synthetic readbacks through the same path.
+"""
+
+import os
+import math
+import time
+import random
+import logging
+import threading
+
+
+def parse_value(text):
+    """Numeric part of a node content such as ``"3.5e-10"`` or ``"3500 V"``; ``None`` if not numeric."""
+    if text is None:
+        return None
+    token = str(text).strip().split(" ")[0].replace(",", "")
+    try:
+        value = float(token)
+    except ValueError:
+        return None
+    return value if math.isfinite(value) else None
+
+
+class MockValueSource:
+    """Synthetic readbacks around typical Orbitrap set points."""
+
+    SET_POINTS = {
+        "UHV Pressure": (3.0e-10, 0.05),
+        "Fore Vacuum Pressure": (1.6, 0.02),
+        "Ambient Temperature": (24.0, 0.01),
+        "Analyzer Temperature": (28.5, 0.002),
+        "Ion Transfer Tube Temperature": (320.0, 0.003),
+        "Vaporizer Temperature": (275.0, 0.004),
+        "Spray Voltage": (3500.0, 0.005),
+        "Spray Current": (2.4, 0.08),
+    }
+
+    def __init__(self, names=None):
+        self.names = [n for n in (names or self.SET_POINTS) if n in self.SET_POINTS] or list(self.SET_POINTS)
+
+    def read(self):
+        readings = []
+        for name in self.names:
+            center, spread = self.SET_POINTS[name]
+            readings.append((name, center * (1.0 + spread * random.gauss(0.0, 1.0))))
+        return readings
+
+
+class InstrumentValuesCollector:
+    """Collects instrument values into a ``TimeSeriesStore`` in batches."""
+
+    def __init__(self, store, names=(), flush_interval=1.0, poll_interval=None, on_batch=None):
+        self.store = store
+        self.names = list(names)
+        self.flush_interval = flush_interval
+        self.poll_interval = poll_interval
+        self.on_batch = on_batch
+        self.lock = threading.Lock()
+        self.pending = []
+        self.nodes = {}        # name -> (node, handler)
+        self.mock_source = None
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.last_poll = 0.0
+        self.stats = {"events": 0, "polls": 0, "samples": 0, "non_numeric": 0, "batches": 0, "batch_errors": 0}
+
+    @classmethod
+    def from_env(cls, store, on_batch=None):
+        names = os.environ.get("INSTRUMENT_VALUES", "")
+        poll = os.environ.get("INSTRUMENT_VALUES_POLL")
+        return cls(store,
+                   names=[n.strip() for n in names.split(",") if n.strip()],
+                   flush_interval=float(os.environ.get("INSTRUMENT_VALUES_FLUSH", 1.0)),
+                   poll_interval=float(poll) if poll else None,
+                   on_batch=on_batch)
+
+    def start(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.detach()
+
+    def attach(self, instrument):
+        """Subscribe to the configured value nodes of an instrument (all nodes when none are configured)."""
+        self.detach()
+        values = instrument.Control.InstrumentValues
+        names = self.names or [str(name) for name in values.ValueNames]
+        for name in names:
+            try:
+                node = values.Get(name)
+            except Exception as e:
+                logging.warning(f"Instrument value {name} not available: {e}")
+                continue
+            if node is None:
+                continue
+
+            def handler(sender, args, name=name):
+                self._on_content(name, args.Content)
+            node.ContentChanged += handler
+            with self.lock:
+                self.nodes[name] = (node, handler)
+            # Seed the series with the current content
+            self._on_content(name, node.Content)
+        logging.info(f"Collecting {len(self.nodes)} instrument value(s)")
+        return self.start()
+
+    def attach_mock(self):
+        self.detach()
+        self.mock_source = MockValueSource(self.names)
+        return self.start()
+
+    def detach(self):
+        with self.lock:
+            nodes, self.nodes = self.nodes, {}
+            self.mock_source = None
+        for name, (node, handler) in nodes.items():
+            try:
+                node.ContentChanged -= handler
+            except Exception as e:
+                logging.error(f"Error removing instrument value handler for {name}: {e}")
+
+    def _on_content(self, name, content):
+        text = getattr(content, "Content", None) if content is not None else None
+        value = parse_value(text)
+        with self.lock:
+            self.stats["events"] += 1
+            if value is None:
+                self.stats["non_numeric"] += 1
+                return
+            self.pending.append((name, time.time(), value))
+
+    def _poll(self):
+        """Read every node (or the mock source) once; only runs off the scan path."""
+        now = time.time()
+        with self.lock:
+            nodes = list(self.nodes.items())
+            source = self.mock_source
+        if source is not None:
+            readings = source.read()
+        else:
+            readings = []
+            for name, (node, _) in nodes:
+                try:
+                    readings.append((name, parse_value(getattr(node.Content, "Content", None))))
+                except Exception as e:
+                    logging.warning(f"Could not poll instrument value {name}: {e}")
+        with self.lock:
+            self.stats["polls"] += 1
+            for name, value in readings:
+                if value is None:
+                    self.stats["non_numeric"] += 1
+                    continue
+                self.pending.append((name, now, value))
+
+    def flush(self):
+        """Move pending samples into the store as one batch; returns the batch."""
+        with self.lock:
+            pending, self.pending = self.pending, []
+        if not pending:
+            return None
+        batch = {}
+        for name, t, value in pending:
+            series = batch.setdefault(name, {"t": [], "v": []})
+            series["t"].append(t)
+            series["v"].append(value)
+        self.store.add_batch(batch)
+        with self.lock:
+            self.stats["samples"] += len(pending)
+            self.stats["batches"] += 1
+        if self.on_batch is not None:
+            try:
+                self.on_batch(batch)
+            except Exception as e:
+                self.stats["batch_errors"] += 1
+                logging.error(f"Error forwarding instrument values: {e}")
+        return batch
+
+    def _run(self):
+        while not self.stop_event.wait(self.flush_interval):
+            now = time.time()
+            polling = self.mock_source is not None or self.poll_interval is not None
+            interval = self.poll_interval or self.flush_interval
+            if polling and now - self.last_poll >= interval:
+                self.last_poll = now
+                self._poll()
+            try:
+                self.flush()
+            except Exception as e:
+                logging.error(f"Error storing instrument values: {e}")
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.stats)
+            stats["nodes"] = sorted(self.nodes) if self.nodes else (self.mock_source.names if self.mock_source else [])
+            stats["pending"] = len(self.pending)
+        stats["flush_interval"] = self.flush_interval
+        stats["poll_interval"] = self.poll_interval
+        stats["store"] = self.store.get_stats()
+        return stats
@@ -1,20 +1,41 @@
+from __future__ import annotations
+
 import os
 import sys
 import time
-import json
 import signal
+import inspect
 import logging
-import clr
 import atexit
 import threading
 import requests
 import queue
+import numpy as np
 from datetime import datetime
-from flask import Flask, jsonify, Response, stream_with_context
-from flask_socketio import SocketIO
+from flask import Flask, jsonify, request, Response, stream_with_context, send_file
+from flask_socketio import SocketIO, join_room, leave_room, emit
 from flask_cors import CORS
 from threading import Lock
 
+# Modules shared with the relay (streaming, processing, export) live in ../../shared
+SHARED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared')
+sys.path.insert(0, SHARED_DIR)
+
+from mock_instrument import MockInstrumentConfig, MockSpectrumGenerator, MockAcquisition
+from profile_stream import ProfileChannel, extract_profile, synthesize_profile, parse_bin_width
+from spectrum_processing import ServerCentroider, Deisotoper, PeakFilter
+from scan_streaming import ScanFanout, EXTENDED_COLUMNS, add_summary, parse_stream_options, parse_event_id, sse_message
+import dotnet_runtime
+from dotnet_runtime import startup_timer
+from connection_state import ConnectionState, ReconnectSupervisor, CONNECTED, MOCK
+from scan_tracking import PipelineGaps, new_session_id
+from scan_metadata import MetadataCapture, activation_name, polarity_name, snapshot_section
+from centroid_columns import CentroidColumns, column_payload, synthesize_centroid_columns
+from timeseries import TimeSeriesStore, parse_time
+from instrument_values import InstrumentValuesCollector
+from instrument_status import InstrumentStatusCache, acquisition_fields
+from mzml_export import MzMLExporter
+
 # Configure logging
 # MODIFIED: Consolidated logging setup to include FileHandler for backend_debug.log
 log_file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend_debug.log')
@@ -32,184 +53,44 @@ logging.info(f"Backend script started. CWD: {os.getcwd()}")
 logging.info(f"Python executable: {sys.executable}")
 logging.info(f"sys.path: {sys.path}")
 
-# Initialize .NET runtime and load assemblies
-def initialize_dotnet(debug_mode=True):
-    # Set up API path
-    API_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib')
-    sys.path.append(API_PATH)
-    logging.info(f"API PATH: {API_PATH}")
-    
-    if debug_mode:
-        logging.info("Current directory structure:")
-        for root, dirs, files in os.walk(API_PATH):
-            logging.info(f"\nDirectory: {root}")
-            for d in dirs:
-                logging.info(f"  Dir: {d}")
-            for f in files:
-                logging.info(f"  File: {f}")
-    
-    def verify_assembly_path(path):
-        """Verify that the assembly file exists"""
-        if not os.path.exists(path):
-            logging.error(f"Assembly file not found: {path}")
-            logging.error(f"Directory contents: {os.listdir(os.path.dirname(path))}")
-            return False
-        if debug_mode:
-            logging.info(f"Verified assembly exists: {path}")
-            logging.info(f"File size: {os.path.getsize(path)} bytes")
-        return True
-    try:
-        import clr
-        import pythonnet
-        logging.info("Initializing .NET runtime...")
-        
-        # Ensure clean state
-        try:
-            pythonnet.load("coreclr")
-            if debug_mode:
-                logging.info("CoreCLR loaded successfully")
-        except Exception as e:
-            logging.warning(f"Initial runtime load attempt: {e}")
-        
-        # Load required assemblies with retry
-        max_retries = 3
-        retry_delay = 2
-        exploris_path = os.path.join(API_PATH, 'Exploris4.3-and-higher')
-        assemblies = [
-            os.path.join(exploris_path, 'Thermo.API.NetStd-1.0.dll'),
-            os.path.join(exploris_path, 'Thermo.API.Exploris.NetStd-1.0.dll'),
-            os.path.join(exploris_path, 'Thermo.API.Spectrum.NetStd-1.0.dll')
-        ]
-        
-        loaded_assemblies = []
-        for assembly_path in assemblies:
-            if not verify_assembly_path(assembly_path):
-                raise FileNotFoundError(f"Assembly not found: {assembly_path}")
-            
-            assembly_name = os.path.basename(assembly_path)
-            for attempt in range(max_retries):
-                try:
-                    if debug_mode:
-                        logging.info(f"Attempt {attempt + 1} to load assembly: {assembly_name}")
-                    clr.AddReference(assembly_path)
-                    loaded_assemblies.append(assembly_name)
-                    
-                    if debug_mode:
-                        try:
-                            assembly = clr.GetClrType(assembly_name.replace('.dll', '')).Assembly
-                            logging.info(f"Assembly {assembly_name} loaded successfully")
-                            logging.info(f"Version: {assembly.GetName().Version}")
-                        except Exception as e:
-                            logging.warning(f"Could not get assembly details: {e}")
-                    break
-                except Exception as e:
-                    if attempt == max_retries - 1:
-                        logging.error(f"Failed to load assembly {assembly_name} after {max_retries} attempts")
-                        logging.error(f"Error details: {str(e)}")
-                        logging.error(f"Loaded assemblies so far: {loaded_assemblies}")
-                        raise
-                    logging.warning(f"Attempt {attempt + 1} to load {assembly_name} failed: {e}")
-                    import time
-                    time.sleep(retry_delay)
-        
-        if debug_mode:
-            logging.info("Loaded assemblies summary:")
-            for assembly in loaded_assemblies:
-                logging.info(f"  - {assembly}")
-        
-        logging.info(".NET runtime initialized successfully")
-        return clr
-    except Exception as e:
-        logging.error(f"Failed to initialize .NET runtime: {e}")
-        raise
-
 # Clean up .NET runtime
 def cleanup_dotnet():
     try:
-        import pythonnet
-        logging.info("Cleaning up .NET runtime...")
-        try:
-            pythonnet.load("coreclr")
-            pythonnet.unload()
-            logging.info(".NET runtime cleanup completed")
-        except Exception as e:
-            logging.warning(f"Runtime cleanup warning: {e}")
+        dotnet_runtime.unload()
     except Exception as e:
         logging.error(f"Error during .NET runtime cleanup: {e}")
 
 # Register cleanup function
 atexit.register(cleanup_dotnet)
 
-# Initialize .NET runtime with retry
-max_init_retries = 3
-retry_delay = 2
+# Load the .NET runtime and the IAPI assemblies once, timing each phase.
+# Set DOTNET_DIAGNOSTICS=1 to log the lib tree and assembly versions.
 clr = None
-
-for init_attempt in range(max_init_retries):
-    try:
-        clr = initialize_dotnet()
-        if clr is not None:
-            break
-    except Exception as e:
-        if init_attempt == max_init_retries - 1:
-            raise Exception(f"Failed to initialize .NET runtime after {max_init_retries} attempts")
-        logging.warning(f"Runtime initialization attempt {init_attempt + 1} failed: {e}")
-        import time
-        time.sleep(retry_delay)
-
-# Add references to Thermo API assemblies
+dotnet_load_error = None
 try:
-    api_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'lib', 'Exploris4.3-and-higher')
-    logging.info(f"Loading assemblies from: {api_dir}")
-    
-    # Add the API directory to system path
-    if api_dir not in sys.path:
-        sys.path.append(api_dir)
+    with startup_timer.phase("dotnet_runtime"):
+        dotnet_runtime.load_runtime()
+    with startup_timer.phase("assemblies"):
+        clr = dotnet_runtime.load_assemblies()
+        clr.AddReference('System')
     
-    # Load required assemblies
-    clr.AddReference('System')
-    clr.AddReference(os.path.join(api_dir, 'Thermo.API.Exploris.NetStd-1.0'))
-    clr.AddReference(os.path.join(api_dir, 'Thermo.API.NetStd-1.0'))
-    
-    # Import required types
-    from System import EventHandler, EventArgs
-    from Thermo.Interfaces.ExplorisAccess_V1.Control.Acquisition import ExplorisAcquisitionOpeningEventArgs
-    from Thermo.Interfaces.InstrumentAccess_V1.MsScanContainer import MsScanEventArgs
-
-    logging.basicConfig(
-        filename='mass_spec.log',
-        level=logging.DEBUG,
-        format='%(asctime)s - %(levelname)s - %(message)s'
-    )
-    
-    # Add IAPI directory to Python path
-    iapi_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    lib_dir = os.path.join(iapi_dir, 'lib')
-    exploris_dir = os.path.join(lib_dir, 'Exploris4.3-and-higher')
-    sys.path.append(iapi_dir)
-    sys.path.append(lib_dir)
-    sys.path.append(exploris_dir)
-
-    # Import IAPI assemblies
-    clr.AddReference(os.path.join(exploris_dir, 'Thermo.API.NetStd-1.0.dll'))
-    clr.AddReference(os.path.join(exploris_dir, 'Thermo.API.Exploris.NetStd-1.0.dll'))
-    clr.AddReference(os.path.join(exploris_dir, 'Thermo.API.Spectrum.NetStd-1.0.dll'))
-
     # Import required .NET types
-    from System import Environment, IO
-    from Microsoft.Win32 import Registry, RegistryKey, RegistryHive, RegistryView
-    from System.Xml import XmlDocument
-    from System.Reflection import Assembly
-
-    from Thermo.Interfaces.ExplorisAccess_V1 import IExplorisInstrumentAccess, IExplorisInstrumentAccessContainer
-    from Thermo.Interfaces.ExplorisAccess_V1.Control.Acquisition import ExplorisAcquisitionOpeningEventArgs
-    from Thermo.Interfaces.ExplorisAccess_V1.MsScanContainer import IExplorisMsScan
-    from Thermo.Interfaces.InstrumentAccess_V1.MsScanContainer import MsScanEventArgs
+    with startup_timer.phase("type_imports"):
+        from System import EventHandler, EventArgs, Environment, IO
+        from Microsoft.Win32 import Registry, RegistryKey, RegistryHive, RegistryView
+        from System.Xml import XmlDocument
+        from System.Reflection import Assembly
+        
+        from Thermo.Interfaces.ExplorisAccess_V1 import IExplorisInstrumentAccess, IExplorisInstrumentAccessContainer
+        from Thermo.Interfaces.ExplorisAccess_V1.Control.Acquisition import ExplorisAcquisitionOpeningEventArgs
+        from Thermo.Interfaces.ExplorisAccess_V1.MsScanContainer import IExplorisMsScan
+        from Thermo.Interfaces.InstrumentAccess_V1.MsScanContainer import MsScanEventArgs
+    logging.info(".NET runtime initialized successfully")
     
 except Exception as e:
     logging.error(f"Failed to load Thermo API assemblies: {e}")
-    # Continue execution in mock mode if assemblies fail to load
-    pass
+    # Continue execution; connecting then fails and MOCK_FALLBACK decides what follows
+    dotnet_load_error = e
 
 def get_api_instance():
     """Create an instance of the API object and return it."""
@@ -261,11 +142,43 @@ socketio = SocketIO(
     ping_interval=25
 )
 
-# Queue to store scan data for SSE clients
-scan_data_queue = queue.Queue(maxsize=100)
+# Scans (and approximate bytes) each fan-out keeps for clients resuming with their last event ID
+SCAN_REPLAY_BUFFER = int(os.environ.get('SCAN_REPLAY_BUFFER', 500))
+SCAN_REPLAY_BYTES = int(os.environ.get('SCAN_REPLAY_BYTES', 64 * 1024 * 1024))
+# Scan fan-out to Socket.IO rooms and per-client SSE queues
+scan_fanout = ScanFanout(socketio, replay_size=SCAN_REPLAY_BUFFER, replay_bytes=SCAN_REPLAY_BYTES)
+# Opt-in profile spectrum subscribers (Socket.IO rooms and SSE queues)
+profile_channel = ProfileChannel()
+# Optional server-side centroiding of profile data (SERVER_CENTROIDING=off|attach|replace)
+server_centroider = ServerCentroider.from_env()
+# Optional isotope envelope grouping / charge deconvolution (DEISOTOPING=on)
+deisotoper = Deisotoper.from_env()
+# Optional intensity / relative / S/N threshold on centroids at ingest (PEAK_FILTER=on)
+peak_filter = PeakFilter.from_env()
+# Typed header/trailer record per scan (SCAN_METADATA_FIELDS, SCAN_METADATA_EXTRA, SCAN_METADATA_RAW)
+metadata_capture = MetadataCapture.from_env()
+# Extended centroid columns extracted on demand (CENTROID_COLUMNS to always extract some)
+centroid_columns = CentroidColumns.from_env()
+# Incremental mzML export per acquisition session (MZML_EXPORT_DIR, off when unset)
+mzml_exporter = MzMLExporter.from_env()
+# Fall back to the mock instrument when the instrument connection fails
+MOCK_FALLBACK = os.environ.get('MOCK_FALLBACK', '1').lower() in ('1', 'true', 'yes', 'on')
+# Idle SSE connections wake up once per interval to send a keep-alive comment
+SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', 15))
 # Remote endpoint configuration
-REMOTE_ENDPOINT = None  # Set this to your remote service URL, e.g., "https://your-relay-service.com/api/data"
-REMOTE_API_KEY = None   # Set this to your API key if your remote service requires authentication
+REMOTE_ENDPOINT = os.environ.get('REMOTE_ENDPOINT')  # Set this to your remote service URL, e.g., "https://your-relay-service.com/api/data"
+REMOTE_API_KEY = os.environ.get('REMOTE_API_KEY')    # Set this to your API key if your remote service requires authentication
+# Scans waiting to be pushed to the remote endpoint; the oldest is dropped when full
+REMOTE_QUEUE_SIZE = int(os.environ.get('REMOTE_QUEUE_SIZE', 1000))
+# Instrument value batches go to the relay's /api/instrument_values next to /api/data
+REMOTE_VALUES_ENDPOINT = os.environ.get('REMOTE_VALUES_ENDPOINT') or (
+    REMOTE_ENDPOINT[:-len('/data')] + '/instrument_values' if REMOTE_ENDPOINT and REMOTE_ENDPOINT.endswith('/data') else None)
+# Acquisition session records go to the relay's /api/sessions
+REMOTE_SESSIONS_ENDPOINT = os.environ.get('REMOTE_SESSIONS_ENDPOINT') or (
+    REMOTE_ENDPOINT[:-len('/data')] + '/sessions' if REMOTE_ENDPOINT and REMOTE_ENDPOINT.endswith('/data') else None)
+
+# Scan sequence continuity at each pipeline stage (see scan_tracking.py)
+pipeline_gaps = PipelineGaps(("callback", "fanout", "push"))
 
 # Default scan data structure
 DEFAULT_SCAN_DATA = {
@@ -278,6 +191,224 @@ DEFAULT_SCAN_DATA = {
     "intensities": []
 }
 
+class RemotePusher:
+    """Pushes scans to REMOTE_ENDPOINT in order from a single worker thread.
+    
+    A bounded queue decouples the scan handler from the network; when the
+    remote end falls behind, the oldest queued scan is dropped and counted.
+    """
+
+    def __init__(self, queue_size=REMOTE_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.session = requests.Session()
+        self.thread = None
+        self.lock = Lock()
+        self.stats = {"queued": 0, "pushed": 0, "failed": 0, "dropped": 0}
+
+    def submit(self, scan_data):
+        if self.thread is None:
+            with self.lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(scan_data)
+        except queue.Full:
+            try:
+                self.queue.get_nowait()
+                self.stats["dropped"] += 1
+                self.queue.put_nowait(scan_data)
+            except (queue.Empty, queue.Full):
+                self.stats["dropped"] += 1
+        self.stats["queued"] += 1
+
+    def _run(self):
+        while True:
+            scan_data = self.queue.get()
+            if push_to_remote(scan_data, self.session):
+                self.stats["pushed"] += 1
+                pipeline_gaps.observe("push", scan_data)
+            else:
+                self.stats["failed"] += 1
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        stats["endpoint"] = REMOTE_ENDPOINT
+        stats["backlog"] = self.queue.qsize()
+        return stats
+
+
+remote_pusher = RemotePusher()
+
+# Instrument readbacks (vacuum, temperatures, spray voltage) as ring-buffered time series
+instrument_values_store = TimeSeriesStore(capacity=int(os.environ.get('INSTRUMENT_VALUES_CAPACITY', 86400)))
+values_session = requests.Session()
+
+def push_instrument_values(batch):
+    push_to_remote({"instrument_values": batch}, values_session, REMOTE_VALUES_ENDPOINT)
+
+instrument_values = InstrumentValuesCollector.from_env(
+    instrument_values_store, on_batch=push_instrument_values if REMOTE_VALUES_ENDPOINT else None)
+
+# Recent acquisition sessions (session_id -> record), oldest first
+acquisition_sessions = {}
+MAX_SESSION_RECORDS = 100
+
+def record_session(session):
+    """Keep a session record and send it to the relay (off the calling thread)"""
+    acquisition_sessions[session["session_id"]] = dict(session)
+    while len(acquisition_sessions) > MAX_SESSION_RECORDS:
+        del acquisition_sessions[next(iter(acquisition_sessions))]
+    if session.get("ended_at"):
+        mzml_exporter.finish(session["session_id"])
+    if REMOTE_SESSIONS_ENDPOINT:
+        threading.Thread(target=push_to_remote, args=({"session": dict(session)}, None, REMOTE_SESSIONS_ENDPOINT),
+                         daemon=True).start()
+
+# Instrument status served from memory, kept current by events (see instrument_status.py);
+# every change is pushed to Socket.IO clients as a 'status' event
+instrument_status = InstrumentStatusCache.from_env()
+instrument_status.add_listener(lambda snapshot: socketio.emit('status', snapshot))
+
+
+class DetectorStream:
+    """One MS scan container of an attached instrument.
+
+    Each stream has its own scan handler, scan counter, latest scan and
+    fan-out (rooms prefixed with the stream id), so detectors are ingested
+    independently of each other.
+    """
+
+    def __init__(self, instrument_id, detector_index, container=None, detector_class=None):
+        self.instrument_id = instrument_id
+        self.detector_index = detector_index
+        self.stream_id = f"{instrument_id}/{detector_index}"
+        # Changes with every acquisition stream; scans are keyed by (session_id, scan_number)
+        self.session_id = new_session_id(str(instrument_id))
+        self.container = container
+        self.detector_class = detector_class
+        self.scan_handler = None
+        self.scan_counter = 0
+        self.last_scan_time = None
+        self.lock = Lock()
+        self.scan_data = DEFAULT_SCAN_DATA.copy()
+        self.fanout = ScanFanout(socketio, room_prefix=f"{self.stream_id}:", replay_size=SCAN_REPLAY_BUFFER,
+                                 replay_bytes=SCAN_REPLAY_BYTES)
+
+    def attach(self, on_scan, container=None):
+        """Register ``on_scan(sender, args, stream)`` for this container's scans.
+        
+        Any handler registered earlier is removed first, so re-attaching after
+        a reconnect never leaves duplicate handlers behind.
+        """
+        self.detach()
+        if container is not None:
+            self.container = container
+        
+        def scan_handler(sender, args):
+            on_scan(sender, args, self)
+        self.scan_handler = scan_handler
+        self.container.MsScanArrived += self.scan_handler
+
+    def detach(self):
+        if self.scan_handler is not None and self.container is not None:
+            try:
+                self.container.MsScanArrived -= self.scan_handler
+                logging.info(f"Removed scan handler for stream {self.stream_id}")
+            except Exception as e:
+                logging.error(f"Error removing scan handler for stream {self.stream_id}: {e}")
+        self.scan_handler = None
+
+    def next_scan_number(self):
+        with self.lock:
+            self.scan_counter += 1
+            return self.scan_counter
+
+    def publish(self, scan_data):
+        with self.lock:
+            self.scan_data = scan_data
+            self.last_scan_time = scan_data.get('timestamp')
+        self.fanout.publish(scan_data)
+
+    def get_current_scan_data(self):
+        with self.lock:
+            return self.scan_data.copy()
+
+    def describe(self):
+        return {
+            "stream_id": self.stream_id,
+            "session_id": self.session_id,
+            "instrument_id": self.instrument_id,
+            "detector": self.detector_index,
+            "detector_class": self.detector_class,
+            "scans_received": self.scan_counter,
+            "last_scan_time": self.last_scan_time,
+            "subscribers": self.fanout.get_stats()
+        }
+
+
+class AttachedInstrument:
+    """An instrument from the access container with its acquisition handlers and detector streams"""
+
+    def __init__(self, instrument_id, instrument, name=None):
+        self.instrument_id = instrument_id
+        self.instrument = instrument
+        self.name = name
+        self.detectors = []
+        self.opening_handler = None
+        self.closing_handler = None
+        self.acquisition_start_time = None
+        self.session = None
+
+    def new_session(self, metadata=None):
+        """Start a new acquisition session shared by all detectors of this instrument"""
+        session_id = new_session_id(str(self.instrument_id))
+        for stream in self.detectors:
+            stream.session_id = session_id
+        self.session = {
+            "session_id": session_id,
+            "instrument_id": str(self.instrument_id),
+            "instrument_name": self.name,
+            "detectors": [stream.stream_id for stream in self.detectors],
+            "started_at": datetime.now().isoformat(),
+            "ended_at": None,
+            "metadata": metadata or {}
+        }
+        record_session(self.session)
+        return session_id
+
+    def end_session(self):
+        """Mark the current session as finished"""
+        if self.session is not None and self.session["ended_at"] is None:
+            self.session["ended_at"] = datetime.now().isoformat()
+            record_session(self.session)
+
+    def detach(self):
+        """Unregister every handler registered on this instrument"""
+        for stream in self.detectors:
+            stream.detach()
+        try:
+            if self.instrument is not None and hasattr(self.instrument, 'Control') and hasattr(self.instrument.Control, 'Acquisition'):
+                if self.opening_handler is not None:
+                    self.instrument.Control.Acquisition.AcquisitionStreamOpening -= self.opening_handler
+                    logging.info(f"Removed opening handler for instrument {self.instrument_id}")
+                if self.closing_handler is not None:
+                    self.instrument.Control.Acquisition.AcquisitionStreamClosing -= self.closing_handler
+                    logging.info(f"Removed closing handler for instrument {self.instrument_id}")
+        except Exception as e:
+            logging.error(f"Error removing acquisition handlers for instrument {self.instrument_id}: {e}")
+        self.opening_handler = None
+        self.closing_handler = None
+
+    def describe(self):
+        return {
+            "instrument_id": self.instrument_id,
+            "name": self.name,
+            "acquisition_start_time": self.acquisition_start_time.isoformat() if self.acquisition_start_time else None,
+            "detectors": [stream.describe() for stream in self.detectors]
+        }
+
+
 class MassSpectrometer:
     def __init__(self, mock_mode=False):
         logging.info("Initializing MassSpectrometer")
@@ -287,53 +418,107 @@ class MassSpectrometer:
         self.orbitrap = None
         self.scan_data = DEFAULT_SCAN_DATA.copy()
         self.acquisition_start_time = None
-        self.opening_handler = None
-        self.closing_handler = None
-        self.scan_handler = None
+        # instrument_id -> AttachedInstrument; the first one is the primary
+        # instrument exposed through self.instrument / self.orbitrap
+        self.instruments = {}
+        # stream_id -> DetectorStream, kept across reconnects so subscribers
+        # and scan counters survive a dropped link
+        self.streams = {}
         self.lock = Lock()
-        self.heartbeat_thread = None
+        # Serializes connection attempts (initial connect and supervisor)
+        self.connect_lock = Lock()
+        self.supervisor = None
         self.is_running = True
         self.mock_mode = mock_mode
         self.mock_connected = False
         self.mock_online_access = False
         self.mock_acquisition_active = False
         self.mock_scan_counter = 0
+        self.mock_config = None
+        self.mock_acquisition = None
+        # Observable connection state machine, see connection_state.py
+        self.connection = ConnectionState()
+        self.connection.add_listener(self._on_connection_state)
+        self.connect_thread = None
+        # Slow fallback poll behind the event-driven status cache
+        instrument_status.start_polling(self._read_instrument_status)
         
-
-        
-        try:
-            if mock_mode:
+        if mock_mode:
+            try:
                 self._initialize_mock_instrument()
-            else:
-                self._initialize_instrument()
-            self._start_heartbeat()
+            except Exception as e:
+                logging.error(f"Initialization error: {e}")
+                self.cleanup()
+                raise
+        else:
+            # Connect in the background so the server can start serving right away
+            self.start_connection()
+    
+    def start_connection(self):
+        """Connect to the instrument(s) on a background thread"""
+        if self.connect_thread is not None and self.connect_thread.is_alive():
+            return self.connect_thread
+        self.connect_thread = threading.Thread(target=self._connect_in_background, daemon=True)
+        self.connect_thread.start()
+        return self.connect_thread
+    
+    def _connect_in_background(self):
+        try:
+            self._initialize_instrument()
+            self._start_supervisor(connected=True)
         except Exception as e:
             logging.error(f"Initialization error: {e}")
-            if not mock_mode:
+            if not self.is_running:
+                return
+            if MOCK_FALLBACK:
                 logging.info("Falling back to mock mode...")
                 self.mock_mode = True
                 self._initialize_mock_instrument()
-                self._start_heartbeat()
             else:
-                self.cleanup()
-                raise
+                # Keep trying in the background with backoff
+                self._start_supervisor(connected=False)
     
-    def _start_heartbeat(self):
-        """Start a heartbeat thread to monitor instrument connection"""
-        def heartbeat():
-            while self.is_running:
-                try:
-                    if self.instrument and hasattr(self.instrument, 'IsConnected'):
-                        if not self.instrument.IsConnected:
-                            logging.warning("Instrument connection lost, attempting to reconnect...")
-                            self._initialize_instrument()
-                    time.sleep(5)  # Check every 5 seconds
-                except Exception as e:
-                    logging.error(f"Heartbeat error: {e}")
-                    time.sleep(5)  # Wait before next check
-        
-        self.heartbeat_thread = threading.Thread(target=heartbeat, daemon=True)
-        self.heartbeat_thread.start()
+    def _start_supervisor(self, connected):
+        """Start the reconnect supervisor (liveness probes, backoff, outage tracking)"""
+        if self.supervisor is None:
+            self.supervisor = ReconnectSupervisor.from_env(
+                self.connection,
+                probe=self._probe_connection,
+                reconnect=self._reconnect,
+                scan_count=self._total_scan_count
+            )
+        self.supervisor.start(connected=connected)
+    
+    def _probe_connection(self):
+        """Cheap liveness check: reads connection flags only, no API calls that block"""
+        if self.container is None or not self.container.ServiceConnected:
+            return False
+        for attached in list(self.instruments.values()):
+            if attached.instrument is None or not attached.instrument.Connected:
+                return False
+        return bool(self.instruments)
+    
+    def _reconnect(self):
+        """One connection attempt; the supervisor owns retries and backoff"""
+        self._initialize_instrument(max_retries=1, retry_delay=0)
+    
+    def _on_connection_state(self, state, previous):
+        instrument_status.update("connection", connection_state=state,
+                                 instrument_connected=state in (CONNECTED, MOCK))
+    
+    def _read_instrument_status(self):
+        """Live status read for the fallback poll; never called per request"""
+        if self.mock_mode:
+            return {"online_access": self.mock_online_access,
+                    "acquisition_active": self.mock_acquisition_active}
+        if self.instrument is None or self.container is None or not self.connection.is_connected():
+            return {"online_access": False, "acquisition_active": False}
+        fields = {"online_access": bool(self.container.ServiceConnected)}
+        fields.update(acquisition_fields(self.instrument.Control.Acquisition.State))
+        return fields
+    
+    def _total_scan_count(self):
+        return sum(stream.scan_counter for stream in list(self.streams.values()))
     
     def _initialize_mock_instrument(self):
         """Initialize a mock instrument for testing when no physical instrument is available"""
@@ -342,260 +527,378 @@ class MassSpectrometer:
         self.mock_online_access = True
         self.mock_acquisition_active = False
         self.mock_scan_counter = 0
+        self.mock_config = MockInstrumentConfig.from_env()
+        if self.mock_acquisition is not None:
+            self.mock_acquisition.stop()
+        self.mock_acquisition = None
+        
+        self.connection.set_state(MOCK)
         
-        # Generate some mock scan data
-        import random
-        import numpy as np
+        # The mock instrument exposes a single detector stream, "mock/0"
+        mock_instrument = AttachedInstrument("mock", None, name="Mock instrument")
+        mock_instrument.detectors.append(DetectorStream("mock", 0, detector_class="Mock"))
+        self.instruments = {"mock": mock_instrument}
+        instrument_values.attach_mock()
+        instrument_status.update("mock", online_access=True, acquisition_active=False)
         
-        # Create realistic mass spectrum data
-        masses = np.linspace(100, 1000, 100)
-        intensities = np.random.exponential(1000, 100) * np.random.random(100)
+        # Seed the current scan with one generated spectrum
+        spectrum = MockSpectrumGenerator(self.mock_config).generate_batch(1)[0]
+        self.scan_data = self._build_mock_scan_data(spectrum, 1)
         
-        self.scan_data = {
+        logging.info("Mock instrument initialized successfully")
+    
+    def _build_mock_scan_data(self, spectrum, scan_number):
+        """Convert a generated spectrum into the scan payload used by real scans"""
+        masses = spectrum["masses"]
+        intensities = spectrum["intensities"]
+        metadata = metadata_capture.to_dict(metadata_capture.parse(self._mock_scan_sections(spectrum, scan_number)))
+        base_index = int(np.argmax(intensities)) if intensities.size else 0
+        return {
             "timestamp": datetime.now().isoformat(),
-            "scan_number": 1,
-            "tic": float(np.sum(intensities)),
-            "base_peak_mass": float(masses[np.argmax(intensities)]),
-            "base_peak_intensity": float(np.max(intensities)),
+            "scan_number": scan_number,
+            "tic": float(intensities.sum()),
+            "base_peak_mass": float(masses[base_index]) if masses.size else 0.0,
+            "base_peak_intensity": float(intensities[base_index]) if intensities.size else 0.0,
             "masses": masses.tolist(),
-            "intensities": intensities.tolist()
+            "intensities": intensities.tolist(),
+            "centroid_count": int(masses.size),
+            "ms_order": spectrum["ms_order"],
+            "polarity": spectrum["polarity"],
+            "precursor_mz": spectrum["precursor_mz"],
+            "activation": activation_name(metadata.get("activation")),
+            "metadata": metadata
+        }
+    
+    def _mock_scan_sections(self, spectrum, scan_number):
+        """Header/trailer strings as the instrument would report them for a generated spectrum"""
+        started = self.instruments["mock"].acquisition_start_time if "mock" in self.instruments else None
+        retention_time = (datetime.now() - started).total_seconds() / 60.0 if started else 0.0
+        header = {
+            "Scan": str(scan_number),
+            "MSOrder": str(spectrum["ms_order"]),
+            "Polarity": "0" if spectrum["polarity"] == "Positive" else "1",
+            "StartTime": f"{retention_time:.5f}",
+            "FirstMass": str(self.mock_config.mz_min),
+            "LastMass": str(self.mock_config.mz_max)
         }
+        if spectrum["precursor_mz"] is not None:
+            header["PrecursorMass[0]"] = f"{spectrum['precursor_mz']:.5f}"
+            # Exploris instruments fragment with HCD
+            header["Filter"] = f"FTMS + p NSI d Full ms2 {spectrum['precursor_mz']:.2f}@hcd30.00"
+        return {"Header": header, "Trailer": {"Access Id:": str(scan_number)}}
+    
+    def _start_mock_data_generation(self, overrides=None):
+        """Start generating mock scan data at the configured rate.
         
-        logging.info("Mock instrument initialized successfully")
+        ``overrides`` may carry any MockInstrumentConfig field (scan rate,
+        centroid counts, MS1/MS2 mix, polarity switching, ...).
+        """
+        config = MockInstrumentConfig.from_env().update(overrides)
+        self.mock_config = config
+        # A previous run may still be winding down after a quick stop and start
+        if self.mock_acquisition is not None:
+            self.mock_acquisition.stop()
+        
+        # Each mock acquisition is a new session whose scan numbers start at 1
+        mock_instrument = self.instruments["mock"]
+        mock_instrument.new_session({"mock_config": config.to_dict()})
+        mock_instrument.acquisition_start_time = datetime.now()
+        stream = mock_instrument.detectors[0]
+        stream.scan_counter = 0
+        
+        def on_mock_scan(spectrum):
+            self.mock_scan_counter = stream.next_scan_number()
+            pipeline_gaps.observe("callback", {"session_id": stream.session_id,
+                                               "stream_id": stream.stream_id,
+                                               "scan_number": self.mock_scan_counter})
+            columns = centroid_columns.wanted(scan_fanout, stream.fanout)
+            centroids = synthesize_centroid_columns(spectrum, filter_columns(columns))
+            # Filter before the TIC, base peak and centroid count are derived
+            filtered = {}
+            if peak_filter.enabled:
+                centroids = peak_filter.filter_centroids(centroids, filtered, columns)
+            scan_data = self._build_mock_scan_data(
+                dict(spectrum, masses=centroids["mz"], intensities=centroids["intensity"]), self.mock_scan_counter)
+            scan_data['native_scan_number'] = self.mock_scan_counter
+            scan_data.update(filtered)
+            if columns:
+                scan_data['centroid_columns'] = column_payload(centroids, columns)
+            want_profile = profile_channel.has_subscribers()
+            if want_profile or server_centroider.enabled:
+                profile_mz, profile_intensity = synthesize_profile(spectrum["masses"], spectrum["intensities"])
+                if server_centroider.enabled:
+                    server_centroider.apply(scan_data, profile_mz, profile_intensity)
+            if deisotoper.enabled:
+                deisotoper.apply(scan_data)
+            self._publish_scan(scan_data, stream)
+            if want_profile:
+                profile_channel.publish(socketio, stream.stream_id, self.mock_scan_counter, profile_mz, profile_intensity)
+        
+        def is_active():
+            return self.is_running and self.mock_mode and self.mock_acquisition_active
+        
+        logging.info(f"Starting mock acquisition: {config.to_dict()}")
+        self.mock_acquisition = MockAcquisition(config, on_mock_scan, is_active).start()
     
-    def _start_mock_data_generation(self):
-        """Start generating mock scan data periodically"""
-        def generate_mock_scan():
-            while self.is_running and self.mock_mode and self.mock_acquisition_active:
-                try:
-                    import random
-                    import numpy as np
-                    
-                    # Generate realistic mass spectrum data with some variation
-                    masses = np.linspace(100, 1000, 100)
-                    base_intensities = np.random.exponential(1000, 100) * np.random.random(100)
-                    # Add some noise and variation
-                    intensities = base_intensities * (0.8 + 0.4 * np.random.random(100))
-                    
-                    self.mock_scan_counter += 1
-                    
-                    with self.lock:
-                        self.scan_data = {
-                            "timestamp": datetime.now().isoformat(),
-                            "scan_number": self.mock_scan_counter,
-                            "tic": float(np.sum(intensities)),
-                            "base_peak_mass": float(masses[np.argmax(intensities)]),
-                            "base_peak_intensity": float(np.max(intensities)),
-                            "masses": masses.tolist(),
-                            "intensities": intensities.tolist()
-                        }
-                    
-                    # Emit scan data via WebSocket
-                    socketio.emit('scan_data', self.scan_data)
-                    
-                    time.sleep(1)  # Generate new scan every second
-                except Exception as e:
-                    logging.error(f"Error generating mock scan data: {e}")
-                    time.sleep(1)
+    def _initialize_instrument(self, max_retries=5, retry_delay=3):
+        """Initialize the instrument connection with retry mechanism and detailed logging.
         
-        mock_thread = threading.Thread(target=generate_mock_scan, daemon=True)
-        mock_thread.start()
+        Each step runs as a phase of ``self.connection``; raises on failure.
+        Only one attempt runs at a time.
+        """
+        with self.connect_lock:
+            self._run_connection_sequence(max_retries, retry_delay)
     
-    def _initialize_instrument(self):
-        """Initialize the instrument connection with retry mechanism and detailed logging"""
+    def _run_connection_sequence(self, max_retries, retry_delay):
+        self.connection.begin_attempt()
         try:
             # Create API instance with retry
-            logging.info("Getting API instance...")
-            max_retries = 5
-            retry_delay = 3  # seconds
-            
-            for attempt in range(max_retries):
-                try:
-                    logging.info(f"\n=== Initialization Attempt {attempt + 1} ===")
-                    self.container = get_api_instance()
-                    logging.debug(f"Container type: {type(self.container)}")
-                    
-                    if isinstance(self.container, IExplorisInstrumentAccessContainer):
-                        logging.info("API instance created successfully")
-                        break
-                    logging.warning("Invalid container type returned, retrying...")
-                    
-                except Exception as e:
-                    logging.error(f"=== Attempt {attempt + 1} failed: {str(e)} ===")
-                    if attempt < max_retries - 1:
-                        logging.info(f"Retrying in {retry_delay} seconds...")
-                        time.sleep(retry_delay)
-                    else:
-                        logging.error("Max retries reached. Failed to create API instance")
-                        raise Exception(f"Failed to create API instance after {max_retries} attempts: {e}")
+            with self.connection.phase("creating_api"):
+                if dotnet_load_error is not None:
+                    raise RuntimeError(f"Thermo API assemblies are not loaded ({dotnet_load_error}); "
+                                       "install the instrument runtime or set MOCK_FALLBACK=1")
+                logging.info("Getting API instance...")
+                self.container = self._create_api_instance(max_retries, retry_delay)
             
             # Start online access following the pattern from working examples
-            logging.info("Starting online access...")
-            self.container.StartOnlineAccess()
+            with self.connection.phase("starting_online_access"):
+                logging.info("Starting online access...")
+                self.container.StartOnlineAccess()
             
             # Wait for service connection following the example pattern
-            logging.info("Waiting for service connection...")
-            max_wait_time = 30  # seconds
-            start_time = datetime.now()
-            
-            while not self.container.ServiceConnected:
-                elapsed = (datetime.now() - start_time).total_seconds()
-                if elapsed > max_wait_time:
-                    raise Exception(f"Service connection timeout after {max_wait_time} seconds")
+            with self.connection.phase("waiting_for_service"):
+                logging.info("Waiting for service connection...")
+                max_wait_time = 30  # seconds
+                start_time = datetime.now()
                 
-                logging.info(f"Waiting for service connection... ({elapsed:.1f}s)")
-                time.sleep(0.5)
-            
-            logging.info("Service connection established successfully")
+                while not self.container.ServiceConnected:
+                    elapsed = (datetime.now() - start_time).total_seconds()
+                    if elapsed > max_wait_time:
+                        raise Exception(f"Service connection timeout after {max_wait_time} seconds")
+                    
+                    logging.info(f"Waiting for service connection... ({elapsed:.1f}s)")
+                    time.sleep(0.5)
+                
+                logging.info("Service connection established successfully")
             
             # Now try to get instrument IDs
-            logging.info("Getting instrument IDs...")
-            instrument_ids = None
+            with self.connection.phase("discovering_instruments"):
+                logging.info("Getting instrument IDs...")
+                instrument_ids = self._get_instrument_ids(max_retries, retry_delay)
             
-            for attempt in range(max_retries):
+            # Attach every instrument and every MS detector in this one process
+            with self.connection.phase("attaching"):
+                self._detach_instruments()
+                attached_instruments = {}
+                for instrument_id in instrument_ids:
+                    instrument_id = int(instrument_id)
+                    try:
+                        attached_instruments[instrument_id] = self._attach_instrument(instrument_id, max_retries, retry_delay)
+                    except Exception as e:
+                        # A failing instrument must not take the others down with it
+                        logging.error(f"Failed to attach instrument {instrument_id}: {e}")
+                
+                if not attached_instruments:
+                    raise Exception("Failed to establish stable instrument connection")
+                
+                self.instruments = attached_instruments
+                primary = next(iter(self.instruments.values()))
+                self.instrument = primary.instrument
+                self.orbitrap = primary.detectors[0].container if primary.detectors else None
+                logging.info(f"Attached {len(self.instruments)} instrument(s), "
+                             f"{sum(len(a.detectors) for a in self.instruments.values())} detector stream(s)")
+                
+                # Readbacks and status events are optional; a failure here must not fail the connection
                 try:
-                    logging.info(f"Attempt {attempt + 1} of {max_retries} to get instrument IDs...")
-                    instrument_ids = self.container.GetInstrumentIds()
-                    
-                    if not instrument_ids:
-                        raise Exception("GetInstrumentIds returned None")
-                    
-                    if len(instrument_ids) == 0:
-                        raise Exception("No instruments found")
-                    
-                    logging.info(f"Found {len(instrument_ids)} instrument(s)")
-                    break
-                    
+                    instrument_values.attach(primary.instrument)
                 except Exception as e:
-                    logging.error(f"Failed to get instrument IDs (attempt {attempt + 1}): {e}")
-                    if attempt < max_retries - 1:
-                        logging.info(f"Waiting {retry_delay} seconds before retry...")
-                        time.sleep(retry_delay)
-                    else:
-                        raise Exception(f"Failed to get instrument IDs after {max_retries} attempts: {e}")
-            
-            if not instrument_ids:
-                raise Exception("Failed to get instrument IDs: No valid response received")
-            
-            # Get first available instrument with retry
-            logging.info("Getting instrument...")
-            if not instrument_ids or len(instrument_ids) == 0:
-                raise Exception("No instrument IDs available")
-            
-            logging.info(f"Attempting to connect to instrument ID: {instrument_ids[0]}")
-            connection_success = False
-            
-            for attempt in range(max_retries):
+                    logging.warning(f"Instrument values unavailable: {e}")
                 try:
-                    logging.info(f"Attempt {attempt + 1} of {max_retries} to connect to instrument...")
-                    self.instrument = self.container.Get(instrument_ids[0])
-                    
-                    if self.instrument is None:
-                        raise Exception("Get() returned None for instrument")
-                    
-                    logging.info(f"Got instrument object, name: {self.instrument.InstrumentName if hasattr(self.instrument, 'InstrumentName') else 'Unknown'}")
-                    logging.info("Instrument connection established successfully")
-                    connection_success = True
-                    break
-                        
+                    instrument_status.attach(primary.instrument, self.container)
                 except Exception as e:
-                    logging.error(f"Instrument connection attempt {attempt + 1} failed: {e}")
-                    if attempt < max_retries - 1:
-                        logging.info(f"Waiting {retry_delay} seconds before retry...")
-                        time.sleep(retry_delay)
-                    else:
-                        raise Exception(f"Failed to establish stable instrument connection after {max_retries} attempts: {e}")
-            
-            if not connection_success:
-                raise Exception("Failed to establish stable instrument connection")
-            
-            logging.info("Instrument connection established successfully")
+                    logging.warning(f"Instrument status events unavailable, polling only: {e}")
             
-            # Get Orbitrap detector
-            logging.info("Getting Orbitrap detector...")
+            self.connection.set_state(CONNECTED)
+        except Exception as e:
+            logging.error(f"Error initializing mass spectrometer: {e}")
+            import traceback
+            logging.error("Traceback:")
+            logging.error(traceback.format_exc())
+            self._detach_instruments()
+            self.instrument = None
+            self.orbitrap = None
+            self.connection.fail(e)
+            raise
+    
+    def _create_api_instance(self, max_retries, retry_delay):
+        for attempt in range(max_retries):
             try:
-                self.orbitrap = self.instrument.GetMsScanContainer(0)
-                if self.orbitrap is None:
-                    raise Exception("Failed to get MS scan container")
-                logging.info(f"Connected to detector: {self.orbitrap.DetectorClass}")
+                logging.info(f"\n=== Initialization Attempt {attempt + 1} ===")
+                container = get_api_instance()
+                logging.debug(f"Container type: {type(container)}")
+                
+                if isinstance(container, IExplorisInstrumentAccessContainer):
+                    logging.info("API instance created successfully")
+                    return container
+                logging.warning("Invalid container type returned, retrying...")
+                
             except Exception as e:
-                logging.error(f"Failed to get Orbitrap detector: {e}")
-                raise
-            
-            logging.info("Setting up event handlers...")
+                logging.error(f"=== Attempt {attempt + 1} failed: {str(e)} ===")
+                if attempt < max_retries - 1:
+                    logging.info(f"Retrying in {retry_delay} seconds...")
+                    time.sleep(retry_delay)
+                else:
+                    logging.error("Max retries reached. Failed to create API instance")
+                    raise Exception(f"Failed to create API instance after {max_retries} attempts: {e}")
+        raise Exception(f"Failed to create API instance after {max_retries} attempts: invalid container type")
+    
+    def _get_instrument_ids(self, max_retries, retry_delay):
+        for attempt in range(max_retries):
             try:
-                # Unregister any existing handlers first
-                if hasattr(self, 'opening_handler') and self.opening_handler is not None:
-                    self.instrument.Control.Acquisition.AcquisitionStreamOpening -= self.opening_handler
-                if hasattr(self, 'closing_handler') and self.closing_handler is not None:
-                    self.instrument.Control.Acquisition.AcquisitionStreamClosing -= self.closing_handler
-                if hasattr(self, 'scan_handler') and self.scan_handler is not None:
-                    self.orbitrap.MsScanArrived -= self.scan_handler
+                logging.info(f"Attempt {attempt + 1} of {max_retries} to get instrument IDs...")
+                instrument_ids = self.container.GetInstrumentIds()
                 
-                # Create and register event handlers
-                try:
-                    # Create delegates
-                    self.opening_handler = EventHandler[ExplorisAcquisitionOpeningEventArgs](self.on_acquisition_stream_opening)
-                    self.closing_handler = EventHandler[EventArgs](self.on_acquisition_stream_closing)
-                    
-                    # Register event handlers
-                    self.instrument.Control.Acquisition.AcquisitionStreamOpening += self.opening_handler
-                    logging.info("Registered opening handler")
-                    
-                    self.instrument.Control.Acquisition.AcquisitionStreamClosing += self.closing_handler
-                    logging.info("Registered closing handler")
-                    
-                    # Create a proper delegate for the scan handler
-                    def scan_handler(sender, args):
-                        self.on_scan_arrived(sender, args)
-                    
-                    self.scan_handler = scan_handler
-                    self.orbitrap.MsScanArrived += self.scan_handler
-                    logging.info("Registered scan handler")
-                    
-                except Exception as e:
-                    logging.error(f"Failed to register event handlers: {e}")
-                    raise
+                if not instrument_ids:
+                    raise Exception("GetInstrumentIds returned None")
+                
+                if len(instrument_ids) == 0:
+                    raise Exception("No instruments found")
+                
+                logging.info(f"Found {len(instrument_ids)} instrument(s)")
+                return instrument_ids
                 
-                logging.info("Event handlers set up successfully")
             except Exception as e:
-                logging.error(f"Error setting up event handlers: {e}")
-                import traceback
-                logging.error(f"Traceback: {traceback.format_exc()}")
-                raise
+                logging.error(f"Failed to get instrument IDs (attempt {attempt + 1}): {e}")
+                if attempt < max_retries - 1:
+                    logging.info(f"Waiting {retry_delay} seconds before retry...")
+                    time.sleep(retry_delay)
+                else:
+                    raise Exception(f"Failed to get instrument IDs after {max_retries} attempts: {e}")
+
+    def _attach_instrument(self, instrument_id, max_retries, retry_delay):
+        """Connect to one instrument and register handlers on all of its MS detectors"""
+        logging.info(f"Attempting to connect to instrument ID: {instrument_id}")
+        instrument = None
+        for attempt in range(max_retries):
+            try:
+                logging.info(f"Attempt {attempt + 1} of {max_retries} to connect to instrument {instrument_id}...")
+                instrument = self.container.Get(instrument_id)
+                
+                if instrument is None:
+                    raise Exception("Get() returned None for instrument")
+                
+                logging.info(f"Got instrument object, name: {instrument.InstrumentName if hasattr(instrument, 'InstrumentName') else 'Unknown'}")
+                break
+                    
+            except Exception as e:
+                logging.error(f"Instrument connection attempt {attempt + 1} failed: {e}")
+                if attempt < max_retries - 1:
+                    logging.info(f"Waiting {retry_delay} seconds before retry...")
+                    time.sleep(retry_delay)
+                else:
+                    raise Exception(f"Failed to establish stable instrument connection after {max_retries} attempts: {e}")
+        
+        name = instrument.InstrumentName if hasattr(instrument, 'InstrumentName') else None
+        attached = AttachedInstrument(instrument_id, instrument, name)
+        
+        try:
+            # Acquisition stream events, bound to this instrument
+            attached.opening_handler = EventHandler[ExplorisAcquisitionOpeningEventArgs](
+                lambda sender, args: self.on_acquisition_stream_opening(sender, args, attached))
+            attached.closing_handler = EventHandler[EventArgs](
+                lambda sender, args: self.on_acquisition_stream_closing(sender, args, attached))
+            instrument.Control.Acquisition.AcquisitionStreamOpening += attached.opening_handler
+            instrument.Control.Acquisition.AcquisitionStreamClosing += attached.closing_handler
+            logging.info(f"Registered acquisition handlers for instrument {instrument_id}")
+            
+            # One independent ingest pipeline per MS detector
+            detector_count = int(instrument.CountMsDetectors) if hasattr(instrument, 'CountMsDetectors') else 1
+            for detector_index in range(max(detector_count, 1)):
+                scan_container = instrument.GetMsScanContainer(detector_index)
+                if scan_container is None:
+                    logging.warning(f"No MS scan container for detector {detector_index} of instrument {instrument_id}")
+                    continue
+                stream_id = f"{instrument_id}/{detector_index}"
+                stream = self.streams.get(stream_id)
+                if stream is None:
+                    stream = DetectorStream(instrument_id, detector_index)
+                    self.streams[stream_id] = stream
+                stream.detector_class = str(scan_container.DetectorClass)
+                stream.attach(self.on_scan_arrived, scan_container)
+                attached.detectors.append(stream)
+                logging.info(f"Registered scan handler for stream {stream.stream_id} ({stream.detector_class})")
         except Exception as e:
-            logging.error(f"Error initializing mass spectrometer: {e}")
+            logging.error(f"Error setting up event handlers for instrument {instrument_id}: {e}")
             import traceback
-            logging.error("Traceback:")
-            logging.error(traceback.format_exc())
-            self.cleanup()
+            logging.error(f"Traceback: {traceback.format_exc()}")
+            attached.detach()
+            raise
+        
+        if not attached.detectors:
+            attached.detach()
+            raise Exception(f"Instrument {instrument_id} has no MS scan containers")
+        return attached
+    
+    def _detach_instruments(self):
+        """Unregister handlers from every attached instrument and detector"""
+        for attached in self.instruments.values():
+            attached.detach()
+        self.instruments = {}
+        instrument_values.detach()
+        instrument_status.detach()
+    
+    def get_stream(self, stream_id):
+        """Look up a detector stream by its "<instrument_id>/<detector>" id"""
+        for attached in list(self.instruments.values()):
+            for stream in attached.detectors:
+                if stream.stream_id == stream_id:
+                    return stream
+        return None
+    
+    def get_attached_instrument(self, instrument_id=None):
+        """Resolve an optional instrument id from a request to an attached instrument"""
+        if instrument_id is None:
+            return next(iter(self.instruments.values()), None)
+        for key, attached in self.instruments.items():
+            if str(key) == str(instrument_id):
+                return attached
+        return None
 
-    def on_acquisition_stream_opening(self, sender: object, args: ExplorisAcquisitionOpeningEventArgs) -> None:
+    def on_acquisition_stream_opening(self, sender: object, args: ExplorisAcquisitionOpeningEventArgs, attached=None) -> None:
         """Handle acquisition stream opening event"""
         try:
             logging.info("Acquisition stream opening event received")
             with self.lock:
                 self.acquisition_start_time = datetime.now()
                 self.scan_data = DEFAULT_SCAN_DATA.copy()
+            if attached is not None:
+                attached.acquisition_start_time = datetime.now()
+                # Acquisition details the instrument sends along (method, file name, ...)
+                info = snapshot_section(getattr(args, 'SpecificInformation', None))
+                session_id = attached.new_session({str(k): str(v) for k, v in info.items()})
+                logging.info(f"New acquisition session {session_id} on instrument {attached.instrument_id}")
             logging.info("Acquisition stream opening event handled successfully")
             return None
         except Exception as e:
             logging.error(f"Error in acquisition stream opening handler: {e}")
             return None
 
-    def on_acquisition_stream_closing(self, sender: object, args: EventArgs) -> None:
+    def on_acquisition_stream_closing(self, sender: object, args: EventArgs, attached=None) -> None:
         """Handle acquisition stream closing event"""
         try:
             logging.info("Acquisition stream closing event received")
             with self.lock:
                 self.acquisition_start_time = None
+            if attached is not None:
+                attached.acquisition_start_time = None
+                attached.end_session()
             logging.info("Acquisition stream closing event handled successfully")
             return None
         except Exception as e:
             logging.error(f"Error in acquisition stream closing handler: {e}")
             return None
 
-    def on_scan_arrived(self, sender: object, args: MsScanEventArgs) -> None:
+    def on_scan_arrived(self, sender: object, args: MsScanEventArgs, stream=None) -> None:
         """Handle scan arrival events from the mass spectrometer."""
         try:
             logging.info("Processing scan arrived event...")
@@ -612,93 +915,72 @@ class MassSpectrometer:
                 return
                 
             try:
-                # Extract scan metadata
-                ms_order = 1  # Default to MS1
-                polarity = "Unknown"  # Default polarity
+                # Snapshot the header/trailer once into a typed record
+                record, raw_metadata = metadata_capture.capture(scan)
+                metadata = metadata_capture.to_dict(record)
+                ms_order = metadata.get('ms_order') or 1
+                polarity = polarity_name(metadata.get('polarity'))
+                logging.info(f"MS Order: {ms_order}, Polarity: {polarity}")
                 
-                if hasattr(scan, 'Header') and scan.Header:
-                    try:
-                        # Try to get MSOrder from header
-                        try:
-                            ms_order = int(scan.Header['MSOrder'])
-                        except (KeyError, Exception):
-                            pass  # Keep default value
-                        
-                        # Try to get Polarity from header
-                        try:
-                            polarity_value = scan.Header['Polarity']
-                            # Convert polarity value to readable format
-                            if polarity_value == "0" or polarity_value.lower() == "positive":
-                                polarity = "Positive"
-                            elif polarity_value == "1" or polarity_value.lower() == "negative":
-                                polarity = "Negative"
-                            else:
-                                polarity = polarity_value
-                        except (KeyError, Exception):
-                            pass  # Keep default value
-                        
-                        logging.info(f"MS Order: {ms_order}, Polarity: {polarity}")
-                    except Exception as e:
-                        logging.warning(f"Could not parse scan metadata: {e}")
-                
-
-                
-                # Use a simple counter for scan numbering since IMsScan doesn't have RunningNumber
-                if not hasattr(self, 'scan_counter'):
-                    self.scan_counter = 0
-                self.scan_counter += 1
-                scan_number = self.scan_counter
-                logging.info(f"Processing MS1 scan number: {scan_number}")
+                # Prefer the instrument's own scan number; fall back to the per-stream counter
+                local_number = stream.next_scan_number()
+                native_number = metadata.get('scan_number')
+                scan_number = native_number if native_number is not None else local_number
+                pipeline_gaps.observe("callback", {"session_id": stream.session_id,
+                                                   "stream_id": stream.stream_id,
+                                                   "scan_number": scan_number})
+                logging.info(f"Processing scan number {scan_number} on stream {stream.stream_id}")
                 logging.info(f"Centroid count: {scan.CentroidCount}")
                 
-                # Extract masses and intensities
-                masses = []
-                intensities = []
+                # Extract masses and intensities, plus any extended columns
+                # (charge, resolution, noise, baseline) someone asked for
+                columns = centroid_columns.wanted(scan_fanout, stream.fanout)
+                centroids = centroid_columns.extract(scan, filter_columns(columns))
                 
-                # Access centroid data
-                for centroid in scan.Centroids:
-                    masses.append(float(centroid.Mz))
-                    intensities.append(float(centroid.Intensity))
+                # Drop near-noise centroids before they are encoded
+                filtered = {}
+                if peak_filter.enabled:
+                    centroids = peak_filter.filter_centroids(centroids, filtered, columns)
+                masses = centroids['mz'].tolist()
+                intensities = centroids['intensity'].tolist()
                 
                 logging.info(f"Extracted {len(masses)} data points")
                 
                 # Create scan data dictionary
                 scan_data = {
                     'scan_number': int(scan_number),
+                    'native_scan_number': native_number,
                     'masses': masses,
                     'intensities': intensities,
-                    'centroid_count': scan.CentroidCount,
+                    'centroid_count': len(masses),
                     'ms_order': ms_order,
                     'polarity': polarity,
+                    'precursor_mz': metadata.get('precursor_mz'),
+                    'activation': activation_name(metadata.get('activation')),
+                    'metadata': metadata,
                     'timestamp': datetime.now().isoformat()
                 }
+                scan_data.update(filtered)
+                if raw_metadata is not None:
+                    scan_data['raw_metadata'] = raw_metadata
+                if columns:
+                    scan_data['centroid_columns'] = column_payload(centroids, columns)
                 
-                # Update internal scan data
-                with self.lock:
-                    self.scan_data = scan_data
+                # Profile points are only extracted when a subscriber or the
+                # server-side centroiding stage needs them
+                want_profile = profile_channel.has_subscribers()
+                if want_profile or server_centroider.enabled:
+                    profile_mz, profile_intensity = extract_profile(scan)
+                    if server_centroider.enabled:
+                        server_centroider.apply(scan_data, profile_mz, profile_intensity)
                 
-                # Emit data via WebSocket
-                socketio.emit('scan_data', scan_data)
+                if deisotoper.enabled:
+                    deisotoper.apply(scan_data)
                 
-                # Add to SSE queue (non-blocking, drop if queue is full)
-                try:
-                    if 'scan_data_queue' in globals():
-                        try:
-                            scan_data_queue.put_nowait(scan_data)
-                        except queue.Full:
-                            # If queue is full, remove oldest item and add new one
-                            try:
-                                scan_data_queue.get_nowait()
-                                scan_data_queue.put_nowait(scan_data)
-                            except Exception:
-                                pass
-                except Exception as e:
-                    logging.error(f"Error adding data to SSE queue: {e}")
+                self._publish_scan(scan_data, stream)
                 
-                # Push to remote endpoint if configured
-                if 'REMOTE_ENDPOINT' in globals() and REMOTE_ENDPOINT:
-                    # Use a thread to avoid blocking the scan handler
-                    threading.Thread(target=push_to_remote, args=(scan_data,), daemon=True).start()
+                if want_profile:
+                    profile_channel.publish(socketio, stream.stream_id, scan_number, profile_mz, profile_intensity)
                     
                 logging.info("Successfully emitted scan data...")
                 
@@ -713,6 +995,33 @@ class MassSpectrometer:
             import traceback
             logging.error(f"Traceback: {traceback.format_exc()}")
 
+    def _publish_scan(self, scan_data, stream):
+        """Fan a scan payload out to WebSocket, SSE and remote subscribers"""
+        # Tag the scan with its origin so merged consumers can tell streams apart
+        scan_data['stream_id'] = stream.stream_id
+        scan_data['session_id'] = stream.session_id
+        scan_data['instrument_id'] = stream.instrument_id
+        scan_data['detector'] = stream.detector_index
+        
+        # Precomputed TIC, base peak, m/z range and top-N peaks for clients
+        add_summary(scan_data)
+        
+        # Update internal scan data
+        with self.lock:
+            self.scan_data = scan_data
+        
+        # Emit to the stream's own subscribers, then to the merged stream
+        stream.publish(scan_data)
+        scan_fanout.publish(scan_data)
+        pipeline_gaps.observe("fanout", scan_data)
+        
+        # Append to the session's mzML file (queued, written off the scan handler thread)
+        mzml_exporter.submit(scan_data)
+        
+        # Push to remote endpoint if configured (ordered, off the scan handler thread)
+        if REMOTE_ENDPOINT:
+            remote_pusher.submit(scan_data)
+
     def get_current_scan_data(self):
         """Get the current scan data"""
         with self.lock:
@@ -722,55 +1031,26 @@ class MassSpectrometer:
         """Cleanup resources"""
         logging.info("Starting cleanup...")
         try:
-            # Stop the heartbeat thread
+            # Stop the reconnect supervisor
             self.is_running = False
-            if hasattr(self, 'heartbeat_thread') and self.heartbeat_thread and self.heartbeat_thread.is_alive():
+            if getattr(self, 'supervisor', None) is not None:
                 try:
-                    self.heartbeat_thread.join(timeout=5)
-                    if self.heartbeat_thread.is_alive():
-                        logging.warning("Heartbeat thread did not terminate gracefully")
+                    self.supervisor.stop()
                 except Exception as e:
-                    logging.error(f"Error stopping heartbeat thread: {e}")
+                    logging.error(f"Error stopping reconnect supervisor: {e}")
             
-            # Cleanup instrument resources
-            if hasattr(self, 'instrument') and self.instrument is not None:
-                try:
-                    # Check if Control and Acquisition are available
-                    if hasattr(self.instrument, 'Control') and hasattr(self.instrument.Control, 'Acquisition'):
-                        if self.opening_handler is not None:
-                            try:
-                                self.instrument.Control.Acquisition.AcquisitionStreamOpening -= self.opening_handler
-                                logging.info("Removed opening handler")
-                            except Exception as e:
-                                logging.error(f"Error removing opening handler: {e}")
-                        
-                        if self.closing_handler is not None:
-                            try:
-                                self.instrument.Control.Acquisition.AcquisitionStreamClosing -= self.closing_handler
-                                logging.info("Removed closing handler")
-                            except Exception as e:
-                                logging.error(f"Error removing closing handler: {e}")
-                    
-                    if self.scan_handler is not None and self.orbitrap is not None:
-                        try:
-                            self.orbitrap.MsScanArrived -= self.scan_handler
-                            logging.info("Removed scan handler")
-                        except Exception as e:
-                            logging.error(f"Error removing scan handler: {e}")
-                    
-                    # Note: StopOnlineAccess is not available in this API version
-                    # The connection will be cleaned up when the container is disposed
-                except Exception as e:
-                    logging.error(f"Error during instrument cleanup: {e}")
-                finally:
-                    self.instrument = None
+            # Cleanup instrument resources on every attached instrument
+            # Note: StopOnlineAccess is not available in this API version
+            # The connection will be cleaned up when the container is disposed
+            try:
+                self._detach_instruments()
+            except Exception as e:
+                logging.error(f"Error during instrument cleanup: {e}")
             
             # Reset other resources
             self.container = None
+            self.instrument = None
             self.orbitrap = None
-            self.opening_handler = None
-            self.closing_handler = None
-            self.scan_handler = None
 
             self.scan_data = DEFAULT_SCAN_DATA.copy()
             self.acquisition_start_time = None
@@ -785,40 +1065,40 @@ class MassSpectrometer:
 
 # Initialize mass spectrometer in mock mode by default
 # This allows the GUI to work even without a physical instrument
-mass_spec = MassSpectrometer(mock_mode=False)
+# The instrument connection proceeds in the background (see /status "connection")
+with startup_timer.phase("instrument_init"):
+    mass_spec = MassSpectrometer(mock_mode=False)
+app.mass_spec = mass_spec
 
 @app.route('/status', methods=['GET'])
 def get_status():
     try:
-        if mass_spec.mock_mode:
-            status = {
-                "instrument_connected": mass_spec.mock_connected,
-                "online_access": mass_spec.mock_online_access,
-                "acquisition_active": mass_spec.mock_acquisition_active,
-                "timestamp": datetime.now().isoformat(),
-                "mock_mode": True
-            }
-        else:
-            status = {
-                "instrument_connected": mass_spec.instrument is not None,
-                "online_access": False,
-                "acquisition_active": False,
-                "timestamp": datetime.now().isoformat(),
-                "mock_mode": False
-            }
-            
-            if mass_spec.instrument and mass_spec.instrument.Control:
-                try:
-                    status["online_access"] = mass_spec.container.ServiceConnected if hasattr(mass_spec, 'container') else False
-                    # Check if acquisition is running by examining the state
-                    if hasattr(mass_spec.instrument.Control, 'Acquisition'):
-                        state = mass_spec.instrument.Control.Acquisition.State
-                        status["acquisition_active"] = str(state.SystemState) == "Running" if hasattr(state, 'SystemState') else False
-                    else:
-                        status["acquisition_active"] = False
-                except Exception as e:
-                    logging.error(f"Error getting instrument status: {e}")
+        # Instrument state comes from the event-driven cache, not from live .NET calls
+        cached = instrument_status.snapshot()
+        status = {
+            "connection": mass_spec.connection.to_dict(),
+            "instrument_connected": cached["instrument_connected"],
+            "online_access": cached["online_access"],
+            "acquisition_active": cached["acquisition_active"],
+            "instrument_state": cached,
+            "timestamp": datetime.now().isoformat(),
+            "mock_mode": mass_spec.mock_mode
+        }
+        if mass_spec.mock_mode and mass_spec.mock_acquisition is not None:
+            status["mock_generator"] = mass_spec.mock_acquisition.get_stats()
         
+        status["instruments"] = [attached.describe() for attached in list(mass_spec.instruments.values())]
+        if mass_spec.supervisor is not None:
+            status["supervisor"] = mass_spec.supervisor.get_stats()
+        status["gaps"] = pipeline_gaps.get_stats()
+        status["instrument_values"] = instrument_values.get_stats()
+        status["status_cache"] = instrument_status.get_stats()
+        status["remote_push"] = remote_pusher.get_stats()
+        status["mzml_export"] = mzml_exporter.get_stats()
+        status["startup"] = startup_timer.to_dict()
+        status["scan_stream"] = scan_fanout.get_stats()
+        status["profile_channel"] = profile_channel.get_stats()
+        status["processing"] = get_processing_stats()
         return jsonify({"success": True, "status": status})
     except Exception as e:
         logging.error(f"Error getting status: {e}")
@@ -845,6 +1125,135 @@ def get_scan_data():
             "timestamp": datetime.now().isoformat()
         }), 500
 
+@app.route('/instrument_values', methods=['GET'])
+def get_instrument_values():
+    """Downsampled instrument readbacks: ?names=a,b&from=&to=&max_points=1000&method=minmax|mean"""
+    try:
+        names = [n.strip() for n in request.args.get('names', '').split(',') if n.strip()]
+        try:
+            t_from = parse_time(request.args.get('from'))
+            t_to = parse_time(request.args.get('to'))
+            max_points = request.args.get('max_points', default=1000, type=int)
+            values = instrument_values_store.query(names, t_from, t_to, max_points,
+                                                   request.args.get('method', 'minmax'))
+        except ValueError as e:
+            return jsonify({
+                "success": False,
+                "error": str(e),
+                "timestamp": datetime.now().isoformat()
+            }), 400
+        return jsonify({
+            "success": True,
+            "series": instrument_values_store.describe(),
+            "values": values,
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Error getting instrument values: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/sessions', methods=['GET'])
+def list_sessions():
+    """Recent acquisition sessions with their metadata, oldest first"""
+    try:
+        return jsonify({
+            "success": True,
+            "sessions": list(acquisition_sessions.values()),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Error listing sessions: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/exports', methods=['GET'])
+def list_exports():
+    """mzML exports in MZML_EXPORT_DIR, finished and in progress"""
+    try:
+        return jsonify({
+            "success": True,
+            "enabled": mzml_exporter.enabled,
+            "exports": mzml_exporter.list_exports(),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Error listing exports: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/exports/<file_name>', methods=['GET'])
+def download_export(file_name):
+    path = mzml_exporter.finished_path(file_name)
+    if path is None:
+        return jsonify({
+            "success": False,
+            "error": f"No finished export named {file_name}",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    return send_file(path, mimetype='application/xml', as_attachment=True, download_name=file_name)
+
+@app.route('/exports/<session_id>/close', methods=['POST'])
+def close_export(session_id):
+    """Finish a session's mzML file now instead of waiting for the idle timeout"""
+    try:
+        path = mzml_exporter.close_session(session_id)
+        if path is None:
+            return jsonify({
+                "success": False,
+                "error": f"Session {session_id} is not being exported",
+                "timestamp": datetime.now().isoformat()
+            }), 404
+        return jsonify({
+            "success": True,
+            "file": os.path.basename(path),
+            "timestamp": datetime.now().isoformat()
+        })
+    except Exception as e:
+        logging.error(f"Error finishing export: {e}")
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 500
+
+@app.route('/instruments', methods=['GET'])
+def list_instruments():
+    """Attached instruments and their detector streams"""
+    return jsonify({
+        "success": True,
+        "instruments": [attached.describe() for attached in list(mass_spec.instruments.values())],
+        "timestamp": datetime.now().isoformat()
+    })
+
+def stream_not_found(instrument_id, detector):
+    return jsonify({
+        "success": False,
+        "error": f"Unknown detector stream: {instrument_id}/{detector}",
+        "timestamp": datetime.now().isoformat()
+    }), 404
+
+@app.route('/instruments/<instrument_id>/<int:detector>/scan_data', methods=['GET'])
+def get_stream_scan_data(instrument_id, detector):
+    stream = mass_spec.get_stream(f"{instrument_id}/{detector}")
+    if stream is None:
+        return stream_not_found(instrument_id, detector)
+    return jsonify({
+        "success": True,
+        "stream_id": stream.stream_id,
+        "scan_data": stream.get_current_scan_data(),
+        "timestamp": datetime.now().isoformat()
+    })
+
 @app.route('/start_acquisition', methods=['POST'])
 def start_acquisition():
     try:
@@ -856,26 +1265,44 @@ def start_acquisition():
                     "timestamp": datetime.now().isoformat()
                 })
             
+            # Optional mock settings, e.g. {"mock_config": {"scan_rate_hz": 100}}
+            body = request.get_json(silent=True) or {}
+            try:
+                overrides = body.get("mock_config")
+                MockInstrumentConfig.from_env().update(overrides)
+            except (TypeError, ValueError, AttributeError) as e:
+                return jsonify({
+                    "success": False,
+                    "error": f"Invalid mock_config: {e}",
+                    "timestamp": datetime.now().isoformat()
+                }), 400
+            
             mass_spec.mock_acquisition_active = True
             mass_spec.acquisition_start_time = datetime.now()
+            instrument_status.update("mock", acquisition_active=True)
             
             # Start mock data generation
-            mass_spec._start_mock_data_generation()
+            mass_spec._start_mock_data_generation(overrides)
             
             return jsonify({
                 "success": True,
                 "message": "Mock acquisition started",
+                "mock_config": mass_spec.mock_config.to_dict(),
                 "timestamp": datetime.now().isoformat()
             })
         else:
-            if not mass_spec.instrument or not mass_spec.instrument.Control:
+            # Optional {"instrument_id": ...}; defaults to the primary instrument
+            body = request.get_json(silent=True) or {}
+            attached = mass_spec.get_attached_instrument(body.get("instrument_id"))
+            instrument = attached.instrument if attached else None
+            if not instrument or not instrument.Control:
                 raise Exception("Instrument not connected or control not available")
                 
             if not (hasattr(mass_spec, 'container') and mass_spec.container.ServiceConnected):
                 raise Exception("Service connection not active")
                 
             # Check if acquisition is already running
-            state = mass_spec.instrument.Control.Acquisition.State
+            state = instrument.Control.Acquisition.State
             if hasattr(state, 'SystemState') and str(state.SystemState) == "Running":
                 return jsonify({
                     "success": False,
@@ -884,13 +1311,14 @@ def start_acquisition():
                 })
             
             # Start acquisition using CreatePermanentAcquisition
-            workflow = mass_spec.instrument.Control.Acquisition.CreatePermanentAcquisition()
-            mass_spec.instrument.Control.Acquisition.StartAcquisition(workflow)
+            workflow = instrument.Control.Acquisition.CreatePermanentAcquisition()
+            instrument.Control.Acquisition.StartAcquisition(workflow)
             mass_spec.acquisition_start_time = datetime.now()
             
             return jsonify({
                 "success": True,
                 "message": "Acquisition started",
+                "instrument_id": attached.instrument_id,
                 "timestamp": datetime.now().isoformat()
             })
     except Exception as e:
@@ -913,7 +1341,13 @@ def stop_acquisition():
                 })
             
             mass_spec.mock_acquisition_active = False
+            if mass_spec.mock_acquisition is not None:
+                mass_spec.mock_acquisition.stop()
             mass_spec.acquisition_start_time = None
+            instrument_status.update("mock", acquisition_active=False)
+            mock_instrument = mass_spec.instruments.get("mock")
+            if mock_instrument is not None:
+                mock_instrument.end_session()
             
             return jsonify({
                 "success": True,
@@ -921,17 +1355,21 @@ def stop_acquisition():
                 "timestamp": datetime.now().isoformat()
             })
         else:
-            if not mass_spec.instrument or not mass_spec.instrument.Control:
+            body = request.get_json(silent=True) or {}
+            attached = mass_spec.get_attached_instrument(body.get("instrument_id"))
+            instrument = attached.instrument if attached else None
+            if not instrument or not instrument.Control:
                 raise Exception("Instrument not connected or control not available")
                 
             if not (hasattr(mass_spec, 'container') and mass_spec.container.ServiceConnected):
                 raise Exception("Service connection not active")
                 
             # Cancel the acquisition
-            mass_spec.instrument.Control.Acquisition.CancelAcquisition()
+            instrument.Control.Acquisition.CancelAcquisition()
             return jsonify({
                 "success": True,
                 "message": "Acquisition stopped",
+                "instrument_id": attached.instrument_id,
                 "timestamp": datetime.now().isoformat()
             })
     except Exception as e:
@@ -943,6 +1381,67 @@ def stop_acquisition():
         }), 500
 
 
+def filter_columns(columns):
+    """Extended columns to extract: the requested ones, plus noise when the S/N filter can use it"""
+    if peak_filter.needs_noise and "noise" not in columns:
+        return tuple(column for column in EXTENDED_COLUMNS if column in columns or column == "noise")
+    return columns
+
+def get_processing_stats():
+    return {
+        "metadata": metadata_capture.get_stats(),
+        "centroid_columns": centroid_columns.get_stats(),
+        "centroiding": server_centroider.get_stats(),
+        "deisotoping": deisotoper.get_stats(),
+        "peak_filter": peak_filter.get_stats()
+    }
+
+@app.route('/processing', methods=['GET', 'POST'])
+def processing_settings():
+    """Inspect or change the scan processing stages at runtime.
+    
+    POST body example: {"centroiding": {"mode": "replace", "method": "gaussian", "snr_threshold": 5},
+                        "deisotoping": {"enabled": true, "max_charge": 4, "latency_budget_ms": 20},
+                        "peak_filter": {"enabled": true, "min_relative": 0.01, "min_snr": 3},
+                        "metadata": {"fields": ["scan_number", "ms_order", "precursor_mz"], "raw": false},
+                        "centroid_columns": {"always": ["charge", "resolution"]}}
+    """
+    try:
+        if request.method == 'POST':
+            body = request.get_json(silent=True) or {}
+            stages = {
+                'centroiding': server_centroider,
+                'deisotoping': deisotoper,
+                'peak_filter': peak_filter,
+                'metadata': metadata_capture,
+                'centroid_columns': centroid_columns
+            }
+            # Reject unknown stages and settings before applying any of them
+            if not isinstance(body, dict):
+                raise TypeError("body must be a JSON object")
+            unknown = sorted(set(body) - set(stages))
+            if unknown:
+                raise ValueError(f"Unknown processing stages: {', '.join(unknown)}")
+            for name, settings in body.items():
+                if not isinstance(settings, dict):
+                    raise TypeError(f"{name} must be a JSON object")
+                accepted = inspect.signature(stages[name].configure).parameters
+                unknown = sorted(set(settings) - set(accepted))
+                if unknown:
+                    raise ValueError(f"Unknown {name} settings: {', '.join(unknown)}")
+            for name, settings in body.items():
+                stages[name].configure(**settings)
+        return jsonify({
+            "success": True,
+            "processing": get_processing_stats(),
+            "timestamp": datetime.now().isoformat()
+        })
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
 
 def shutdown_server():
     # ADDED: Logging for shutdown sequence
@@ -969,18 +1468,35 @@ def signal_handler(sig, frame):
 
 @app.route('/events')
 def events():
+    """SSE stream of scans from all detector streams; ?summary_only=1 omits the per-point arrays"""
+    return scan_event_stream(scan_fanout)
+
+@app.route('/instruments/<instrument_id>/<int:detector>/events')
+def stream_events(instrument_id, detector):
+    """SSE stream of a single detector stream"""
+    stream = mass_spec.get_stream(f"{instrument_id}/{detector}")
+    if stream is None:
+        return stream_not_found(instrument_id, detector)
+    return scan_event_stream(stream.fanout)
+
+def scan_event_stream(fanout):
+    # Browsers resend the last seen event ID when they reconnect
+    last_event_id = parse_event_id(request.headers.get('Last-Event-ID') or request.args.get('last_event_id'))
+    subscriber, missed = fanout.subscribe_sse(parse_stream_options(request.args), last_event_id)
+    
     def event_stream():
-        while True:
-            try:
-                # Get data from queue with a timeout to allow for clean shutdown
-                data = scan_data_queue.get(timeout=1)
-                yield f"data: {json.dumps(data)}\n\n"
-            except queue.Empty:
-                # Send a keep-alive comment to prevent connection timeout
-                yield ": keep-alive\n\n"
-            except Exception as e:
-                logging.error(f"Error in event stream: {e}")
-                break
+        try:
+            yield from missed
+            while True:
+                try:
+                    # Block until a scan arrives; time out only to send keep-alives
+                    event_id, data = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    yield sse_message(event_id, data)
+                except queue.Empty:
+                    # Send a keep-alive comment to prevent connection timeout
+                    yield ": keep-alive\n\n"
+        finally:
+            fanout.unsubscribe_sse(subscriber)
     
     return Response(stream_with_context(event_stream()),
                   mimetype="text/event-stream",
@@ -988,41 +1504,135 @@ def events():
                            "Connection": "keep-alive",
                            "Access-Control-Allow-Origin": "*"})
 
+# sid -> fan-out the client currently listens to (merged or a single detector stream)
+socket_streams = {}
 
+@socketio.on('connect')
+def handle_connect(auth=None):
+    # Every client gets full scans from all streams until it asks for something else
+    options = parse_stream_options(None)
+    room, _ = scan_fanout.subscribe_socket(request.sid, options)
+    socket_streams[request.sid] = scan_fanout
+    join_room(room)
+    # A reconnecting client passes {"last_event_id": ...} as its auth payload
+    last_event_id = parse_event_id((auth or {}).get('last_event_id'))
+    if last_event_id is not None:
+        scan_fanout.replay_socket(request.sid, options, last_event_id)
+    # Current instrument status; later changes arrive as 'status' events
+    emit('status', instrument_status.snapshot())
 
-@app.route('/events')
-def events():
-    def event_stream():
-        while True:
-            try:
-                # Get data from queue with a timeout to allow for clean shutdown
-                data = scan_data_queue.get(timeout=1)
-                yield f"data: {json.dumps(data)}\n\n"
-            except queue.Empty:
-                # Send a keep-alive comment to prevent connection timeout
-                yield ": keep-alive\n\n"
-            except Exception as e:
-                logging.error(f"Error in event stream: {e}")
-                break
+@socketio.on('subscribe')
+def handle_subscribe(data=None):
+    """Change this client's scan stream, e.g. {"summary_only": true, "stream": "1/0"}
+    
+    With ``last_event_id`` the scans of that stream missed since then are replayed.
+    """
+    stream_id = (data or {}).get('stream')
+    fanout = scan_fanout
+    if stream_id:
+        stream = mass_spec.get_stream(str(stream_id))
+        if stream is None:
+            return {"success": False, "error": f"Unknown detector stream: {stream_id}"}
+        fanout = stream.fanout
     
+    current = socket_streams.get(request.sid, scan_fanout)
+    if current is not fanout:
+        old_room = current.unsubscribe_socket(request.sid)
+        if old_room:
+            leave_room(old_room)
+    options = parse_stream_options(data)
+    room, previous = fanout.subscribe_socket(request.sid, options)
+    socket_streams[request.sid] = fanout
+    if previous and previous != room:
+        leave_room(previous)
+    join_room(room)
+    result = {"success": True, "room": room}
+    last_event_id = parse_event_id((data or {}).get('last_event_id'))
+    if last_event_id is not None:
+        result["replayed"], result["complete"] = fanout.replay_socket(request.sid, options, last_event_id)
+    return result
+
+@socketio.on('subscribe_profile')
+def handle_subscribe_profile(data=None):
+    """Opt in to binary 'profile_data' events, optionally binned server-side and
+    limited to one detector stream, e.g. {"bin_width": 0.01, "stream": "1/0"}"""
+    try:
+        bin_width = parse_bin_width((data or {}).get('bin_width'))
+    except (TypeError, ValueError) as e:
+        return {"success": False, "error": str(e)}
+    stream_id = (data or {}).get('stream')
+    if stream_id and mass_spec.get_stream(str(stream_id)) is None:
+        return {"success": False, "error": f"Unknown detector stream: {stream_id}"}
+    stream_id = str(stream_id) if stream_id else None
+    room, previous = profile_channel.subscribe_socket(request.sid, bin_width, stream_id)
+    if previous and previous != room:
+        leave_room(previous)
+    join_room(room)
+    return {"success": True, "bin_width": bin_width, "stream": stream_id}
+
+@socketio.on('unsubscribe_profile')
+def handle_unsubscribe_profile(data=None):
+    room = profile_channel.unsubscribe_socket(request.sid)
+    if room:
+        leave_room(room)
+    return {"success": True}
+
+@socketio.on('disconnect')
+def handle_disconnect():
+    socket_streams.pop(request.sid, scan_fanout).unsubscribe_socket(request.sid)
+    profile_channel.unsubscribe_socket(request.sid)
+
+@app.route('/events/profile')
+def profile_events():
+    """SSE stream of base64-encoded binary profile scans (see profile_stream.py);
+    ?stream=<instrument>/<detector> limits it to one detector stream"""
+    try:
+        bin_width = parse_bin_width(request.args.get('bin_width'))
+    except ValueError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.now().isoformat()
+        }), 400
+    stream_id = request.args.get('stream') or None
+    if stream_id and mass_spec.get_stream(stream_id) is None:
+        return jsonify({
+            "success": False,
+            "error": f"Unknown detector stream: {stream_id}",
+            "timestamp": datetime.now().isoformat()
+        }), 404
+    subscriber = profile_channel.subscribe_sse(bin_width, stream_id)
+
+    def event_stream():
+        try:
+            while True:
+                try:
+                    data = subscriber.get(timeout=SSE_KEEPALIVE_SECONDS)
+                    yield f"event: profile\ndata: {data}\n\n"
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+        finally:
+            profile_channel.unsubscribe_sse(subscriber)
+
     return Response(stream_with_context(event_stream()),
                   mimetype="text/event-stream",
                   headers={"Cache-Control": "no-cache",
                            "Connection": "keep-alive",
                            "Access-Control-Allow-Origin": "*"})
 
-def push_to_remote(data):
-    """Push scan data to a remote endpoint"""
-    if not REMOTE_ENDPOINT:
-        return
+def push_to_remote(data, session=None, endpoint=None):
+    """Push scan data (or another payload) to a remote endpoint; returns True on success"""
+    endpoint = endpoint or REMOTE_ENDPOINT
+    if not endpoint:
+        return False
     
     try:
         headers = {}
         if REMOTE_API_KEY:
             headers['Authorization'] = f'Bearer {REMOTE_API_KEY}'
         
-        response = requests.post(
-            REMOTE_ENDPOINT,
+        response = (session or requests).post(
+            endpoint,
             json=data,
             headers=headers,
             timeout=5  # 5 second timeout
@@ -1030,5 +1640,16 @@ def push_to_remote(data):
         
         if response.status_code != 200:
             logging.error(f"Failed to push data to remote endpoint: {response.status_code} {response.text}")
+            return False
+        return True
     except Exception as e:
-        logging.error(f"Error pushing data to remote endpoint: {e}")
\ No newline at end of file
+        logging.error(f"Error pushing data to remote endpoint: {e}")
+        return False
+
+if __name__ == '__main__':
+    signal.signal(signal.SIGINT, signal_handler)
+    signal.signal(signal.SIGTERM, signal_handler)
+    
+    port = int(os.environ.get('PORT', 5000))
+    logging.info(f"Starting backend server on port {port}")
+    socketio.run(app, host='0.0.0.0', port=port, debug=False, allow_unsafe_werkzeug=True)
@@ -0,0 +1,280 @@
+"""
+Configurable mock instrument for load testing the scan pipeline.
+
+Spectra are generated vectorized in batches (isotope envelopes plus chemical
+noise) and emitted on a fixed-rate schedule, so the rest of the backend can
+be exercised at realistic acquisition rates without a physical instrument.
+"""
+
+import os
+import time
+import logging
+import threading
+
+import numpy as np
+
+# Mass difference between 13C and 12C, used for isotope envelope spacing
+ISOTOPE_SPACING = 1.0033548
+# Averagine-like approximation: expected number of 13C atoms per Dalton
+AVERAGINE_C13_PER_DA = 1.0 / 1800.0
+
+
+def _env(name, default, cast):
+    value = os.environ.get(name)
+    if value is None or value == "":
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        logging.warning(f"Ignoring invalid value for {name}: {value!r}")
+        return default
+
+
+def _env_bool(value):
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+class MockInstrumentConfig:
+    """Settings for the mock instrument. Defaults mirror the previous 1 Hz mock."""
+
+    FIELDS = {
+        # name: (default, cast, environment variable)
+        "scan_rate_hz": (1.0, float, "MOCK_SCAN_RATE_HZ"),
+        "centroid_count_mean": (100, int, "MOCK_CENTROID_COUNT"),
+        "centroid_count_sigma": (0.3, float, "MOCK_CENTROID_COUNT_SIGMA"),
+        "centroid_count_max": (50000, int, "MOCK_CENTROID_COUNT_MAX"),
+        "ms2_per_cycle": (0, int, "MOCK_MS2_PER_CYCLE"),
+        "ms2_count_factor": (0.25, float, "MOCK_MS2_COUNT_FACTOR"),
+        "polarity_switching": (False, _env_bool, "MOCK_POLARITY_SWITCHING"),
+        "max_charge": (4, int, "MOCK_MAX_CHARGE"),
+        "isotopes_per_envelope": (5, int, "MOCK_ISOTOPES_PER_ENVELOPE"),
+        "signal_fraction": (0.6, float, "MOCK_SIGNAL_FRACTION"),
+        "mz_min": (100.0, float, "MOCK_MZ_MIN"),
+        "mz_max": (2000.0, float, "MOCK_MZ_MAX"),
+        "batch_seconds": (0.1, float, "MOCK_BATCH_SECONDS"),
+        "seed": (None, int, "MOCK_SEED"),
+    }
+
+    def __init__(self, **overrides):
+        for name, (default, _, _) in self.FIELDS.items():
+            setattr(self, name, default)
+        self.update(overrides)
+
+    @classmethod
+    def from_env(cls):
+        config = cls()
+        for name, (default, cast, env_name) in cls.FIELDS.items():
+            setattr(config, name, _env(env_name, default, cast))
+        return config
+
+    def update(self, overrides):
+        """Apply overrides (e.g. from a request body), ignoring unknown keys."""
+        for name, value in (overrides or {}).items():
+            if name not in self.FIELDS:
+                logging.warning(f"Ignoring unknown mock setting: {name}")
+                continue
+            cast = self.FIELDS[name][1]
+            setattr(self, name, None if value is None else cast(value))
+        if self.scan_rate_hz <= 0:
+            raise ValueError("scan_rate_hz must be positive")
+        if self.mz_min >= self.mz_max:
+            raise ValueError("mz_min must be less than mz_max")
+        if self.isotopes_per_envelope < 1:
+            raise ValueError("isotopes_per_envelope must be at least 1")
+        if self.ms2_per_cycle < 0:
+            raise ValueError("ms2_per_cycle must not be negative")
+        if not 0 < self.signal_fraction <= 1:
+            raise ValueError("signal_fraction must be in (0, 1]")
+        if self.batch_seconds <= 0:
+            raise ValueError("batch_seconds must be positive")
+        return self
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class MockSpectrumGenerator:
+    """Generates batches of centroided spectra with isotope-like peak shapes."""
+
+    def __init__(self, config):
+        self.config = config
+        self.rng = np.random.default_rng(config.seed)
+        self.scan_index = 0
+        self._isotope_offsets = np.arange(config.isotopes_per_envelope, dtype=np.float64)
+        self._log_factorials = np.cumsum(np.log(np.maximum(self._isotope_offsets, 1.0)))
+
+    def _scan_types(self, count):
+        cfg = self.config
+        index = self.scan_index + np.arange(count)
+        if cfg.ms2_per_cycle > 0:
+            ms_order = np.where(index % (cfg.ms2_per_cycle + 1) == 0, 1, 2)
+        else:
+            ms_order = np.ones(count, dtype=np.int64)
+        if cfg.polarity_switching:
+            positive = index % 2 == 0
+        else:
+            positive = np.ones(count, dtype=bool)
+        return ms_order, positive
+
+    def _centroid_counts(self, ms_order):
+        cfg = self.config
+        mean = max(cfg.centroid_count_mean, 1)
+        # Log-normal draw centred on the configured mean
+        counts = mean * np.exp(cfg.centroid_count_sigma * self.rng.standard_normal(ms_order.size)
+                               - 0.5 * cfg.centroid_count_sigma ** 2)
+        counts = np.where(ms_order > 1, counts * cfg.ms2_count_factor, counts)
+        return np.clip(np.rint(counts), 1, cfg.centroid_count_max).astype(np.int64)
+
+    def generate_batch(self, count):
+        """Return a list of ``count`` spectrum dicts with sorted numpy arrays."""
+        cfg = self.config
+        rng = self.rng
+        n_iso = cfg.isotopes_per_envelope
+
+        ms_order, positive = self._scan_types(count)
+        counts = self._centroid_counts(ms_order)
+
+        # MS2 scans get a precursor and an upper m/z bound derived from it
+        precursor = np.where(ms_order > 1,
+                             rng.uniform(cfg.mz_min + 0.2 * (cfg.mz_max - cfg.mz_min), cfg.mz_max, count),
+                             np.nan)
+        upper = np.where(ms_order > 1, np.minimum(precursor * 2.0, cfg.mz_max), cfg.mz_max)
+        max_charge = np.where(ms_order > 1, 1, max(cfg.max_charge, 1))
+
+        # Split each scan into isotope envelopes and noise peaks
+        envelopes = (counts * cfg.signal_fraction).astype(np.int64) // n_iso
+        noise = counts - envelopes * n_iso
+        env_scan = np.repeat(np.arange(count), envelopes)
+        noise_scan = np.repeat(np.arange(count), noise)
+
+        # Isotope envelopes: mono m/z, charge and a Poisson-shaped distribution
+        mono = cfg.mz_min + rng.random(env_scan.size) * (upper[env_scan] - cfg.mz_min)
+        charge = 1 + np.floor(rng.random(env_scan.size) * max_charge[env_scan]).astype(np.int64)
+        neutral = mono * charge
+        lam = np.maximum(neutral * AVERAGINE_C13_PER_DA, 1e-3)
+        log_pmf = (np.outer(np.log(lam), self._isotope_offsets)
+                   - lam[:, None] - self._log_factorials[None, :])
+        shape = np.exp(log_pmf)
+        shape /= shape.max(axis=1, keepdims=True)
+        apex = rng.lognormal(mean=12.0, sigma=1.5, size=env_scan.size)
+        env_mz = mono[:, None] + self._isotope_offsets[None, :] * ISOTOPE_SPACING / charge[:, None]
+        env_int = apex[:, None] * shape * rng.uniform(0.9, 1.1, shape.shape)
+
+        # Chemical noise
+        noise_mz = cfg.mz_min + rng.random(noise_scan.size) * (upper[noise_scan] - cfg.mz_min)
+        noise_int = rng.exponential(2e3, noise_scan.size)
+
+        scan_idx = np.concatenate([np.repeat(env_scan, n_iso), noise_scan])
+        mz = np.concatenate([env_mz.ravel(), noise_mz])
+        intensity = np.concatenate([env_int.ravel(), noise_int])
+        # Envelope peaks carry their charge; noise peaks are unassigned (0)
+        peak_charge = np.concatenate([np.repeat(charge, n_iso), np.zeros(noise_scan.size, dtype=np.int64)])
+
+        keep = mz <= upper[scan_idx]
+        scan_idx, mz, intensity, peak_charge = scan_idx[keep], mz[keep], intensity[keep], peak_charge[keep]
+        order = np.lexsort((mz, scan_idx))
+        scan_idx, mz, intensity, peak_charge = scan_idx[order], mz[order], intensity[order], peak_charge[order]
+        bounds = np.searchsorted(scan_idx, np.arange(count + 1))
+
+        spectra = []
+        for i in range(count):
+            lo, hi = bounds[i], bounds[i + 1]
+            spectra.append({
+                "masses": mz[lo:hi],
+                "intensities": intensity[lo:hi],
+                "charges": peak_charge[lo:hi],
+                "ms_order": int(ms_order[i]),
+                "polarity": "Positive" if positive[i] else "Negative",
+                "precursor_mz": None if ms_order[i] == 1 else float(precursor[i]),
+            })
+        self.scan_index += count
+        return spectra
+
+
+class MockAcquisition:
+    """Emits generated spectra at a fixed rate on a background thread.
+
+    Each run has its own stop event, so a quick stop and start never leaves
+    the previous thread emitting next to the new one.
+    """
+
+    STOP_TIMEOUT = 5.0
+
+    def __init__(self, config, on_scan, is_active):
+        self.config = config
+        self.on_scan = on_scan
+        self.is_active = is_active
+        self.generator = MockSpectrumGenerator(config)
+        self.thread = None
+        self.stopped = threading.Event()
+        self.stats = {
+            "scans_emitted": 0,
+            "late_scans": 0,
+            "schedule_resets": 0,
+            "generation_seconds": 0.0,
+            "started_at": None,
+        }
+
+    def start(self):
+        self.stop()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(self.stopped,), daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """Stop the emitting thread and wait for it to exit."""
+        self.stopped.set()
+        thread, self.thread = self.thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(self.STOP_TIMEOUT)
+            if thread.is_alive():
+                logging.warning("Mock acquisition thread did not stop within "
+                                f"{self.STOP_TIMEOUT} s; it exits after its current scan")
+
+    def _run(self, stopped):
+        cfg = self.config
+        period = 1.0 / cfg.scan_rate_hz
+        batch_size = max(1, int(round(cfg.scan_rate_hz * cfg.batch_seconds)))
+        start = time.perf_counter()
+        self.stats["started_at"] = time.time()
+        emitted = 0
+
+        def running():
+            return not stopped.is_set() and self.is_active()
+
+        while running():
+            try:
+                t0 = time.perf_counter()
+                batch = self.generator.generate_batch(batch_size)
+                self.stats["generation_seconds"] += time.perf_counter() - t0
+
+                for spectrum in batch:
+                    if not running():
+                        return
+                    deadline = start + emitted * period
+                    delay = deadline - time.perf_counter()
+                    if delay > 0:
+                        if stopped.wait(delay):
+                            return
+                    elif delay < -1.0:
+                        # Too far behind to catch up; restart the schedule from now
+                        start = time.perf_counter()
+                        emitted = 0
+                        self.stats["schedule_resets"] += 1
+                    elif delay < -period:
+                        self.stats["late_scans"] += 1
+                    self.on_scan(spectrum)
+                    emitted += 1
+                    self.stats["scans_emitted"] += 1
+            except Exception as e:
+                logging.error(f"Error generating mock scan data: {e}")
+                stopped.wait(period)
+
+    def get_stats(self):
+        stats = dict(self.stats)
+        if stats["started_at"]:
+            elapsed = max(time.time() - stats["started_at"], 1e-9)
+            stats["achieved_rate_hz"] = stats["scans_emitted"] / elapsed
+        stats["config"] = self.config.to_dict()
+        return stats
@@ -0,0 +1,212 @@
+"""
+Opt-in profile spectrum channel.
+
+Profile scans are 10-50x larger than centroid lists, so they are only
+extracted when somebody subscribed, are kept as numpy arrays end to end and
+are sent in a compact little-endian binary layout instead of JSON lists.
+
+Binary layout (all little-endian)::
+
+    header  : 4s magic, u4 scan_number, u4 point_count, f8 mz_start, f8 bin_width
+    raw     : f8[point_count] m/z, f4[point_count] intensity      (bin_width == 0)
+    binned  : u4[point_count] bin index, f4[point_count] intensity (bin_width > 0)
+
+For binned payloads the m/z of a point is ``mz_start + (index + 0.5) * bin_width``.
+"""
+
+import json
+import queue
+import struct
+import base64
+import threading
+
+import numpy as np
+
+PROFILE_MAGIC = b"PRF1"
+PROFILE_HEADER = struct.Struct("<4sIIdd")
+# Upper bound for a client-requested bin width, in Th
+MAX_BIN_WIDTH = 10.0
+
+
+def extract_profile(scan):
+    """Read all profile points of an IAPI scan in one pass.
+
+    Profile points are only reachable through their centroids and must be
+    copied during enumeration (see the ProfileDataReceiver example), so the
+    points are collected into flat buffers and converted to arrays once.
+    """
+    mz_buffer = []
+    intensity_buffer = []
+    for centroid in scan.Centroids:
+        profile = centroid.Profile
+        if profile is None:
+            continue
+        for point in profile:
+            mz_buffer.append(point.Mz)
+            intensity_buffer.append(point.Intensity)
+
+    mz = np.fromiter(mz_buffer, dtype=np.float64, count=len(mz_buffer))
+    intensity = np.fromiter(intensity_buffer, dtype=np.float32, count=len(intensity_buffer))
+    if mz.size == 0:
+        return mz, intensity
+
+    # Neighbouring centroids may share edge points; keep each m/z once, sorted
+    mz, first = np.unique(mz, return_index=True)
+    return mz, intensity[first]
+
+
+def bin_profile(mz, intensity, bin_width):
+    """Collapse a profile onto a fixed m/z grid, keeping the apex per bin.
+
+    Returns ``(mz_start, bin_index, intensity)`` with empty bins omitted.
+    """
+    if mz.size == 0:
+        return 0.0, np.empty(0, dtype=np.uint32), np.empty(0, dtype=np.float32)
+    mz_start = float(np.floor(mz[0] / bin_width) * bin_width)
+    index = ((mz - mz_start) / bin_width).astype(np.uint32)
+    # mz is sorted, so equal bin indices are contiguous
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    return mz_start, index[starts], np.maximum.reduceat(intensity, starts).astype(np.float32)
+
+
+def encode_profile(scan_number, mz, intensity, bin_width=None):
+    """Encode a profile (optionally binned) into the binary layout above."""
+    if bin_width:
+        mz_start, index, values = bin_profile(mz, intensity, bin_width)
+        header = PROFILE_HEADER.pack(PROFILE_MAGIC, scan_number, index.size, mz_start, bin_width)
+        return header + index.astype("<u4").tobytes() + values.astype("<f4").tobytes()
+    header = PROFILE_HEADER.pack(PROFILE_MAGIC, scan_number, mz.size, 0.0, 0.0)
+    return header + mz.astype("<f8").tobytes() + intensity.astype("<f4").tobytes()
+
+
+def synthesize_profile(masses, intensities, resolution=60000.0, points_per_peak=11):
+    """Build Gaussian profile peaks around centroids (used by the mock instrument)."""
+    masses = np.asarray(masses, dtype=np.float64)
+    intensities = np.asarray(intensities, dtype=np.float64)
+    if masses.size == 0:
+        return masses, intensities.astype(np.float32)
+    offsets = np.linspace(-3.0, 3.0, points_per_peak)
+    sigma = masses / (resolution * 2.3548)
+    mz = (masses[:, None] + offsets[None, :] * sigma[:, None]).ravel()
+    values = (intensities[:, None] * np.exp(-0.5 * offsets ** 2)[None, :]).ravel()
+    order = np.argsort(mz, kind="stable")
+    return mz[order], values[order].astype(np.float32)
+
+
+def parse_bin_width(value):
+    """Validate a client supplied bin width; ``None``/0 means raw points."""
+    if value in (None, "", 0, "0"):
+        return None
+    bin_width = float(value)
+    if not 0 < bin_width <= MAX_BIN_WIDTH:
+        raise ValueError(f"bin_width must be in (0, {MAX_BIN_WIDTH}]")
+    return bin_width
+
+
+class ProfileChannel:
+    """Tracks profile subscribers and encodes each scan once per distinct option set.
+
+    Socket.IO subscribers are grouped into rooms named after their bin width
+    and detector stream filter; SSE subscribers each get a small bounded queue
+    of JSON messages carrying the base64 payload. Every event names the
+    ``stream_id`` the profile came from, and a subscriber with a stream filter
+    only receives that stream's profiles.
+    """
+
+    def __init__(self, sse_queue_size=10):
+        self.lock = threading.Lock()
+        self.socket_subscribers = {}  # sid -> (room, bin_width, stream_id)
+        self.sse_subscribers = {}     # queue -> (bin_width, stream_id)
+        self.sse_queue_size = sse_queue_size
+        self.scans_published = 0
+        self.bytes_published = 0
+
+    @staticmethod
+    def room_for(bin_width, stream_id=None):
+        if stream_id:
+            return f"profile:{stream_id}:{bin_width or 'raw'}"
+        return f"profile:{bin_width or 'raw'}"
+
+    def has_subscribers(self):
+        return bool(self.socket_subscribers) or bool(self.sse_subscribers)
+
+    def subscribe_socket(self, sid, bin_width=None, stream_id=None):
+        room = self.room_for(bin_width, stream_id)
+        with self.lock:
+            previous = self.socket_subscribers.get(sid)
+            self.socket_subscribers[sid] = (room, bin_width, stream_id)
+        return room, previous[0] if previous else None
+
+    def unsubscribe_socket(self, sid):
+        with self.lock:
+            previous = self.socket_subscribers.pop(sid, None)
+        return previous[0] if previous else None
+
+    def subscribe_sse(self, bin_width=None, stream_id=None):
+        subscriber = queue.Queue(maxsize=self.sse_queue_size)
+        with self.lock:
+            self.sse_subscribers[subscriber] = (bin_width, stream_id)
+        return subscriber
+
+    def unsubscribe_sse(self, subscriber):
+        with self.lock:
+            self.sse_subscribers.pop(subscriber, None)
+
+    def publish(self, socketio, stream_id, scan_number, mz, intensity):
+        """Send one profile scan of ``stream_id`` to every subscriber group that wants it."""
+        with self.lock:
+            rooms = {room: bin_width for room, bin_width, wanted in self.socket_subscribers.values()
+                     if wanted in (None, stream_id)}
+            sse_subscribers = [(subscriber, bin_width) for subscriber, (bin_width, wanted)
+                               in self.sse_subscribers.items() if wanted in (None, stream_id)]
+
+        encoded = {}
+        messages = {}
+
+        def payload_for(bin_width):
+            if bin_width not in encoded:
+                encoded[bin_width] = encode_profile(scan_number, mz, intensity, bin_width)
+            return encoded[bin_width]
+
+        def message_for(bin_width):
+            if bin_width not in messages:
+                messages[bin_width] = json.dumps({
+                    "stream_id": stream_id,
+                    "scan_number": scan_number,
+                    "bin_width": bin_width,
+                    "data": base64.b64encode(payload_for(bin_width)).decode("ascii")
+                })
+            return messages[bin_width]
+
+        for room, bin_width in rooms.items():
+            data = payload_for(bin_width)
+            socketio.emit('profile_data', {
+                "stream_id": stream_id,
+                "scan_number": scan_number,
+                "bin_width": bin_width,
+                "data": data
+            }, to=room)
+            self.bytes_published += len(data)
+
+        for subscriber, bin_width in sse_subscribers:
+            message = message_for(bin_width)
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Slow reader: drop its oldest profile rather than block ingest
+                try:
+                    subscriber.get_nowait()
+                    subscriber.put_nowait(message)
+                except Exception:
+                    pass
+
+        self.scans_published += 1
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                "socket_subscribers": len(self.socket_subscribers),
+                "sse_subscribers": len(self.sse_subscribers),
+                "scans_published": self.scans_published,
+                "bytes_published": self.bytes_published
+            }
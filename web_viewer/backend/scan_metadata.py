@@ -0,0 +1,283 @@
+"""
+Scan header/trailer capture into typed, fixed-layout records.
+
+Reading header values one key at a time costs an interop round trip (and an
+exception when the key is missing) per value per scan. ``MetadataCapture``
+instead snapshots each section once per scan: the header dictionary is
+enumerated in a single pass, and trailer-style information sources are read
+only for the keys the configured fields need. Key names are interned, so the
+strings repeated on every scan are shared instead of allocated again.
+
+The parsed values land in a NumPy record with one fixed dtype for the
+configured fields. Missing values are NaN for floats and -1 for integers. The
+record's JSON form is added to every scan payload as ``metadata``, next to
+the m/z and intensity arrays.
+
+Fields are chosen with ``SCAN_METADATA_FIELDS`` (comma separated names from
+``FIELDS``). Extra fields can be declared with ``SCAN_METADATA_EXTRA`` as
+``name=Section:Key:type`` entries separated by ``;``, e.g.
+``lock_mass=Trailer:LM Correction (ppm):float``. ``SCAN_METADATA_RAW=1``
+also keeps the raw key/value strings of every captured section.
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+import threading
+
+import numpy as np
+
+MISSING_INT = -1
+SECTIONS = ("Header", "Trailer")
+
+POLARITY_NAMES = {0: "Positive", 1: "Negative"}
+# Dissociation methods, by record code
+ACTIVATION_NAMES = {0: "CID", 1: "HCD", 2: "ETD", 3: "ECD", 4: "EThcD"}
+ACTIVATION_CODES = {name.lower(): code for code, name in ACTIVATION_NAMES.items()}
+
+
+def parse_float(value):
+    return float(value.strip().replace(",", ""))
+
+
+def parse_int(value):
+    return int(float(value.strip().replace(",", "")))
+
+
+def parse_ms_order(value):
+    """``"2"``, ``"Ms2"`` and ``"MSn 2"`` style values; plain ``"Ms"`` is MS1."""
+    digits = "".join(c for c in value if c.isdigit())
+    return int(digits) if digits else 1
+
+
+def parse_polarity(value):
+    """0 for positive, 1 for negative (the header's own encoding)."""
+    text = value.strip().lower()
+    if text in ("0", "positive", "pos", "+"):
+        return 0
+    if text in ("1", "negative", "neg", "-"):
+        return 1
+    raise ValueError(f"Unknown polarity: {value}")
+
+
+def parse_activation(value):
+    """Dissociation method code from a name (``"HCD"``) or a scan filter (``"... ms2 500.00@hcd30.00 ..."``)."""
+    text = value.strip().lower()
+    if text in ACTIVATION_CODES:
+        return ACTIVATION_CODES[text]
+    methods = re.findall(r"@([a-z]+)", text)
+    if "etd" in methods and "hcd" in methods:
+        return ACTIVATION_CODES["ethcd"]
+    for method in methods:
+        if method in ACTIVATION_CODES:
+            return ACTIVATION_CODES[method]
+    raise ValueError(f"Unknown activation: {value}")
+
+
+PARSERS = {
+    "float": ("f8", parse_float),
+    "float32": ("f4", parse_float),
+    "int": ("i8", parse_int),
+    "int8": ("i1", parse_int),
+    "ms_order": ("i1", parse_ms_order),
+    "polarity": ("i1", parse_polarity),
+    "activation": ("i1", parse_activation),
+}
+
+
+class MetadataField:
+    """One typed record column, read from the first source key that is present."""
+
+    def __init__(self, name, kind, sources):
+        if kind not in PARSERS:
+            raise ValueError(f"Unknown metadata field type: {kind}")
+        self.name = name
+        self.kind = kind
+        self.dtype, self.parse = PARSERS[kind]
+        self.sources = tuple((sys.intern(section), sys.intern(key)) for section, key in sources)
+
+    @property
+    def missing(self):
+        return np.nan if self.dtype.startswith("f") else MISSING_INT
+
+
+# Known fields and where the instrument reports them, in order of preference
+FIELDS = {field.name: field for field in (
+    MetadataField("scan_number", "int", [("Header", "Scan"), ("Header", "ScanNumber"),
+                                         ("Trailer", "Access Id:"), ("Trailer", "Access ID:")]),
+    MetadataField("ms_order", "ms_order", [("Header", "MSOrder")]),
+    MetadataField("polarity", "polarity", [("Header", "Polarity")]),
+    MetadataField("retention_time", "float", [("Header", "StartTime"), ("Header", "RetentionTime")]),
+    MetadataField("precursor_mz", "float", [("Header", "PrecursorMass[0]"), ("Trailer", "Monoisotopic M/Z:")]),
+    MetadataField("precursor_charge", "int8", [("Trailer", "Charge State:")]),
+    MetadataField("activation", "activation", [("Header", "Activation[0]"), ("Trailer", "Activation Type:"),
+                                               ("Header", "Filter"), ("Trailer", "Scan Description:")]),
+    MetadataField("injection_time", "float32", [("Trailer", "Ion Injection Time (ms):"), ("Header", "IonInjectionTime")]),
+    MetadataField("agc_target", "float", [("Trailer", "AGC Target:"), ("Header", "AGCTarget")]),
+    MetadataField("resolution", "float32", [("Trailer", "FT Resolution:"), ("Trailer", "Orbitrap Resolution:"),
+                                            ("Header", "Resolution")]),
+    MetadataField("first_mass", "float", [("Header", "FirstMass"), ("Header", "LowMass")]),
+    MetadataField("last_mass", "float", [("Header", "LastMass"), ("Header", "HighMass")]),
+)}
+
+DEFAULT_FIELDS = tuple(FIELDS)
+
+
+def parse_extra_fields(spec):
+    """``name=Section:Key:type;...`` -> list of MetadataField."""
+    fields = []
+    for entry in filter(None, (part.strip() for part in (spec or "").split(";"))):
+        name, _, source = entry.partition("=")
+        section, _, rest = source.partition(":")
+        key, _, kind = rest.rpartition(":")
+        if not name or section not in SECTIONS or not key:
+            raise ValueError(f"Invalid metadata field spec: {entry}")
+        fields.append(MetadataField(name.strip(), kind or "float", [(section, key)]))
+    return fields
+
+
+def snapshot_section(source, wanted=None):
+    """Copy a .NET string dictionary or information source into a dict in one pass.
+
+    ``IDictionary<string, string>`` (the header) is enumerated once.
+    ``IInformationSourceAccess`` (trailer, status log) is read only for the
+    ``wanted`` keys, or for all ``ItemNames`` when ``wanted`` is ``None``.
+    Plain dicts (mock scans) are copied.
+    """
+    if source is None:
+        return {}
+    intern = sys.intern
+    if isinstance(source, dict):
+        return {intern(key): value for key, value in source.items()}
+    if hasattr(source, "TryGetValue") and hasattr(source, "ItemNames"):
+        if hasattr(source, "Available") and not source.Available:
+            return {}
+        keys = source.ItemNames if wanted is None else wanted
+        values = {}
+        for key in keys:
+            found, value = source.TryGetValue(key, None)
+            if found:
+                values[intern(str(key))] = value
+        return values
+    return {intern(str(pair.Key)): pair.Value for pair in source}
+
+
+class MetadataCapture:
+    """Captures the configured header/trailer fields of each scan into a typed record."""
+
+    def __init__(self, fields=DEFAULT_FIELDS, extra_fields=(), raw=False):
+        self.lock = threading.Lock()
+        self.extra_fields = list(extra_fields)
+        self.raw = raw
+        self.scans = 0
+        self.captures = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self._set_fields(fields)
+
+    @classmethod
+    def from_env(cls):
+        fields = os.environ.get("SCAN_METADATA_FIELDS")
+        return cls(
+            fields=[name.strip() for name in fields.split(",") if name.strip()] if fields else DEFAULT_FIELDS,
+            extra_fields=parse_extra_fields(os.environ.get("SCAN_METADATA_EXTRA")),
+            raw=os.environ.get("SCAN_METADATA_RAW", "off").lower() in ("1", "on", "true", "yes")
+        )
+
+    def _set_fields(self, names):
+        unknown = [name for name in names if name not in FIELDS]
+        if unknown:
+            raise ValueError(f"Unknown metadata fields: {', '.join(unknown)}")
+        fields = [FIELDS[name] for name in names] + self.extra_fields
+        dtype = np.dtype([(field.name, field.dtype) for field in fields])
+        empty = np.array(tuple(field.missing for field in fields), dtype=dtype)
+        # Trailer-style sources are only read for these keys
+        wanted = {section: sorted({key for field in fields for s, key in field.sources if s == section})
+                  for section in SECTIONS}
+        # Swapped in one assignment so a scan in flight never sees a mixed layout
+        self.layout = (fields, empty, wanted)
+
+    @property
+    def fields(self):
+        return self.layout[0]
+
+    @property
+    def dtype(self):
+        return self.layout[1].dtype
+
+    def configure(self, fields=None, raw=None):
+        with self.lock:
+            if fields is not None:
+                self._set_fields(list(fields))
+            if raw is not None:
+                self.raw = bool(raw)
+
+    def capture(self, scan):
+        """Snapshot the scan's header and trailer; returns ``(record, raw_sections)``."""
+        t0 = time.perf_counter()
+        fields, empty, wanted = self.layout
+        raw = self.raw
+        sections = {}
+        for section in SECTIONS:
+            try:
+                sections[section] = snapshot_section(getattr(scan, section, None),
+                                                     None if raw else wanted[section])
+            except Exception as e:
+                logging.warning(f"Could not read scan {section}: {e}")
+                sections[section] = {}
+        record = self._parse(sections, fields, empty)
+        self.captures += 1
+        self.total_seconds += time.perf_counter() - t0
+        return record, sections if raw else None
+
+    def parse(self, sections):
+        """Build the typed record from ``{"Header": {...}, "Trailer": {...}}`` string dicts."""
+        fields, empty, _ = self.layout
+        return self._parse(sections, fields, empty)
+
+    def _parse(self, sections, fields, empty):
+        record = empty.copy()
+        for field in fields:
+            for section, key in field.sources:
+                value = sections.get(section, {}).get(key)
+                if value is None:
+                    continue
+                try:
+                    record[field.name] = field.parse(str(value))
+                    break
+                except (ValueError, OverflowError):
+                    self.errors += 1
+        self.scans += 1
+        return record
+
+    def to_dict(self, record):
+        """JSON form of a record; missing values become ``None``."""
+        values = {}
+        for name in record.dtype.names:
+            value = record[name].item()
+            if record.dtype[name].kind == "f":
+                values[name] = None if value != value else value
+            else:
+                values[name] = None if value == MISSING_INT else value
+        return values
+
+    def get_stats(self):
+        return {
+            "fields": [field.name for field in self.fields],
+            "record_bytes": self.dtype.itemsize,
+            "raw": self.raw,
+            "scans": self.scans,
+            "parse_errors": self.errors,
+            "mean_capture_us": round(self.total_seconds / self.captures * 1e6, 1) if self.captures else None
+        }
+
+
+def polarity_name(code):
+    return POLARITY_NAMES.get(code, "Unknown")
+
+
+def activation_name(code):
+    """``"HCD"`` etc., or ``None`` when the scan did not report its activation."""
+    return ACTIVATION_NAMES.get(code)
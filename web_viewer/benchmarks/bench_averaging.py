@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark spectrum averaging on dense synthetic scans.
+
+Pools the centroids of many mock scans, averages them with
+``average_spectra`` and checks that no cluster is wider than the ppm
+tolerance and that the average fits the time budget (800 ms for 300 scans
+of 20k centroids by default). Run from the web_viewer directory:
+
+    python benchmarks/bench_averaging.py --scans 300 --centroids 20000 --ppm 5
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+
+from mock_instrument import MockInstrumentConfig, MockSpectrumGenerator
+from spectrum_processing import average_spectra, cluster_starts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scans', type=int, default=300, help='scans to average')
+    parser.add_argument('--centroids', type=int, default=20000, help='centroids per synthetic scan')
+    parser.add_argument('--ppm', type=float, default=5.0, help='cluster tolerance in ppm')
+    parser.add_argument('--budget-ms', type=float, default=800.0, help='maximum time for the average')
+    args = parser.parse_args()
+
+    config = MockInstrumentConfig(centroid_count_mean=args.centroids, centroid_count_sigma=0.0, seed=1)
+    spectra = [(s['masses'], s['intensities']) for s in MockSpectrumGenerator(config).generate_batch(args.scans)]
+    peaks = sum(m.size for m, _ in spectra)
+
+    print("=== Averaging Benchmark ===")
+    print(f"Scans: {args.scans}, pooled peaks: {peaks:,}, tolerance: {args.ppm} ppm")
+
+    start = time.perf_counter()
+    mz, _, counts = average_spectra(spectra, ppm_tolerance=args.ppm)
+    elapsed = time.perf_counter() - start
+
+    # Cluster widths, recomputed from the same pooled and sorted peaks
+    pooled = np.sort(np.concatenate([m for m, _ in spectra]))
+    starts = cluster_starts(pooled, args.ppm)
+    ends = np.r_[starts[1:], pooled.size] - 1
+    width_ppm = (pooled[ends] - pooled[starts]) / pooled[starts] * 1e6
+    narrow = bool(width_ppm.max() <= args.ppm * (1 + 1e-9))
+    fast = elapsed * 1000.0 <= args.budget_ms
+    status = 'OK' if narrow and fast else 'TOO WIDE' if not narrow else 'TOO SLOW'
+
+    print(f"  {elapsed * 1000.0:8.1f} ms  {mz.size:,} clusters  largest {counts.max():,} peaks  "
+          f"widest {width_ppm.max():.2f} ppm  [{status}]")
+    return 0 if narrow and fast else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Benchmark the server-side centroiding stage on synthetic profile scans.
+
+Checks that a single core keeps up with the target profile scan rate
+(20 Hz by default). Run from the web_viewer directory:
+
+    python benchmarks/bench_centroiding.py --centroids 5000 --points-per-peak 15
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'shared'))
+
+from mock_instrument import MockInstrumentConfig, MockSpectrumGenerator
+from profile_stream import synthesize_profile
+from spectrum_processing import CENTROID_METHODS, centroid_profile
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--centroids', type=int, default=5000, help='centroids per synthetic scan')
+    parser.add_argument('--points-per-peak', type=int, default=15, help='profile points per centroid')
+    parser.add_argument('--scans', type=int, default=50, help='scans per method')
+    parser.add_argument('--target-hz', type=float, default=20.0, help='required profile scan rate')
+    args = parser.parse_args()
+
+    config = MockInstrumentConfig(centroid_count_mean=args.centroids, centroid_count_sigma=0.0, seed=1)
+    spectra = MockSpectrumGenerator(config).generate_batch(args.scans)
+    profiles = [synthesize_profile(s['masses'], s['intensities'], points_per_peak=args.points_per_peak)
+                for s in spectra]
+    points = sum(mz.size for mz, _ in profiles) / len(profiles)
+
+    print("=== Centroiding Benchmark ===")
+    print(f"Scans: {args.scans}, mean profile points per scan: {points:,.0f}")
+
+    all_ok = True
+    for method in CENTROID_METHODS:
+        start = time.perf_counter()
+        peaks = 0
+        for mz, intensity in profiles:
+            centroid_mz, _ = centroid_profile(mz, intensity, snr_threshold=3.0, method=method)
+            peaks += centroid_mz.size
+        elapsed = time.perf_counter() - start
+        per_scan_ms = elapsed / len(profiles) * 1000.0
+        max_hz = 1000.0 / per_scan_ms
+        ok = max_hz >= args.target_hz
+        all_ok &= ok
+        print(f"  {method:<9} {per_scan_ms:8.2f} ms/scan  {max_hz:8.1f} Hz max  "
+              f"{peaks / len(profiles):8.0f} peaks/scan  [{'OK' if ok else 'TOO SLOW'}]")
+
+    return 0 if all_ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
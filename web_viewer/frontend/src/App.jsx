@@ -23,6 +23,35 @@ import { io } from 'socket.io-client'
 // import EventSource from 'eventsource' // Not needed as EventSource is built into browsers
 import KapelczakLogo from './KapelczakLogo'
 
+// Scan summary (point count, m/z range, top peaks) as sent by the server.
+// Older servers do not send one, so fall back to a single linear pass over
+// the arrays - never a full sort or Math.min(...array), which overflows the
+// call stack on large scans.
+const getScanSummary = (scanData, topN = 5) => {
+  if (!scanData) return null
+  if (scanData.summary) return scanData.summary
+  const masses = scanData.masses || []
+  const intensities = scanData.intensities || []
+  const top = []
+  let mzMin = Infinity
+  let mzMax = -Infinity
+  for (let i = 0; i < masses.length; i++) {
+    if (masses[i] < mzMin) mzMin = masses[i]
+    if (masses[i] > mzMax) mzMax = masses[i]
+    if (top.length < topN || intensities[i] > top[top.length - 1].intensity) {
+      top.push({ mass: masses[i], intensity: intensities[i] })
+      top.sort((a, b) => b.intensity - a.intensity)
+      if (top.length > topN) top.pop()
+    }
+  }
+  return {
+    point_count: masses.length,
+    mz_min: masses.length ? mzMin : null,
+    mz_max: masses.length ? mzMax : null,
+    top_peaks: { mz: top.map(p => p.mass), intensity: top.map(p => p.intensity) }
+  }
+}
+
 function App() {
   const [scanData, setScanData] = useState(null)
   const [plotData, setPlotData] = useState({
@@ -38,6 +67,8 @@ function App() {
   const [error, setError] = useState(null)
   const ws = useRef(null)
   const lastUpdateTime = useRef(0)
+  // ID of the last scan received, sent on reconnect so missed scans are replayed
+  const lastEventId = useRef(null)
   const UPDATE_THROTTLE = 500 // Update plot every 500ms max
 
   // Choose one approach: either direct connection to backend or remote service
@@ -105,7 +136,9 @@ function App() {
 
     // Choose one approach: either Socket.IO or EventSource
     // Socket.IO approach (direct connection to backend):
-    ws.current = io(API_BASE_URL)
+    ws.current = io(API_BASE_URL, {
+      auth: (cb) => cb(lastEventId.current === null ? {} : { last_event_id: lastEventId.current })
+    })
 
     ws.current.on('connect', () => {
       console.log('Connected to server')
@@ -117,7 +150,17 @@ function App() {
       setError('Disconnected from server')
     })
 
+    // Instrument status pushed by the backend whenever it changes
+    ws.current.on('status', (instrumentStatus) => {
+      setStatus((previous) => ({ ...previous, ...instrumentStatus }))
+    })
+
     ws.current.on('scan_data', (data) => {
+      // Replayed scans can overlap the live stream after a reconnect
+      if (data.event_id !== undefined) {
+        if (lastEventId.current !== null && data.event_id <= lastEventId.current) return
+        lastEventId.current = data.event_id
+      }
       const currentTime = Date.now()
       if (currentTime - lastUpdateTime.current >= UPDATE_THROTTLE) {
         setScanData(data)
@@ -184,17 +227,12 @@ function App() {
         customdata: []
       }
 
-      // Find the top 5 most abundant peaks
-      const peakData = scanData.masses.map((mass, index) => ({
+      // Top 5 most abundant peaks, precomputed by the server
+      const topPeaks = getScanSummary(scanData).top_peaks
+      const top5Peaks = topPeaks.mz.slice(0, 5).map((mass, index) => ({
         mass: mass,
-        intensity: scanData.intensities[index],
-        index: index
+        intensity: topPeaks.intensity[index]
       }))
-      
-      // Sort by intensity (descending) and take top 5
-      const top5Peaks = peakData
-        .sort((a, b) => b.intensity - a.intensity)
-        .slice(0, 5)
 
       // For each mass/intensity pair, create a vertical line
       for (let i = 0; i < scanData.masses.length; i++) {
@@ -214,6 +252,8 @@ function App() {
     }
   }, [scanData])
 
+  const scanSummary = getScanSummary(scanData)
+
   const getStatusColor = () => {
     if (!status.instrument_connected) return 'error'
     if (!status.online_access) return 'warning'
@@ -427,7 +467,7 @@ function App() {
           <Grid item xs={12} sm={6} md={3}>
             <Paper sx={{ p: 2, textAlign: 'center' }}>
               <Typography variant="h4" color="primary">
-                {scanData?.masses?.length || 0}
+                {scanSummary?.point_count || 0}
               </Typography>
               <Typography variant="body2" color="text.secondary">
                 Data Points
@@ -437,7 +477,7 @@ function App() {
           <Grid item xs={12} sm={6} md={3}>
             <Paper sx={{ p: 2, textAlign: 'center' }}>
               <Typography variant="h4" color="primary">
-                {scanData?.masses ? Math.min(...scanData.masses).toFixed(2) : 'N/A'}
+                {scanSummary?.mz_min != null ? scanSummary.mz_min.toFixed(2) : 'N/A'}
               </Typography>
               <Typography variant="body2" color="text.secondary">
                 Min m/z
@@ -447,7 +487,7 @@ function App() {
           <Grid item xs={12} sm={6} md={3}>
             <Paper sx={{ p: 2, textAlign: 'center' }}>
               <Typography variant="h4" color="primary">
-                {scanData?.masses ? Math.max(...scanData.masses).toFixed(2) : 'N/A'}
+                {scanSummary?.mz_max != null ? scanSummary.mz_max.toFixed(2) : 'N/A'}
               </Typography>
               <Typography variant="body2" color="text.secondary">
                 Max m/z